@@ -1,13 +1,16 @@
 -- Drop tables in dependency order for safe resets
 DROP TABLE IF EXISTS weekly_stats;
+DROP TABLE IF EXISTS weekly_stats_summary;
 DROP TABLE IF EXISTS depth_chart;
 DROP TABLE IF EXISTS injuries;
 DROP TABLE IF EXISTS players;
-DROP TABLE IF EXISTS teams;
+DROP TABLE IF EXISTS player_identity;
 DROP TABLE IF EXISTS games;
+DROP TABLE IF EXISTS teams;
 DROP TABLE IF EXISTS weather;
 DROP TABLE IF EXISTS player_weekly_features;
 DROP TABLE IF EXISTS offensive_line_rankings;
+DROP TABLE IF EXISTS defensive_unit_rankings;
 
 -- ---------------------------
 -- Teams Table
@@ -28,6 +31,22 @@ CREATE TABLE players (
     team_id INT REFERENCES teams(team_id)
 );
 
+-- ---------------------------
+-- Player Identity Table
+-- ---------------------------
+-- One row per canonical player_id with the ids and name keys it is known by
+CREATE TABLE player_identity (
+    player_id INT PRIMARY KEY,
+    gsis_id VARCHAR,
+    sleeper_id VARCHAR,
+    name VARCHAR,
+    name_key VARCHAR,
+    birthdate VARCHAR,
+    position VARCHAR
+);
+CREATE INDEX player_identity_gsis_idx ON player_identity (gsis_id);
+CREATE INDEX player_identity_sleeper_idx ON player_identity (sleeper_id);
+
 -- ---------------------------
 -- Depth Chart Table
 -- ---------------------------
@@ -52,9 +71,11 @@ CREATE TABLE injuries (
 -- ---------------------------
 -- Games Table
 -- ---------------------------
+-- weekly_stats, games and weather are list-partitioned by season; the loaders
+-- create one partition per season (games_2024, ...) as rows for it arrive
 CREATE TABLE games (
-    game_id SERIAL PRIMARY KEY,
-    season INT,
+    game_id INT NOT NULL,
+    season INT NOT NULL,
     week INT,
     home_team VARCHAR(50),
     away_team VARCHAR(50),
@@ -62,18 +83,22 @@ CREATE TABLE games (
     game_date DATE,
     home_team_id INT REFERENCES teams(team_id),
     away_team_id INT REFERENCES teams(team_id),
-);
+    PRIMARY KEY (season, game_id)
+) PARTITION BY LIST (season);
 
 
 -- ---------------------------
 -- Weekly Stats Table (for fantasy points, targets, carries, snaps)
 -- ---------------------------
 CREATE TABLE IF NOT EXISTS weekly_stats (
-    weekly_stats_id SERIAL PRIMARY KEY,
-    player_name VARCHAR NOT NULL,
+    player_id INT NOT NULL,
+    season INT NOT NULL,
+    week INT NOT NULL,
+    player_name VARCHAR,
     player_display_name VARCHAR,
     position VARCHAR(10),
-    team_abbreviation VARCHAR(10) NOT NULL,
+    team_abbreviation VARCHAR(10),
+    team_id INT REFERENCES teams(team_id),
     opponent_team VARCHAR(10),
     attempts INT,
     completions INT,
@@ -87,22 +112,38 @@ CREATE TABLE IF NOT EXISTS weekly_stats (
     receiving_yards FLOAT,
     receiving_tds INT,
     target_share FLOAT,
-    fantasy_points FLOAT
-);
+    fantasy_points FLOAT,
+    PRIMARY KEY (player_id, season, week)
+) PARTITION BY LIST (season);
+
+-- ---------------------------
+-- Weekly Stats Summary Table
+-- ---------------------------
+-- nflfastr yardage, touchdowns and PPR points; weekly_stats keeps the standard points
+CREATE TABLE weekly_stats_summary (
+    player_id INT NOT NULL,
+    season INT NOT NULL,
+    week INT NOT NULL,
+    passing_yards FLOAT,
+    rushing_yards FLOAT,
+    receiving_yards FLOAT,
+    touchdowns FLOAT,
+    fantasy_points_ppr FLOAT,
+    PRIMARY KEY (player_id, season, week)
+) PARTITION BY LIST (season);
 
 -- ---------------------------
 -- Weather Table
 -- ---------------------------
 CREATE TABLE IF NOT EXISTS weather (
-    weather_id SERIAL PRIMARY KEY,
-    season INT,
+    season INT NOT NULL,
     week INT,
     stadium VARCHAR,
     temperature FLOAT,
     precipitation FLOAT,
     wind_speed FLOAT,
     dome BOOLEAN
-);
+) PARTITION BY LIST (season);
 
 -- ---------------------------
 -- Offensive Line Rankings Table
@@ -0,0 +1,30 @@
+-- Per-position feature tables as materialized views over features.
+-- The unique (season, week, player_id) indexes serve week-filtered queries and are required
+-- for REFRESH MATERIALIZED VIEW CONCURRENTLY. SELECT * is expanded when a view is created, so
+-- a later migration that adds feature columns has to recreate the views. On a fresh database
+-- features does not exist until the first feature build, so nothing is created here and
+-- refresh_views creates the views once it does.
+
+DO $$
+BEGIN
+    IF to_regclass('features') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE INDEX IF NOT EXISTS features_season_week_player_idx ON features (season, week, player_id);
+
+    DROP TABLE IF EXISTS qb_features, rb_features, wr_features, te_features;
+
+    CREATE MATERIALIZED VIEW qb_features AS SELECT * FROM features WHERE position = 'QB';
+    CREATE UNIQUE INDEX qb_features_season_week_player_idx ON qb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW rb_features AS SELECT * FROM features WHERE position = 'RB';
+    CREATE UNIQUE INDEX rb_features_season_week_player_idx ON rb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW wr_features AS SELECT * FROM features WHERE position = 'WR';
+    CREATE UNIQUE INDEX wr_features_season_week_player_idx ON wr_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW te_features AS SELECT * FROM features WHERE position = 'TE';
+    CREATE UNIQUE INDEX te_features_season_week_player_idx ON te_features (season, week, player_id);
+END
+$$;
@@ -0,0 +1,78 @@
+-- Converts the season-keyed tables of an existing database into tables list-partitioned by season,
+-- one partition per season (weekly_stats_2024, ...). Tables that are missing or already partitioned
+-- are left alone. The position views depend on features, so they are recreated afterwards.
+
+CREATE FUNCTION pg_temp.partition_by_season(tbl text, pk text) RETURNS void AS $$
+DECLARE
+    old_tbl text := tbl || '_unpartitioned';
+    col record;
+    s int;
+BEGIN
+    IF to_regclass(tbl) IS NULL
+       OR EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(tbl)) THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, old_tbl);
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY LIST (season)',
+                   tbl, old_tbl);
+    -- Serial sequences move to the new table, so dropping the old one keeps them
+    FOR col IN SELECT attname, pg_get_serial_sequence(old_tbl, attname) AS seq FROM pg_attribute
+               WHERE attrelid = to_regclass(old_tbl) AND attnum > 0 AND NOT attisdropped LOOP
+        IF col.seq IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.%I', col.seq, tbl, col.attname);
+        END IF;
+    END LOOP;
+    FOR s IN EXECUTE format('SELECT DISTINCT season FROM %I WHERE season IS NOT NULL', old_tbl) LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (%s)', tbl || '_' || s, tbl, s);
+    END LOOP;
+    -- Fails on rows without a season rather than dropping them. Tables loaded before upserts can
+    -- repeat a primary key, so only one row per key is kept
+    IF pk IS NULL THEN
+        EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, old_tbl);
+    ELSE
+        EXECUTE format('INSERT INTO %I SELECT DISTINCT ON (%s) * FROM %I', tbl, pk, old_tbl);
+    END IF;
+    EXECUTE format('DROP TABLE %I CASCADE', old_tbl);
+    IF pk IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%s)', tbl, pk);
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT pg_temp.partition_by_season('weekly_stats', 'player_id, season, week');
+SELECT pg_temp.partition_by_season('games', 'season, game_id');
+SELECT pg_temp.partition_by_season('weather', NULL);
+SELECT pg_temp.partition_by_season('player_weekly_features', NULL);
+SELECT pg_temp.partition_by_season('features', NULL);
+
+DO $$
+BEGIN
+    IF to_regclass('weekly_stats') IS NOT NULL AND to_regclass('teams') IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass('weekly_stats') AND contype = 'f') THEN
+        ALTER TABLE weekly_stats ADD FOREIGN KEY (team_id) REFERENCES teams(team_id);
+    END IF;
+END
+$$;
+
+DO $$
+BEGIN
+    IF to_regclass('features') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE INDEX IF NOT EXISTS features_season_week_player_idx ON features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS qb_features AS SELECT * FROM features WHERE position = 'QB';
+    CREATE UNIQUE INDEX IF NOT EXISTS qb_features_season_week_player_idx ON qb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS rb_features AS SELECT * FROM features WHERE position = 'RB';
+    CREATE UNIQUE INDEX IF NOT EXISTS rb_features_season_week_player_idx ON rb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS wr_features AS SELECT * FROM features WHERE position = 'WR';
+    CREATE UNIQUE INDEX IF NOT EXISTS wr_features_season_week_player_idx ON wr_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS te_features AS SELECT * FROM features WHERE position = 'TE';
+    CREATE UNIQUE INDEX IF NOT EXISTS te_features_season_week_player_idx ON te_features (season, week, player_id);
+END
+$$;
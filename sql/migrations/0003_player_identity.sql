@@ -0,0 +1,15 @@
+-- Persistent player identity index: one canonical player_id per player with the GSIS id, Sleeper id
+-- and normalized name/birthdate it is known by. Ingestion creates the table on first use as well;
+-- players loaded before it existed keep their old row-number ids until the database is reset.
+
+CREATE TABLE IF NOT EXISTS player_identity (
+    player_id INT PRIMARY KEY,
+    gsis_id VARCHAR,
+    sleeper_id VARCHAR,
+    name VARCHAR,
+    name_key VARCHAR,
+    birthdate VARCHAR,
+    position VARCHAR
+);
+CREATE INDEX IF NOT EXISTS player_identity_gsis_idx ON player_identity (gsis_id);
+CREATE INDEX IF NOT EXISTS player_identity_sleeper_idx ON player_identity (sleeper_id);
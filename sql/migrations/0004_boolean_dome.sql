@@ -0,0 +1,40 @@
+-- dome used to be written as TEXT ('True'/'False') by the COPY loader, so an astype(bool) on the
+-- features read 'False' as true. Converts it back to BOOLEAN where it is text; the position views
+-- depend on the column's type, so they are recreated around the change.
+
+DO $$
+DECLARE
+    tbl text;
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'features' AND column_name = 'dome' AND data_type = 'text') THEN
+        DROP MATERIALIZED VIEW IF EXISTS qb_features, rb_features, wr_features, te_features;
+    END IF;
+    FOREACH tbl IN ARRAY ARRAY['player_weekly_features', 'features'] LOOP
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = tbl AND column_name = 'dome' AND data_type = 'text') THEN
+            EXECUTE format('ALTER TABLE %I ALTER COLUMN dome TYPE BOOLEAN USING dome::boolean', tbl);
+        END IF;
+    END LOOP;
+END
+$$;
+
+DO $$
+BEGIN
+    IF to_regclass('features') IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS qb_features AS SELECT * FROM features WHERE position = 'QB';
+    CREATE UNIQUE INDEX IF NOT EXISTS qb_features_season_week_player_idx ON qb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS rb_features AS SELECT * FROM features WHERE position = 'RB';
+    CREATE UNIQUE INDEX IF NOT EXISTS rb_features_season_week_player_idx ON rb_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS wr_features AS SELECT * FROM features WHERE position = 'WR';
+    CREATE UNIQUE INDEX IF NOT EXISTS wr_features_season_week_player_idx ON wr_features (season, week, player_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS te_features AS SELECT * FROM features WHERE position = 'TE';
+    CREATE UNIQUE INDEX IF NOT EXISTS te_features_season_week_player_idx ON te_features (season, week, player_id);
+END
+$$;
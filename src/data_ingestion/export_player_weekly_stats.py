@@ -1,64 +1,76 @@
 import os
-import pandas as pd
 import logging
-from sqlalchemy import text
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from src.data_ingestion.nflfastr_files import mark_ingested, parquet_path, seasons_to_ingest
+from src.data_ingestion.player_identity import resolve_player_ids
+from src.features.base_features import WEEKLY_STATS_COLUMNS
 
-def fetch_and_store_weekly_stats(engine, start_year: int, end_year: int, parquet_folder):
-    all_dfs = []
-    seasons = list(range(start_year, end_year + 1))
+WEEKLY_STATS_COLUMN_TYPES = {'player_id': 'INTEGER', 'team_id': 'INTEGER', 'season': 'INTEGER', 'week': 'INTEGER'}
 
-    for season in seasons:
-        try:
-            file_path = os.path.join(parquet_folder, f"player_stats_{season}.parquet")
-            if not os.path.exists(file_path):
-                logging.warning(f"Parquet file for season {season} not found: {file_path}")
-                continue
+# nflfastr column for each weekly_stats column that is renamed on export
+SOURCE_COLUMNS = {'team_abbreviation': 'recent_team'}
 
-            logging.info(f"Loading stats for season {season}")
-            df = pd.read_parquet(file_path)
 
-            df = df.rename(columns={
-                'season': 'season',
-                'week': 'week',
-                'player_id': 'player_id',
-                'recent_team': 'team_abbreviation',
-                'targets': 'targets',
-                'carries': 'carries',
-                'offense_snaps': 'snaps'
-            })
+def scan_weekly_stats(files, seasons):
+    """
+    One dataset scan over the season files, reading only the weekly_stats columns the features use
+    and only row groups of the requested seasons.
+    """
+    dataset = ds.dataset(files, format='parquet')
+    columns = {col: ds.field(SOURCE_COLUMNS.get(col, col)) for col in WEEKLY_STATS_COLUMNS}
+    return dataset.to_table(columns=columns, filter=ds.field('season').isin(seasons))
 
-            all_dfs.append(df)
-        except Exception as e:
-            logging.warning(f"Failed to process season {season}: {e}")
-            continue
 
-    if not all_dfs:
-        logging.error("No data loaded from any season.")
-        return
+def map_team_ids(abbreviations, teams_df):
+    """
+    team_id for each abbreviation (null when unknown), by a dictionary lookup against teams.
+    """
+    positions = pc.index_in(abbreviations, value_set=pa.array(teams_df['abbreviation'].astype(str).tolist()))
+    return pc.take(pa.array(teams_df['team_id'].astype('int64').tolist()), positions)
 
-    weekly_stats_df = pd.concat(all_dfs, ignore_index=True).reset_index(drop=True)
 
-    # Merge team_id from teams table
-    teams_df = pd.read_sql('SELECT team_id, abbreviation FROM teams', engine)
-    weekly_stats_df = weekly_stats_df.merge(teams_df, how='left', left_on='team_abbreviation', right_on='abbreviation')
+def map_player_ids(storage, table):
+    """
+    Canonical player_id for each row (null without a GSIS id), resolving every distinct GSIS id
+    once through the identity index.
+    """
+    players = table.select(['player_id', 'player_display_name', 'position']).to_pandas()
+    players = players.dropna(subset=['player_id']).drop_duplicates('player_id')
+    players = players.rename(columns={'player_id': 'gsis_id', 'player_display_name': 'name'})
+    ids = resolve_player_ids(storage, players, create=True, source='weekly_stats players')
+    positions = pc.index_in(table['player_id'], value_set=pa.array(players['gsis_id'].tolist(), pa.string()))
+    return pc.take(pa.array(ids, pa.int64()), positions)
+
+
+def fetch_and_store_weekly_stats(storage, start_year: int, end_year: int, parquet_folder, force=False):
+    # Seasons whose parquet checksum was already ingested into this storage are skipped
+    consumer = f"weekly_stats@{storage.name}"
+    seasons = seasons_to_ingest(consumer, list(range(start_year, end_year + 1)), parquet_folder, force=force)
+    for season in seasons:
+        if not os.path.exists(parquet_path(season, parquet_folder)):
+            logging.warning(f"Parquet file for season {season} not found: {parquet_path(season, parquet_folder)}")
+    seasons = [season for season in seasons if os.path.exists(parquet_path(season, parquet_folder))]
+    files = [parquet_path(season, parquet_folder) for season in seasons]
+    if not files:
+        logging.info("No new or changed seasons to export into weekly_stats.")
+        return
 
-    # Clean player_id
-    weekly_stats_df['player_id'] = (
-        weekly_stats_df['player_id']
-        .astype(str)
-        .str.replace(r'[^0-9]', '', regex=True)
-        .replace('', pd.NA)
-    )
-    weekly_stats_df = weekly_stats_df.dropna(subset=['player_id', 'team_id'])
-    weekly_stats_df['player_id'] = weekly_stats_df['player_id'].astype(int)
-    weekly_stats_df['team_id'] = weekly_stats_df['team_id'].astype(int)
+    logging.info(f"Loading stats for seasons {seasons}")
+    table = scan_weekly_stats(files, seasons)
 
-    # Final columns
-    weekly_stats_df = weekly_stats_df.drop_duplicates().reset_index(drop = True)
+    # Canonical player ids from the identity index (the numeric GSIS part for players first seen here)
+    table = table.set_column(table.schema.get_field_index('player_id'), 'player_id', map_player_ids(storage, table))
 
-    # Ingest into PostgreSQL
-    weekly_stats_df.to_sql('weekly_stats', engine, if_exists='replace', index=False)
-    logging.info("weekly_stats table ingested into PostgreSQL.")
+    # Merge team_id from teams table
+    teams_df = storage.read_sql('SELECT team_id, abbreviation FROM teams')
+    table = table.append_column('team_id', map_team_ids(table['team_abbreviation'], teams_df))
+    table = table.filter(pc.and_(pc.is_valid(table['player_id']), pc.is_valid(table['team_id'])))
 
-    
+    weekly_stats_df = table.to_pandas().drop_duplicates().reset_index(drop = True)
 
+    # Merge into PostgreSQL, touching only new or changed player-weeks
+    storage.upsert(weekly_stats_df, 'weekly_stats', keys=['player_id', 'season', 'week'], dtype=WEEKLY_STATS_COLUMN_TYPES, partition_by='season')
+    mark_ingested(consumer, seasons, parquet_folder)
+    logging.info("weekly_stats table ingested into PostgreSQL.")
@@ -1,11 +1,10 @@
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
-from sqlalchemy import text
+from src.data_ingestion.http_cache import cached_get
 
-def fetch_defensive_unit_rankings_sharp(engine, season):
+def fetch_defensive_unit_rankings_sharp(storage, season):
     url = "https://www.sharpfootballanalysis.com/analysis/best-nfl-front-seven-rankings/"
-    resp = requests.get(url)
+    resp = cached_get(url, source='sharp')
     resp.raise_for_status()
     soup = BeautifulSoup(resp.text, "html.parser")
     table = soup.find("table")
@@ -14,8 +13,8 @@ def fetch_defensive_unit_rankings_sharp(engine, season):
     df['season'] = int(season)
     df['secondary_score'] = None  # if no secondary ranking available
     df['source'] = 'SharpFootball'
-    teams_df = pd.read_sql('SELECT team_id, abbreviation FROM teams', engine)
+    teams_df = storage.read_sql('SELECT team_id, abbreviation FROM teams')
     merged = df.merge(teams_df, how='left', on='abbreviation').dropna(subset=['team_id'])
     final = merged[['season', 'team_id', 'front_seven_score', 'secondary_score', 'source']]
-    final.to_sql('defensive_unit_rankings', engine, if_exists='replace', index=False)
+    storage.bulk_load(final, 'defensive_unit_rankings', if_exists='replace', dtype={'team_id': 'INTEGER', 'secondary_score': 'DOUBLE PRECISION'})
     print(f"✅ Ingested defensive unit rankings for season {season}.")
@@ -1,54 +1,45 @@
-import os
-import subprocess
 import duckdb
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
+from src.data_ingestion.nflfastr_files import (
+    NFLFASTR_DIR, download_seasons, mark_ingested, parquet_path, seasons_to_ingest
+)
+from src.data_ingestion.player_identity import resolve_player_ids
 
-def fetch_nflfastr(start_year: int, end_year: int, engine):
-    # --- Settings ---
-    seasons = list(range(start_year, end_year + 1))
-    base_url = 'https://github.com/nflverse/nflverse-data/releases/download/player_stats/player_stats_{year}.parquet'
-    local_dir = "data/raw/nflfastr"
-    os.makedirs(local_dir, exist_ok=True)
-
-
-    # --- Download with curl to ensure redirects handled ---
-    def download_file_curl(url, output_path):
-        if os.path.exists(output_path):
-            print(f"Already exists: {output_path}")
-            return
-        print(f"Downloading: {url}")
-        subprocess.run(['curl', '-L', url, '-o', output_path], check=True)
-        print(f"Saved: {output_path}")
+# PPR totals go to their own table: weekly_stats holds the standard fantasy_points the models train on
+SUMMARY_TABLE = 'weekly_stats_summary'
+SUMMARY_COLUMN_TYPES = {'player_id': 'INTEGER', 'season': 'INTEGER', 'week': 'INTEGER'}
 
-
-    # --- Download files for each season ---
-    files = []
-    for season in seasons:
-        url = base_url.format(year=season)
-        local_path = os.path.join(local_dir, f"player_stats_{season}.parquet")
-        download_file_curl(url, local_path)
-        files.append(local_path)
+def fetch_nflfastr(start_year: int, end_year: int, storage, force=False, download=True):
+    # --- Download (concurrent, resumable, validated) and keep only seasons whose file changed ---
+    seasons = list(range(start_year, end_year + 1))
+    if download:
+        download_seasons(seasons, NFLFASTR_DIR)
+    consumer = f"{SUMMARY_TABLE}@{storage.name}"
+    # Seasons marked ingested before the summary table existed went to weekly_stats; load them again
+    force = force or not storage.has_table(SUMMARY_TABLE)
+    changed = seasons_to_ingest(consumer, seasons, NFLFASTR_DIR, force=force)
+    if not changed:
+        print("No new or changed nflfastr seasons to ingest.")
+        return
+    files = [parquet_path(season, NFLFASTR_DIR) for season in changed]
 
 
     # --- Ingest with DuckDB ---
     dfs = []
     for file in files:
-        if os.path.getsize(file) < 1000:
-            print(f"File {file} is too small to be valid. Aborting.")
-            continue
         print(f"Processing {file} ...")
         query = f"""
             SELECT 
                 season, 
                 week, 
-                player_name AS name, 
+                player_id AS gsis_id, 
+                player_display_name AS name, 
+                position, 
                 passing_yards, 
                 rushing_yards, 
                 receiving_yards, 
                 passing_tds + rushing_tds + receiving_tds AS touchdowns, 
-                fantasy_points_ppr AS fantasy_points 
+                fantasy_points_ppr 
             FROM read_parquet('{file}')
         """
         df = duckdb.query(query).to_df()
@@ -58,22 +49,22 @@ def fetch_nflfastr(start_year: int, end_year: int, engine):
     print(f"Combined records: {len(combined_df)}")
 
 
-    # --- Map player_id from players table ---
-    players_df = pd.read_sql('SELECT player_id, name FROM players', engine)
-    merged_df = combined_df.merge(players_df, how='left', on='name')
+    # --- Map player_id through the identity index, once per player; unknown players get an identity ---
+    players = combined_df[['gsis_id', 'name', 'position']].drop_duplicates(['gsis_id', 'name'])
+    players['player_id'] = resolve_player_ids(storage, players, create=True, source='nflfastr players')
+    merged_df = combined_df.merge(players[['gsis_id', 'name', 'player_id']], how='left', on=['gsis_id', 'name'])
 
-    # --- Report unmatched players ---
+    # --- Report rows that could not be keyed (no GSIS id and no name) ---
     unmatched = merged_df[merged_df['player_id'].isnull()]
     if not unmatched.empty:
-        print("Unmatched players (not in your `players` table):")
+        print(f"{len(unmatched)} rows without a player id were skipped:")
         print(unmatched['name'].dropna().unique())
-
-    # --- Filter out unmatched for DB insert ---
     final_df = merged_df[merged_df['player_id'].notnull()]
 
     # --- Prepare for Postgres insert ---
-    final_df = final_df[['player_id', 'season', 'week', 'passing_yards', 'rushing_yards', 'receiving_yards', 'touchdowns', 'fantasy_points']].drop_duplicates().reset_index(drop = True)
+    final_df = final_df[['player_id', 'season', 'week', 'passing_yards', 'rushing_yards', 'receiving_yards', 'touchdowns', 'fantasy_points_ppr']].drop_duplicates().reset_index(drop = True)
 
-    # --- Insert into Postgres ---
-    final_df.to_sql('weekly_stats', engine, if_exists='replace', index=False)
-    print(f"{len(final_df)} rows successfully ingested into `weekly_stats`.")
+    # --- Merge into Postgres ---
+    storage.upsert(final_df, SUMMARY_TABLE, keys=['player_id', 'season', 'week'], dtype=SUMMARY_COLUMN_TYPES, partition_by='season')
+    mark_ingested(consumer, changed, NFLFASTR_DIR)
+    print(f"{len(final_df)} rows successfully ingested into `weekly_stats_summary` for seasons {changed}.")
@@ -1,15 +1,10 @@
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
+from src.data_ingestion.http_cache import cached_get
 
-def fetch_weekly_ol_rankings(engine, season: int):
-    load_dotenv()
-    engine = engine
+def fetch_weekly_ol_rankings(storage, season: int):
     url = "https://nfllines.com/offensive-line-rankings/"
-    r = requests.get(url, timeout=10)
+    r = cached_get(url, source='nfllines', timeout=10)
     r.raise_for_status()
     soup = BeautifulSoup(r.text, "html.parser")
     table = soup.find("table")
@@ -27,10 +22,10 @@ def fetch_weekly_ol_rankings(engine, season: int):
     df['week'] = pd.NA
     df['source'] = 'NFLLines'
 
-    teams_df = pd.read_sql("SELECT team_id, abbreviation FROM teams", engine)
+    teams_df = storage.read_sql("SELECT team_id, abbreviation FROM teams")
     df = df.merge(teams_df, how='left', on='abbreviation')
     df = df.dropna(subset=['team_id'])
 
     final = df[['season', 'week', 'team_id', 'ol_win_rate', 'pass_block_rate', 'run_block_rate', 'source']]
-    final.to_sql('weekly_offensive_line_rankings', engine, if_exists='replace', index=False)
+    storage.bulk_load(final, 'weekly_offensive_line_rankings', if_exists='replace', dtype={'week': 'INTEGER', 'team_id': 'INTEGER'})
     print(f"✅ Ingested OL rankings for {len(final)} teams.")
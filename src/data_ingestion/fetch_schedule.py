@@ -1,71 +1,92 @@
-import requests
-import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
-import logging
 import time
+import asyncio
+import datetime
+import logging
+import contextlib
+import httpx
+import pandas as pd
+from src.data_ingestion.http_cache import (
+    MAX_RETRIES, BACKOFF_SECONDS, TokenBucket, cached_get_async, get_http_cache, get_with_retries
+)
+
+GAMES_COLUMN_TYPES = {'game_id': 'INTEGER', 'season': 'INTEGER', 'week': 'INTEGER', 'game_date': 'DATE', 'home_team_id': 'INTEGER', 'away_team_id': 'INTEGER'}
 
 logging.basicConfig(level=logging.INFO)
-load_dotenv()
 
-DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-engine = create_engine(DATABASE_URL)
+EVENTS_URL = "https://sports.core.api.espn.com/v2/sports/football/leagues/nfl/seasons/{season}/types/2/events?limit=1000"
+# Requests in flight at once, and the sustained request rate shared by every season being crawled
+MAX_CONCURRENCY = 16
+REQUESTS_PER_SECOND = 20
+REQUEST_TIMEOUT = 10
+
+
+class EspnCrawler:
+    """
+    Fetches ESPN JSON with bounded concurrency, a token-bucket rate limit and retries with
+    exponential backoff. Every URL is fetched at most once per crawler: concurrent requests for
+    the same $ref (the week and team refs shared by many events) await the same fetch. Responses
+    go through the on-disk HTTP cache, and fresh cache hits skip the rate limit altogether.
+    """
+    def __init__(self, client, rate=REQUESTS_PER_SECOND, concurrency=MAX_CONCURRENCY,
+                 retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+        self.client = client
+        self.bucket = TokenBucket(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self._fetches = {}
+
+    def get_json(self, url, pin=False):
+        if url not in self._fetches:
+            self._fetches[url] = asyncio.ensure_future(self._fetch(url, pin))
+        return self._fetches[url]
+
+    async def _fetch(self, url, pin):
+        cached = get_http_cache().lookup(url, fresh_only=True)
+        if cached is not None:
+            return cached.json()
+        try:
+            response = await get_with_retries(lambda: self._get(url, pin), url, self.bucket, self.semaphore,
+                                              self.retries, self.backoff)
+            if response is None:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Failed to fetch {url}: {e}")
+            return None
 
-week_cache = {}
-team_cache = {}
+    def _get(self, url, pin):
+        self.requests += 1
+        return cached_get_async(self.client, url, source='espn', pin=pin, timeout=REQUEST_TIMEOUT)
 
-def fetch_json(url):
-    try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        return r.json()
-    except Exception as e:
-        logging.error(f"Failed to fetch {url}: {e}")
-        return None
 
-def fetch_week_number(week_obj):
+async def fetch_week_number(week_obj, crawler, pin=False):
     if isinstance(week_obj, dict):
         if 'number' in week_obj:
             return int(week_obj['number'])
         elif '$ref' in week_obj:
-            ref_url = week_obj['$ref']
-            if ref_url in week_cache:
-                return week_cache[ref_url]
-            try:
-                resp = requests.get(ref_url, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
-                number = int(data.get('number'))
-                week_cache[ref_url] = number
-                return number
-            except Exception as e:
-                logging.error(f"Failed to fetch week data from {ref_url}: {e}")
-                return None
+            data = await crawler.get_json(week_obj['$ref'], pin)
+            if data and data.get('number') is not None:
+                return int(data['number'])
+            logging.error(f"Failed to fetch week data from {week_obj['$ref']}")
+            return None
     elif isinstance(week_obj, int):
         return week_obj
     return None
 
-def fetch_team_abbreviation(team_obj):
+async def fetch_team_abbreviation(team_obj, crawler, pin=False):
     if 'abbreviation' in team_obj:
         return team_obj['abbreviation']
     elif '$ref' in team_obj:
-        ref_url = team_obj['$ref']
-        if ref_url in team_cache:
-            return team_cache[ref_url]
-        try:
-            resp = requests.get(ref_url, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            abbreviation = data.get('abbreviation')
-            if abbreviation:
-                team_cache[ref_url] = abbreviation
-                return abbreviation
-        except Exception as e:
-            logging.error(f"Failed to fetch team data from {ref_url}: {e}")
+        data = await crawler.get_json(team_obj['$ref'], pin)
+        if data and data.get('abbreviation'):
+            return data['abbreviation']
+        logging.error(f"Failed to fetch team data from {team_obj['$ref']}")
     return None
 
-def parse_event(event, season):
+async def parse_event(event, season, crawler):
     try:
         competitions = event.get('competitions', [])
         if not competitions:
@@ -75,10 +96,11 @@ def parse_event(event, season):
         if len(competitors) != 2:
             return None
 
+        pin = season_finished(season)
         home_team, away_team = None, None
-        for team in competitors:
+        abbreviations = await asyncio.gather(*(fetch_team_abbreviation(team.get('team', {}), crawler, pin) for team in competitors))
+        for team, abbreviation in zip(competitors, abbreviations):
             team_obj = team.get('team', {})
-            abbreviation = fetch_team_abbreviation(team_obj)
             if abbreviation is None:
                 logging.warning(f"Missing abbreviation for team: {team_obj}")
                 continue
@@ -89,13 +111,14 @@ def parse_event(event, season):
 
         venue = comp.get('venue', {}).get('fullName')
         game_date = event.get('date', '').split('T')[0]
-        week = fetch_week_number(event.get('week'))
+        week = await fetch_week_number(event.get('week'), crawler, pin)
 
         if not home_team or not away_team or not game_date:
             logging.warning(f"Incomplete event data: home_team={home_team}, away_team={away_team}, date={game_date}")
             return None
 
         return {
+            'game_id': int(event['id']),
             'season': season,
             'week': week,
             'home_team': home_team,
@@ -107,40 +130,57 @@ def parse_event(event, season):
         logging.error(f"Error parsing event: {e}")
         return None
 
-def fetch_and_store_schedule(season: int, engine):
-    base_url = f"https://sports.core.api.espn.com/v2/sports/football/leagues/nfl/seasons/{season}/types/2/events?limit=1000"
-    data = fetch_json(base_url)
-    if not data:
-        logging.error("No data found at main URL")
-        return
+def season_finished(season):
+    # The regular season wraps up in early January, so its events no longer change after that
+    return datetime.date.today() >= datetime.date(season + 1, 2, 1)
 
-    items = data.get('items', [])
-    logging.info(f"Found {len(items)} event references")
+async def _crawl_event(ref_url, season, crawler):
+    event_data = await crawler.get_json(ref_url, season_finished(season))
+    if not event_data:
+        return None
+    return await parse_event(event_data, season, crawler)
 
-    games = []
-    for idx, item in enumerate(items):
-        ref_url = item.get('$ref')
-        if not ref_url:
-            continue
+async def crawl_season(season, crawler, events_url=EVENTS_URL):
+    """
+    Parsed games of one regular season, with every event crawled concurrently.
+    """
+    data = await crawler.get_json(events_url.format(season=season), season_finished(season))
+    if not data:
+        logging.error(f"No data found at main URL for season {season}")
+        return []
 
-        event_data = fetch_json(ref_url)
-        if not event_data:
-            continue
+    refs = [item['$ref'] for item in data.get('items', []) if item.get('$ref')]
+    logging.info(f"Found {len(refs)} event references for season {season}")
 
-        parsed = parse_event(event_data, season)
+    games = []
+    tasks = [asyncio.ensure_future(_crawl_event(ref, season, crawler)) for ref in refs]
+    for idx, task in enumerate(asyncio.as_completed(tasks)):
+        parsed = await task
         if parsed:
             games.append(parsed)
-
-        time.sleep(0.1)
-        if idx % 10 == 0:
-            logging.info(f"Processed {idx+1} / {len(items)} events")
-
+        if idx % 50 == 0:
+            logging.info(f"Processed {idx+1} / {len(refs)} events for season {season}")
+    return games
+
+async def crawl_schedules(seasons, client=None, events_url=EVENTS_URL, rate=REQUESTS_PER_SECOND, concurrency=MAX_CONCURRENCY):
+    """
+    {season: parsed games} for all seasons, crawled together under one rate limit so shared
+    refs are fetched once. Pass an httpx.AsyncClient (e.g. pointed at a stub server) as client.
+    """
+    start = time.time()
+    async with (httpx.AsyncClient() if client is None else contextlib.nullcontext(client)) as http:
+        crawler = EspnCrawler(http, rate=rate, concurrency=concurrency)
+        results = await asyncio.gather(*(crawl_season(season, crawler, events_url) for season in seasons))
+    logging.info(f"Crawled {len(seasons)} seasons with {crawler.requests} requests in {time.time() - start:.1f}s")
+    return dict(zip(seasons, results))
+
+def store_schedule(games, season, storage):
     if not games:
-        logging.error("No games parsed successfully.")
+        logging.error(f"No games parsed successfully for season {season}.")
         return
 
     df = pd.DataFrame(games)
-    teams_df = pd.read_sql('SELECT team_id, abbreviation FROM teams', engine)
+    teams_df = storage.read_sql('SELECT team_id, abbreviation FROM teams')
     df = df.merge(teams_df, how='left', left_on='home_team', right_on='abbreviation') \
            .rename(columns={'team_id': 'home_team_id'}).drop(columns=['abbreviation'])
     df = df.merge(teams_df, how='left', left_on='away_team', right_on='abbreviation') \
@@ -148,10 +188,16 @@ def fetch_and_store_schedule(season: int, engine):
     
     df = df.drop_duplicates()
 
-    df.to_sql('games', engine, if_exists='append', index=False)
+    # Keyed on the ESPN event id, so re-running a season updates its games instead of duplicating them.
+    # games is partitioned by season, which every key on it has to include
+    storage.upsert(df, 'games', keys=['season', 'game_id'], dtype=GAMES_COLUMN_TYPES, partition_by='season')
     logging.info("NFL schedule ingested successfully.")
 
-def fetch_schedule_for_seasons(start_year: int, end_year: int, engine):
-    for season in range(start_year, end_year + 1):
-        logging.info(f"\nIngesting schedule for season {season}")
-        fetch_and_store_schedule(season, engine)
+def fetch_and_store_schedule(season: int, storage):
+    store_schedule(asyncio.run(crawl_schedules([season]))[season], season, storage)
+
+def fetch_schedule_for_seasons(start_year: int, end_year: int, storage):
+    seasons = list(range(start_year, end_year + 1))
+    logging.info(f"Ingesting schedules for seasons {start_year}-{end_year}")
+    for season, games in asyncio.run(crawl_schedules(seasons)).items():
+        store_schedule(games, season, storage)
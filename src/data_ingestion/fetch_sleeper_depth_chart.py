@@ -1,28 +1,26 @@
-import requests
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
+from src.data_ingestion.sleeper_snapshot import fetch_sleeper_snapshot
+from src.data_ingestion.player_identity import resolve_player_ids
 
-def fetch_sleeper_depth_chart(engine):
-    response = requests.get('https://api.sleeper.app/v1/players/nfl')
-    players_data = response.json()
-    players_df = pd.DataFrame.from_dict(players_data, orient='index')
+def fetch_sleeper_depth_chart(storage, snapshot=None):
+    if snapshot is None:
+        snapshot = fetch_sleeper_snapshot()
 
-    depth_chart_df = players_df[['full_name', 'position', 'depth_chart_position', 'team']].copy()
+    depth_chart_df = snapshot[['full_name', 'gsis_id', 'position', 'depth_chart_position', 'team']].copy()
     depth_chart_df = depth_chart_df.rename(columns={
         'full_name': 'name',
         'depth_chart_position': 'depth_position'
     })
-    depth_chart_df = depth_chart_df[depth_chart_df['name'].notnull() & depth_chart_df['position'].notnull()]
+    depth_chart_df = depth_chart_df[depth_chart_df['name'].notnull() & depth_chart_df['position'].notnull()].reset_index()
 
     # Link team ID from existing teams table
-    teams_query = pd.read_sql('SELECT team_id, abbreviation FROM teams', engine)
+    teams_query = storage.read_sql('SELECT team_id, abbreviation FROM teams')
     depth_chart_df = depth_chart_df.merge(teams_query, how='left', left_on='team', right_on='abbreviation')
 
-    # Link player ID from existing players table
-    players_query = pd.read_sql('SELECT player_id, name FROM players', engine)
-    depth_chart_df = depth_chart_df.merge(players_query, how='left', on='name')
+    # Link player ID through the identity index (by Sleeper id), keeping players the players table has
+    depth_chart_df['player_id'] = resolve_player_ids(storage, depth_chart_df, source='depth chart')
+    players_query = storage.read_sql('SELECT player_id FROM players')
+    depth_chart_df.loc[~depth_chart_df['player_id'].isin(players_query['player_id']), 'player_id'] = pd.NA
 
     # Drop rows where we are missing player_id or team_id because those are required for our schema
     final_df = depth_chart_df[['player_id', 'team_id', 'position', 'depth_position']].copy()
@@ -43,5 +41,5 @@ def fetch_sleeper_depth_chart(engine):
     final_df['depth_position'] = final_df['depth_position'].astype(str)
     final_df = final_df.drop_duplicates().reset_index(drop=True)
 
-    final_df.to_sql('depth_chart', engine, if_exists='replace', index=False)
+    storage.upsert(final_df, 'depth_chart', keys=['player_id', 'team_id'], dtype={'player_id': 'INTEGER', 'team_id': 'INTEGER'})
     print("Depth chart ingested into PostgreSQL.")
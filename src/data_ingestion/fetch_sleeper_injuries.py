@@ -1,22 +1,20 @@
-import requests
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
+from src.data_ingestion.sleeper_snapshot import fetch_sleeper_snapshot
+from src.data_ingestion.player_identity import resolve_player_ids
 
-def fetch_sleeper_injuries(engine):
-    # Fetch injuries from Sleeper API (this endpoint might change; confirm from their docs)
-    response = requests.get("https://api.sleeper.app/v1/players/nfl")
-    players_data = response.json()
+def fetch_sleeper_injuries(storage, snapshot=None):
+    # Injury statuses come from the Sleeper players snapshot shared with the players and depth chart loaders
+    if snapshot is None:
+        snapshot = fetch_sleeper_snapshot()
 
-    players_df = pd.DataFrame.from_dict(players_data, orient='index')
-    injury_df = players_df[['full_name', 'injury_status']].copy()
-    injury_df = injury_df.rename(columns={'full_name': 'name'})
-    injury_df = injury_df[injury_df['injury_status'].notnull()]
+    injury_df = snapshot[['full_name', 'gsis_id', 'position', 'birth_date', 'injury_status']].copy()
+    injury_df = injury_df.rename(columns={'full_name': 'name', 'birth_date': 'birthdate'})
+    injury_df = injury_df[injury_df['injury_status'].notnull()].reset_index()
 
-    # Map player_id from players table
-    players_query = pd.read_sql('SELECT player_id, name FROM players', engine)
-    injury_df = injury_df.merge(players_query, how='left', on='name')
+    # Map player_id through the identity index (by Sleeper id), keeping players the players table has
+    injury_df['player_id'] = resolve_player_ids(storage, injury_df, source='injuries')
+    players_query = storage.read_sql('SELECT player_id FROM players')
+    injury_df.loc[~injury_df['player_id'].isin(players_query['player_id']), 'player_id'] = pd.NA
 
     # Add season & week (manually or from schedule)
     injury_df['season'] = 2024  # adjust as needed
@@ -28,5 +26,5 @@ def fetch_sleeper_injuries(engine):
     final_df = final_df.drop_duplicates().reset_index(drop=True)
 
     # Save to PostgreSQL
-    final_df.to_sql('injuries', engine, if_exists='replace', index=False)
+    storage.upsert(final_df, 'injuries', keys=['player_id', 'season', 'week'], dtype={'player_id': 'INTEGER', 'season': 'INTEGER', 'week': 'INTEGER'})
     print("Injuries ingested into PostgreSQL.")
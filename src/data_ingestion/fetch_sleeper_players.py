@@ -1,10 +1,10 @@
-import requests
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
+from src.data_ingestion.sleeper_snapshot import fetch_sleeper_snapshot
+from src.data_ingestion.player_identity import resolve_player_ids
 
-def fetch_sleeper_players(engine):
+PLAYERS_COLUMN_TYPES = {'player_id': 'INTEGER', 'team_id': 'INTEGER'}
+
+def fetch_sleeper_players(storage, snapshot=None):
     # --- Fetch Teams ---
     teams_data = [
         {"name": "Arizona Cardinals", "abbreviation": "ARI"},
@@ -41,31 +41,32 @@ def fetch_sleeper_players(engine):
         {"name": "Washington Commanders", "abbreviation": "WAS"}
     ]
     teams_df = pd.DataFrame(teams_data).drop_duplicates().reset_index().rename(columns = {'index':'team_id'})
-    teams_df.to_sql('teams', engine, if_exists='append', index=False)
+    storage.upsert(teams_df, 'teams', keys=['team_id'], dtype={'team_id': 'INTEGER'})
     print("Teams ingested into PostgreSQL.")
 
     # --- Fetch Players ---
-    print("Fetching players from Sleeper API...")
-    response = requests.get('https://api.sleeper.app/v1/players/nfl')
-    players_data = response.json()
-
-    df = pd.DataFrame.from_dict(players_data, orient='index')
+    if snapshot is None:
+        snapshot = fetch_sleeper_snapshot()
 
-    df = df[['full_name', 'position', 'team', 'birth_date']]
+    df = snapshot[['full_name', 'gsis_id', 'position', 'team', 'birth_date']]
     df = df.rename(columns={
         'full_name': 'name',
         'birth_date': 'birthdate'
     })
 
     # Filter out entries without a name (defensive team slots, placeholders)
-    df = df[df['name'].notnull() & df['position'].notnull()]
+    df = df[df['name'].notnull() & df['position'].notnull()].reset_index()
+
+    # Canonical player ids shared with nflverse stats; new Sleeper players get an identity here
+    df['player_id'] = resolve_player_ids(storage, df, create=True, source='Sleeper players')
 
     # Handle team ID mapping via abbreviation
-    teams_query = pd.read_sql('SELECT team_id, abbreviation FROM teams', engine)
+    teams_query = storage.read_sql('SELECT team_id, abbreviation FROM teams')
     df = df.merge(teams_query, how='left', left_on='team', right_on='abbreviation')
 
-    df = df[['name', 'position', 'team_id', 'birthdate']].reset_index().rename(columns = {'index': 'player_id'})
+    # Duplicate Sleeper entries of one player keep the first
+    df = df[['player_id', 'name', 'position', 'team_id', 'birthdate']].drop_duplicates('player_id')
 
     # Write to Postgres
-    df.drop_duplicates().to_sql('players', engine, if_exists='replace', index=False)
+    storage.upsert(df, 'players', keys=['player_id'], dtype=PLAYERS_COLUMN_TYPES)
     print("Sleeper players ingested into PostgreSQL.")
\ No newline at end of file
@@ -1,121 +1,199 @@
-import pandas as pd
+import os
+import asyncio
+import contextlib
+import sqlite3
+import logging
 import datetime
-from sqlalchemy import create_engine
+import httpx
+import pandas as pd
 from dotenv import load_dotenv
-import os
-import requests
+from src.data_ingestion.http_cache import TokenBucket, get_with_retries
+
+WEATHER_COLUMN_TYPES = {'season': 'INTEGER', 'week': 'INTEGER', 'dome': 'BOOLEAN'}
+WEATHER_COLUMNS = ['season', 'week', 'stadium', 'temperature', 'precipitation', 'wind_speed', 'dome']
+
+# Visual Crossing timeline API; point VISUAL_CROSSING_BASE_URL at a local stub to test without the real API
+WEATHER_BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
+# Every fetched (location, date) is kept here for good: past weather never changes
+WEATHER_CACHE_PATH = 'data/cache/weather/days.sqlite'
+# Visual Crossing bills every day a range returns, so a stadium's game dates are only merged into
+# one range when they are at most MAX_GAP_DAYS apart: every day in between is a billed record no
+# game needs. 1 merges back-to-back dates only, keeping a backfill at one record per home date;
+# raise it (VISUAL_CROSSING_MAX_GAP_DAYS) to trade records for fewer calls on a paid plan
+MAX_GAP_DAYS = 1
+MAX_CONCURRENCY = 4
+REQUESTS_PER_SECOND = 5
+REQUEST_TIMEOUT = 30
+# Conditions assumed under a roof
+DOME_WEATHER = {'temperature': 72, 'precipitation': 0, 'wind_speed': 0}
 
 load_dotenv()
 
-def fetch_weather_historic(engine):
-    print('Fetching weather...')
-    API_KEY = os.getenv('VISUAL_CROSSING_API_KEY')
+# Stadium → Location mapping
+STADIUM_LOCATIONS = {
+    "Allegiant Stadium": "Las Vegas, NV",
+    "AT&T Stadium": "Arlington, TX",
+    "Bank of America Stadium": "Charlotte, NC",
+    "Caesars Superdome": "New Orleans, LA",
+    "FedExField": "Landover, MD",
+    "Ford Field": "Detroit, MI",
+    "Gillette Stadium": "Foxborough, MA",
+    "Hard Rock Stadium": "Miami Gardens, FL",
+    "Highmark Stadium": "Orchard Park, NY",
+    "Lambeau Field": "Green Bay, WI",
+    "Levi's Stadium": "Santa Clara, CA",
+    "Lincoln Financial Field": "Philadelphia, PA",
+    "Lucas Oil Stadium": "Indianapolis, IN",
+    "Lumen Field": "Seattle, WA",
+    "Mercedes-Benz Stadium": "Atlanta, GA",
+    "MetLife Stadium": "East Rutherford, NJ",
+    "M&T Bank Stadium": "Baltimore, MD",
+    "NRG Stadium": "Houston, TX",
+    "Paycor Stadium": "Cincinnati, OH",
+    "Raymond James Stadium": "Tampa, FL",
+    "SoFi Stadium": "Inglewood, CA",
+    "Soldier Field": "Chicago, IL",
+    "State Farm Stadium": "Glendale, AZ",
+    "TIAA Bank Field": "Jacksonville, FL",
+    "U.S. Bank Stadium": "Minneapolis, MN",
+    "Arrowhead Stadium": "Kansas City, MO",
+    "Acrisure Stadium": "Pittsburgh, PA",
+    "Empower Field at Mile High": "Denver, CO",
+    "FirstEnergy Stadium": "Cleveland, OH" 
+}
+
+DOME_STADIUMS = [
+    "Lucas Oil Stadium",
+    "Mercedes-Benz Stadium",
+    "Caesars Superdome",
+    "NRG Stadium",
+    "Allegiant Stadium",
+    "AT&T Stadium",
+    "State Farm Stadium",
+    "U.S. Bank Stadium",
+    "Ford Field"
+]
+
+
+def open_weather_cache(path=WEATHER_CACHE_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS weather_days (
+            location TEXT NOT NULL,
+            date TEXT NOT NULL,
+            temperature REAL,
+            precipitation REAL,
+            wind_speed REAL,
+            PRIMARY KEY (location, date)
+        )
+    """)
+    return con
+
 
-    # Stadium → Location mapping
-    stadiums = {
-        "Allegiant Stadium": "Las Vegas, NV",
-        "AT&T Stadium": "Arlington, TX",
-        "Bank of America Stadium": "Charlotte, NC",
-        "Caesars Superdome": "New Orleans, LA",
-        "FedExField": "Landover, MD",
-        "Ford Field": "Detroit, MI",
-        "Gillette Stadium": "Foxborough, MA",
-        "Hard Rock Stadium": "Miami Gardens, FL",
-        "Highmark Stadium": "Orchard Park, NY",
-        "Lambeau Field": "Green Bay, WI",
-        "Levi's Stadium": "Santa Clara, CA",
-        "Lincoln Financial Field": "Philadelphia, PA",
-        "Lucas Oil Stadium": "Indianapolis, IN",
-        "Lumen Field": "Seattle, WA",
-        "Mercedes-Benz Stadium": "Atlanta, GA",
-        "MetLife Stadium": "East Rutherford, NJ",
-        "M&T Bank Stadium": "Baltimore, MD",
-        "NRG Stadium": "Houston, TX",
-        "Paycor Stadium": "Cincinnati, OH",
-        "Raymond James Stadium": "Tampa, FL",
-        "SoFi Stadium": "Inglewood, CA",
-        "Soldier Field": "Chicago, IL",
-        "State Farm Stadium": "Glendale, AZ",
-        "TIAA Bank Field": "Jacksonville, FL",
-        "U.S. Bank Stadium": "Minneapolis, MN",
-        "Arrowhead Stadium": "Kansas City, MO",
-        "Acrisure Stadium": "Pittsburgh, PA",
-        "Empower Field at Mile High": "Denver, CO",
-        "FirstEnergy Stadium": "Cleveland, OH" 
+def cached_weather(con, locations):
+    return pd.read_sql_query(
+        f"SELECT * FROM weather_days WHERE location IN ({', '.join('?' * len(locations))})",
+        con, params=list(locations)
+    )
+
+
+def weather_ranges(missing, max_gap_days=MAX_GAP_DAYS):
+    """
+    (location, start, end) timeline requests covering every missing (location, date): one per
+    run of a location's dates without a gap longer than max_gap_days.
+    """
+    ranges = []
+    for location, dates in missing.groupby('location')['date']:
+        dates = sorted(dates.unique())
+        start = prev = dates[0]
+        for date in dates[1:]:
+            if (date - prev).days > max_gap_days:
+                ranges.append((location, start, prev))
+                start = date
+            prev = date
+        ranges.append((location, start, prev))
+    return ranges
+
+
+async def _fetch_range(client, base_url, params, location, start, end, bucket, semaphore):
+    url = f"{base_url}/{location}/{start}/{end}"
+    response = await get_with_retries(lambda: client.get(url, params=params, timeout=REQUEST_TIMEOUT), url, bucket, semaphore)
+    if response is None or response.status_code != 200:
+        logging.error(f"No weather for {location} {start}..{end}" + (f": HTTP {response.status_code}" if response else ''))
+        return []
+    return [(location, day['datetime'], day.get('temp'), day.get('precip'), day.get('windspeed'))
+            for day in response.json().get('days', [])]
+
+
+async def fetch_weather_ranges(ranges, con, api_key=None, base_url=WEATHER_BASE_URL, client=None,
+                               rate=REQUESTS_PER_SECOND, concurrency=MAX_CONCURRENCY):
+    """
+    Fetches the timeline ranges concurrently under a shared rate limit and stores each returned
+    day in the weather cache as soon as its range arrives. A range that keeps failing is logged
+    and skipped, and will be requested again on the next run.
+    """
+    params = {
+        "unitGroup": "us",
+        "key": api_key,
+        "include": "days",
+        "elements": "datetime,temp,precip,windspeed",
+        "contentType": "json"
     }
+    bucket, semaphore = TokenBucket(rate), asyncio.Semaphore(concurrency)
+    async with (httpx.AsyncClient() if client is None else contextlib.nullcontext(client)) as http:
+        tasks = [asyncio.ensure_future(_fetch_range(http, base_url, params, *r, bucket, semaphore)) for r in ranges]
+        for task in asyncio.as_completed(tasks):
+            days = await task
+            con.executemany("INSERT OR REPLACE INTO weather_days VALUES (?, ?, ?, ?, ?)", days)
+            con.commit()
 
-    dome_stadiums = [
-        "Lucas Oil Stadium",
-        "Mercedes-Benz Stadium",
-        "Caesars Superdome",
-        "NRG Stadium",
-        "Allegiant Stadium",
-        "AT&T Stadium",
-        "State Farm Stadium",
-        "U.S. Bank Stadium",
-        "Ford Field"
-    ]
+
+def fetch_weather_historic(storage, base_url=None, client=None, cache_path=WEATHER_CACHE_PATH):
+    print('Fetching weather...')
+    API_KEY = os.getenv('VISUAL_CROSSING_API_KEY')
+    base_url = base_url or os.getenv('VISUAL_CROSSING_BASE_URL', WEATHER_BASE_URL)
 
     # Pull games from DB
-    schedule_df = pd.read_sql("SELECT season, week, stadium, game_date FROM games", engine)
+    schedule_df = storage.read_sql("SELECT season, week, stadium, game_date FROM games")
 
     # Labeling dome stadiums to avoid grabbing unnecessary weather data
-    for i in range(len(schedule_df)):
-        if schedule_df['stadium'][i] in dome_stadiums:
-            schedule_df.loc[i, 'dome'] = 1
-        else:
-            schedule_df.loc[i, 'dome'] = 0
+    schedule_df['dome'] = schedule_df['stadium'].isin(DOME_STADIUMS)
 
     # Filter out current and future games to only fetch historic weather
     schedule_df = schedule_df[schedule_df['season'] < datetime.datetime.now().year]
 
-    # Fetch weather for each game
-    weather_records = []
-
-    BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
-
-    for _, game in schedule_df.iterrows():
-        if game.dome == 0:
-            stadium = game['stadium']
-            location = stadiums.get(stadium)
-            if not location:
-                continue
-
-            params = {
-                "unitGroup": "us",
-                "key": API_KEY,
-                "include": "days",
-                "elements": "datetime,temp,precip,windspeed",
-                "contentType": "json"
-            }
-
-            response = requests.get(f"{BASE_URL}/{location}/{game['game_date']}", params=params)
-            data = response.json()
-            day = data["days"][0]
-
-            weather_records.append({
-                "season": game["season"],
-                "week": game["week"],
-                "stadium": stadium,
-                "temperature": day.get("temp"),
-                "precipitation": day.get("precip"),
-                "wind_speed": day.get("windspeed"),
-                "dome": stadium in dome_stadiums
-            })
-        else:
-            weather_records.append({
-                "season": game["season"],
-                "week": game["week"],
-                "stadium": game["stadium"],
-                "temperature": 72,
-                "precipitation": 0,
-                "wind_speed": 0,
-                "dome": True  # Dome stadiums have no weather data
-            })
+    # Outdoor games at stadiums without a known location get no weather row
+    schedule_df['location'] = schedule_df['stadium'].map(STADIUM_LOCATIONS)
+    schedule_df['date'] = pd.to_datetime(schedule_df['game_date']).dt.date
+    outdoor = schedule_df[~schedule_df['dome'] & schedule_df['location'].notna()]
+
+    con = open_weather_cache(cache_path)
+    try:
+        known = cached_weather(con, outdoor['location'].unique())
+        known_keys = set(zip(known['location'], known['date']))
+        missing = outdoor[[(loc, date.isoformat()) not in known_keys for loc, date in zip(outdoor['location'], outdoor['date'])]]
+        ranges = weather_ranges(missing, int(os.getenv('VISUAL_CROSSING_MAX_GAP_DAYS', MAX_GAP_DAYS)))
+        records = sum((end - start).days + 1 for _, start, end in ranges)
+        print(f"{len(outdoor)} outdoor games, {len(missing)} without cached weather, fetching {len(ranges)} date ranges "
+              f"({records} billed records).")
+        if ranges:
+            asyncio.run(fetch_weather_ranges(ranges, con, API_KEY, base_url, client))
+        days = cached_weather(con, outdoor['location'].unique())
+    finally:
+        con.close()
+
+    days['date'] = pd.to_datetime(days['date']).dt.date
+    outdoor_df = outdoor.merge(days, how='inner', on=['location', 'date'])
+    if len(outdoor_df) < len(outdoor):
+        logging.warning(f"No weather for {len(outdoor) - len(outdoor_df)} outdoor games; they are retried on the next run.")
+    dome_df = schedule_df[schedule_df['dome']].assign(**DOME_WEATHER)
 
     # Ingest into DB
-    weather_df = pd.DataFrame(weather_records)
+    weather_df = pd.concat([outdoor_df, dome_df], ignore_index=True)[WEATHER_COLUMNS]
     weather_df = weather_df.drop_duplicates().reset_index(drop=True)
-    weather_df.to_sql('weather', engine, if_exists='replace', index=False)
+    # Each fetched season replaces its own weather partition
+    storage.swap_partitions(weather_df, 'weather', dtype=WEATHER_COLUMN_TYPES)
     weather_df.to_csv('../data/processed/historic_weather.csv', index=False)
     print("Weather data ingested into PostgreSQL.")
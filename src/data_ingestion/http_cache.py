@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import asyncio
+import contextlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses are kept as files under HTTP_CACHE_DIR, indexed by a small SQLite table
+HTTP_CACHE_DIR = 'data/cache/http'
+HTTP_CACHE_MAX_MB = 2048
+# Seconds a cached response is served without asking the server again; None never expires
+DEFAULT_TTL = 3600
+SOURCE_TTLS = {
+    'espn': 24 * 3600,
+    'sleeper': 6 * 3600,
+    'weather': 24 * 3600,
+    'nfllines': 24 * 3600,
+    'sharp': 24 * 3600,
+}
+# Credentials are left out of cache keys, so rotating an API key keeps the cache valid
+IGNORED_PARAMS = {'key', 'apikey', 'api_key'}
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 32
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_cache = None
+_session = None
+_lock = threading.Lock()
+
+
+def cache_key(url, params=None):
+    params = sorted((k, str(v)) for k, v in (params or {}).items() if k not in IGNORED_PARAMS)
+    full_url = url + ('?' + urlencode(params) if params else '')
+    return hashlib.sha256(full_url.encode()).hexdigest(), full_url
+
+
+def ttl_for(source, pin=False):
+    return None if pin else SOURCE_TTLS.get(source, DEFAULT_TTL)
+
+
+class CachedResponse:
+    """
+    The parts of an HTTP response the fetchers use, whether it came from the network or the cache.
+    """
+    def __init__(self, url, status_code, content, headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        content_type = self.headers.get('Content-Type') or ''
+        charset = content_type.split('charset=')[-1].split(';')[0].strip() if 'charset=' in content_type else 'utf-8'
+        return self.content.decode(charset, errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error for url: {self.url}")
+
+
+class HttpCache:
+    """
+    On-disk response cache with per-entry expiry, ETag/Last-Modified validators and LRU eviction
+    once the bodies exceed max_bytes. Entries stored without a TTL are pinned: they never expire
+    and are evicted only after every unpinned entry.
+    """
+    def __init__(self, directory=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, 'bodies'), exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    def _path(self, key):
+        return os.path.join(self.directory, 'bodies', key[:2], key)
+
+    def lookup(self, url, params=None, fresh_only=False):
+        """
+        Cached response for url and params (None on a miss), with .fresh telling whether it can
+        be served without revalidation. Stale entries are returned only when fresh_only is False.
+        """
+        key, full_url = cache_key(url, params)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, content_type, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            etag, last_modified, content_type, expires_at = row
+            fresh = expires_at is None or expires_at > time.time()
+            if fresh_only and not fresh:
+                return None
+            try:
+                with open(self._path(key), 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        headers = {'ETag': etag, 'Last-Modified': last_modified, 'Content-Type': content_type}
+        response = CachedResponse(full_url, 200, content, {k: v for k, v in headers.items() if v}, from_cache=True)
+        response.fresh = fresh
+        return response
+
+    def store(self, url, params, content, headers, ttl):
+        key, full_url = cache_key(url, params)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a side file and renamed, so a crash never leaves a truncated body behind
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, full_url, headers.get('ETag'), headers.get('Last-Modified'), headers.get('Content-Type'),
+                 len(content), now, None if ttl is None else now + ttl, now)
+            )
+            self.db.commit()
+        self.evict()
+
+    def revalidated(self, url, params, ttl):
+        """
+        Restarts the expiry of an entry the server confirmed unchanged (304).
+        """
+        key, _ = cache_key(url, params)
+        now = time.time()
+        with self._lock:
+            self.db.execute("UPDATE responses SET fetched_at = ?, expires_at = ?, last_access = ? WHERE key = ?",
+                            (now, None if ttl is None else now + ttl, now, key))
+            self.db.commit()
+
+    def evict(self):
+        with self._lock:
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self.db.execute(
+                "SELECT key, size FROM responses ORDER BY expires_at IS NULL, last_access"
+            ).fetchall()
+            evicted = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                total -= size
+                evicted.append(key)
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self.db.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in evicted])
+            self.db.commit()
+        logging.info(f"Evicted {len(evicted)} cached responses to stay under {self.max_bytes} bytes.")
+
+
+def conditional_headers(cached):
+    headers = {}
+    if cached is not None:
+        if cached.headers.get('ETag'):
+            headers['If-None-Match'] = cached.headers['ETag']
+        if cached.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = cached.headers['Last-Modified']
+    return headers
+
+
+def get_http_cache():
+    """
+    Process-wide response cache, created on first use under HTTP_CACHE_DIR (env overridable).
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                max_mb = int(os.getenv('HTTP_CACHE_MAX_MB', HTTP_CACHE_MAX_MB))
+                _cache = HttpCache(os.getenv('HTTP_CACHE_DIR', HTTP_CACHE_DIR), max_mb * 1024 * 1024)
+    return _cache
+
+
+def get_session():
+    """
+    Process-wide requests session whose connection pool keeps connections alive across fetchers.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _finish(cache, url, params, response, cached, ttl):
+    """
+    Turns a network response into a CachedResponse, storing 200s and serving 304s from the cache.
+    """
+    if response.status_code == 304 and cached is not None:
+        cache.revalidated(url, params, ttl)
+        return cached
+    headers = {name: response.headers.get(name) for name in ('ETag', 'Last-Modified', 'Content-Type')}
+    result = CachedResponse(str(response.url), response.status_code, response.content,
+                            {k: v for k, v in headers.items() if v})
+    if response.status_code == 200:
+        cache.store(url, params, response.content, result.headers, ttl)
+    return result
+
+
+def cached_get(url, params=None, source=None, pin=False, headers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    GET through the pooled session and the on-disk cache. Fresh entries are served without a
+    request, stale ones are revalidated with their ETag/Last-Modified. pin=True stores immutable
+    resources (finished games, past weather) without expiry; otherwise source picks the TTL.
+    """
+    cache = get_http_cache()
+    cached = cache.lookup(url, params)
+    if cached is not None and cached.fresh:
+        return cached
+    response = get_session().get(url, params=params, timeout=timeout,
+                                 headers={**(headers or {}), **conditional_headers(cached)})
+    return _finish(cache, url, params, response, cached, ttl_for(source, pin))
+
+
+async def cached_get_async(client, url, params=None, source=None, pin=False, headers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    cached_get for an httpx.AsyncClient.
+    """
+    cache = get_http_cache()
+    cached = cache.lookup(url, params)
+    if cached is not None and cached.fresh:
+        return cached
+    response = await client.get(url, params=params, timeout=timeout,
+                                headers={**(headers or {}), **conditional_headers(cached)})
+    return _finish(cache, url, params, response, cached, ttl_for(source, pin))
+
+
+class TokenBucket:
+    """
+    Allows rate acquisitions per second on average, with bursts of up to capacity.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def get_with_retries(send, url, bucket=None, semaphore=None, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Awaits send() (one GET of url) inside the optional semaphore and token bucket, retrying 429/5xx
+    responses and transport errors with exponential backoff, or after the server's Retry-After.
+    Returns the final response, or None when every attempt failed.
+    """
+    for attempt in range(retries + 1):
+        retry_after = None
+        try:
+            async with semaphore or contextlib.nullcontext():
+                if bucket is not None:
+                    await bucket.acquire()
+                response = await send()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            error = f"HTTP {response.status_code}"
+        except httpx.TransportError as e:
+            error = repr(e)
+        if attempt < retries:
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+            logging.warning(f"Retrying {url} in {delay:.1f}s after {error}")
+            await asyncio.sleep(delay)
+    logging.error(f"Failed to fetch {url} after {retries + 1} attempts: {error}")
+    return None
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import pyarrow.parquet as pq
+from src.data_ingestion.http_cache import BACKOFF_SECONDS, MAX_RETRIES, RETRY_STATUSES, get_session
+
+NFLFASTR_URL = 'https://github.com/nflverse/nflverse-data/releases/download/player_stats/player_stats_{year}.parquet'
+NFLFASTR_DIR = 'data/raw/nflfastr'
+# {season: {file, size, sha256, etag, last_modified, downloaded_at, ingested: {consumer: sha256}}}
+MANIFEST_NAME = 'manifest.json'
+# Failed downloads used to leave placeholders of a few bytes behind; nothing this small is a real season
+MIN_PARQUET_BYTES = 1000
+DOWNLOAD_WORKERS = 4
+# Small enough that an interrupted download keeps nearly everything it received for the resume
+CHUNK_BYTES = 64 << 10
+DOWNLOAD_TIMEOUT = 60
+
+_manifest_lock = threading.Lock()
+
+
+def parquet_path(season, local_dir=NFLFASTR_DIR):
+    return os.path.join(local_dir, f"player_stats_{season}.parquet")
+
+
+def current_season(today=None):
+    # Seasons start in September and finish in February of the following year
+    today = today or datetime.date.today()
+    return today.year if today.month >= 3 else today.year - 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def validate_parquet(path, expected_size=None, expected_sha256=None):
+    """
+    Reason path is not a complete parquet file (None when it is): too small, a size other than
+    expected_size, missing PAR1 magic at either end, an unreadable footer, or a checksum other
+    than expected_sha256.
+    """
+    size = os.path.getsize(path)
+    if size < MIN_PARQUET_BYTES:
+        return f"only {size} bytes"
+    if expected_size is not None and size != expected_size:
+        return f"{size} bytes instead of {expected_size}"
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        f.seek(-4, os.SEEK_END)
+        tail = f.read(4)
+    if head != b'PAR1' or tail != b'PAR1':
+        return "missing parquet magic bytes"
+    try:
+        pq.read_metadata(path)
+    except Exception as e:
+        return f"unreadable footer ({e})"
+    if expected_sha256 is not None and file_sha256(path) != expected_sha256:
+        return "checksum mismatch"
+    return None
+
+
+def load_manifest(local_dir=NFLFASTR_DIR):
+    path = os.path.join(local_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(season): entry for season, entry in json.load(f).items()}
+
+
+def save_manifest(manifest, local_dir=NFLFASTR_DIR):
+    path = os.path.join(local_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({str(season): manifest[season] for season in sorted(manifest)}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _download(url, path, entry, revalidate):
+    """
+    Downloads url to path, resuming a leftover .part file with a Range request. With revalidate,
+    an existing file is kept when the server answers 304 to its ETag/Last-Modified. Returns the
+    response headers of interest, or None when the file was unchanged.
+    """
+    part_path = f"{path}.part"
+    headers = {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+    elif revalidate and entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    with get_session().get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        if r.status_code == 304:
+            return None
+        if r.status_code == 416:
+            # The part file already holds the whole body
+            expected_size = offset
+        else:
+            r.raise_for_status()
+            if r.status_code != 206:
+                offset = 0
+            expected_size = offset + int(r.headers['Content-Length']) if 'Content-Length' in r.headers else None
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in r.iter_content(CHUNK_BYTES):
+                    f.write(chunk)
+
+    problem = validate_parquet(part_path, expected_size)
+    if problem:
+        os.remove(part_path)
+        raise ValueError(f"Downloaded {url} is invalid: {problem}")
+    os.replace(part_path, path)
+    return {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+
+
+def download_season(season, local_dir=NFLFASTR_DIR, entry=None, refresh=False, url_template=NFLFASTR_URL):
+    """
+    Makes sure the season's parquet file is present and valid, downloading it when missing or
+    invalid and revalidating it with the server when refresh is set. Returns its manifest entry,
+    or None when no valid file could be obtained.
+    """
+    path = parquet_path(season, local_dir)
+    entry = dict(entry or {})
+    if os.path.exists(path):
+        problem = validate_parquet(path, entry.get('size'), entry.get('sha256'))
+        if problem:
+            logging.warning(f"Re-downloading {path}: {problem}")
+            os.remove(path)
+        elif not refresh:
+            return {**entry, 'file': path, 'size': os.path.getsize(path), 'sha256': entry.get('sha256') or file_sha256(path)}
+
+    url = url_template.format(year=season)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            validators = _download(url, path, entry, revalidate=os.path.exists(path))
+            break
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in RETRY_STATUSES:
+                logging.error(f"Failed to download season {season}: {e}")
+                return None
+            error = e
+        except (requests.RequestException, ValueError) as e:
+            error = e
+        if attempt < MAX_RETRIES:
+            logging.warning(f"Retrying season {season} download after {error}")
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+    else:
+        logging.error(f"Failed to download season {season} after {MAX_RETRIES + 1} attempts: {error}")
+        return None
+
+    if validators is None:
+        print(f"Unchanged: {path}")
+        return {**entry, 'file': path, 'size': os.path.getsize(path), 'sha256': entry.get('sha256') or file_sha256(path)}
+    print(f"Saved: {path}")
+    return {**entry, **validators, 'file': path, 'size': os.path.getsize(path), 'sha256': file_sha256(path),
+            'downloaded_at': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def download_seasons(seasons, local_dir=NFLFASTR_DIR, refresh_seasons=None, workers=DOWNLOAD_WORKERS):
+    """
+    Downloads the seasons concurrently and records them in the manifest. Seasons already on disk
+    are only re-downloaded when invalid, except refresh_seasons (default: the current season),
+    which are revalidated against the server. Returns {season: manifest entry} for every season
+    with a valid file.
+    """
+    os.makedirs(local_dir, exist_ok=True)
+    refresh_seasons = {current_season()} if refresh_seasons is None else set(refresh_seasons)
+    with _manifest_lock:
+        manifest = load_manifest(local_dir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {season: pool.submit(download_season, season, local_dir, manifest.get(season), season in refresh_seasons)
+                   for season in seasons}
+        entries = {season: future.result() for season, future in futures.items()}
+
+    with _manifest_lock:
+        manifest = load_manifest(local_dir)
+        manifest.update({season: entry for season, entry in entries.items() if entry})
+        save_manifest(manifest, local_dir)
+    return {season: entry for season, entry in entries.items() if entry}
+
+
+def seasons_to_ingest(consumer, seasons, local_dir=NFLFASTR_DIR, force=False):
+    """
+    Seasons with a valid file whose checksum consumer has not ingested yet (all of them with force).
+    Valid files that were not downloaded through download_seasons are added to the manifest first.
+    """
+    with _manifest_lock:
+        manifest = load_manifest(local_dir)
+        unknown = [season for season in seasons if season not in manifest and os.path.exists(parquet_path(season, local_dir))
+                   and validate_parquet(parquet_path(season, local_dir)) is None]
+        for season in unknown:
+            path = parquet_path(season, local_dir)
+            manifest[season] = {'file': path, 'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+        if unknown:
+            save_manifest(manifest, local_dir)
+    ready = [season for season in seasons if manifest.get(season, {}).get('sha256')]
+    if force:
+        return ready
+    return [season for season in ready
+            if manifest[season].get('ingested', {}).get(consumer) != manifest[season]['sha256']]
+
+
+def mark_ingested(consumer, seasons, local_dir=NFLFASTR_DIR):
+    with _manifest_lock:
+        manifest = load_manifest(local_dir)
+        for season in seasons:
+            entry = manifest[season]
+            entry['ingested'] = {**entry.get('ingested', {}), consumer: entry['sha256']}
+        save_manifest(manifest, local_dir)
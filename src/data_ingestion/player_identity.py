@@ -0,0 +1,253 @@
+import logging
+import threading
+import pandas as pd
+
+IDENTITY_TABLE = 'player_identity'
+IDENTITY_COLUMNS = ['player_id', 'gsis_id', 'sleeper_id', 'name', 'name_key', 'birthdate', 'position']
+IDENTITY_COLUMN_TYPES = {'player_id': 'INTEGER', 'gsis_id': 'VARCHAR', 'sleeper_id': 'VARCHAR', 'name': 'VARCHAR',
+                         'name_key': 'VARCHAR', 'birthdate': 'VARCHAR', 'position': 'VARCHAR'}
+# Players with a GSIS id keep its numeric part as player_id (00-0033873 -> 33873), the id weekly_stats
+# and the features always used; everyone else gets an id from this range, far above any GSIS number
+MINTED_ID_START = 10_000_000
+
+# Generational suffixes are dropped unless they are the first token (V. Jefferson keeps his initial)
+NAME_SUFFIXES = r'(?<=\S) (?:jr|sr|ii|iii|iv|v)\b'
+# First names that sources spell differently, mapped to one form
+NICKNAMES = {
+    'mike': 'michael', 'mitch': 'mitchell', 'matt': 'matthew', 'chris': 'christopher', 'josh': 'joshua',
+    'joe': 'joseph', 'will': 'william', 'bill': 'william', 'billy': 'william', 'rob': 'robert', 'bob': 'robert',
+    'bobby': 'robert', 'jim': 'james', 'jimmy': 'james', 'tom': 'thomas', 'tommy': 'thomas', 'dan': 'daniel',
+    'danny': 'daniel', 'dave': 'david', 'nick': 'nicholas', 'tony': 'anthony', 'ben': 'benjamin',
+    'sam': 'samuel', 'alex': 'alexander', 'andy': 'andrew', 'drew': 'andrew', 'jon': 'jonathan',
+    'jake': 'jacob', 'gabe': 'gabriel', 'zach': 'zachary', 'zack': 'zachary', 'ken': 'kenneth',
+    'kenny': 'kenneth', 'greg': 'gregory', 'jeff': 'jeffrey', 'steve': 'steven', 'stephen': 'steven',
+    'pat': 'patrick', 'cam': 'cameron', 'ced': 'cedric',
+}
+
+# Resolution steps, strictest first. Name-based steps only accept a key that belongs to exactly one
+# known player and whose ids and birthdate do not contradict the row.
+RESOLUTION_STEPS = ['gsis_id', 'sleeper_id', 'name_birthdate', 'name_key', 'nick_key', 'initial_key']
+NAME_STEPS = {'name_birthdate', 'name_key', 'nick_key', 'initial_key'}
+
+# Tables keyed by player_id that were filled with row-number ids before the identity index existed
+PLAYER_KEYED_TABLES = ['players', 'depth_chart', 'injuries']
+
+_identity_lock = threading.Lock()
+
+
+def normalize_names(names) -> pd.Series:
+    """
+    Lowercase ASCII names without punctuation or generational suffixes, with runs of initials
+    joined: "D.K. Metcalf", "DK Metcalf" -> "dk metcalf"; "Odell Beckham Jr." -> "odell beckham";
+    "P.Mahomes" -> "p mahomes".
+    """
+    s = pd.Series(names, dtype=object).where(pd.notna(names), '').astype(str)
+    s = s.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.lower()
+    s = s.str.replace(r"['`]", '', regex=True).str.replace(r'[^a-z]+', ' ', regex=True).str.strip()
+    s = s.str.replace(r'\b([a-z]) (?=[a-z]\b)', r'\1', regex=True)
+    return s.str.replace(NAME_SUFFIXES, '', regex=True).str.strip()
+
+
+def name_keys(frame) -> pd.DataFrame:
+    """
+    The name keys of each row of frame (name_key, birthdate and position columns): the full
+    normalized name, that name with the first name's nickname resolved, and first initial plus
+    last name (which is how nflverse abbreviates, "P.Mahomes") qualified by position.
+    """
+    name_key = frame['name_key'].fillna('').astype(str)
+    first = name_key.str.split(' ', n=1).str[0]
+    rest = name_key.str.split(' ', n=1).str[1].fillna('')
+    last = name_key.str.rsplit(' ', n=1).str[-1]
+    nick_key = (first.map(NICKNAMES).fillna(first) + ' ' + rest).str.strip()
+    initial_key = first.str[:1] + ' ' + last + '|' + frame['position'].fillna('').astype(str)
+    has_name = name_key != ''
+    has_birthdate = frame['birthdate'].notna() & has_name
+    return pd.DataFrame({
+        'name_birthdate': (name_key + '|' + frame['birthdate'].astype(str)).where(has_birthdate),
+        'name_key': name_key.where(has_name),
+        'nick_key': nick_key.where(has_name),
+        'initial_key': initial_key.where(has_name & frame['position'].notna()),
+    }, index=frame.index)
+
+
+def gsis_number(gsis_ids) -> pd.Series:
+    # Numeric part of an nflverse id; ids without digits give null
+    digits = pd.Series(gsis_ids, dtype=object).str.replace(r'[^0-9]', '', regex=True)
+    return pd.to_numeric(digits.where(digits != ''), errors='coerce').astype('Int64')
+
+
+def _clean(players) -> pd.DataFrame:
+    frame = pd.DataFrame(index=players.index)
+    for col in ('gsis_id', 'sleeper_id', 'name', 'birthdate', 'position'):
+        values = players[col] if col in players else pd.Series(None, index=players.index, dtype=object)
+        values = values.astype('string').str.strip()
+        values = values.mask(values == '')
+        frame[col] = values.astype(object).where(values.notna(), None)
+    frame['name_key'] = normalize_names(frame['name']).values
+    return frame
+
+
+def load_identity_index(storage) -> pd.DataFrame:
+    if not storage.has_table(IDENTITY_TABLE):
+        return pd.DataFrame({col: pd.Series(dtype='Int64' if col == 'player_id' else object) for col in IDENTITY_COLUMNS})
+    index = storage.read_table(IDENTITY_TABLE, IDENTITY_COLUMNS)
+    index['player_id'] = index['player_id'].astype('Int64')
+    for col in IDENTITY_COLUMNS[1:]:
+        index[col] = index[col].astype(object).where(index[col].notna(), None)
+    return index
+
+
+def check_player_ids(storage):
+    """
+    Raises when players, depth_chart or injuries hold ids the identity index does not know. Those
+    rows were loaded with row-number ids; upserting identity ids next to them would leave a player
+    under two ids and old foreign keys pointing at the wrong player, so the tables are reloaded
+    from scratch with --reset-db instead.
+    """
+    has_index = storage.has_table(IDENTITY_TABLE)
+    for table in PLAYER_KEYED_TABLES:
+        if not storage.has_table(table):
+            continue
+        unknown = f"NOT EXISTS (SELECT 1 FROM {IDENTITY_TABLE} i WHERE i.player_id = t.player_id)" if has_index else "TRUE"
+        count = int(storage.read_sql(f"SELECT COUNT(*) AS n FROM {table} t WHERE {unknown}")['n'].iloc[0])
+        if count:
+            raise ValueError(f"{count} {table} rows use player ids from before the player identity index; "
+                             "rerun ingestion with --reset-db to reload them")
+
+
+def _lookup(keys, index_keys, index_ids):
+    """
+    player_id for each key through a hash table of the index keys that occur exactly once.
+    """
+    table = pd.Series(index_ids.values, index=index_keys.values)
+    table = table[table.index.notna()]
+    table = table[~table.index.duplicated(keep=False)]
+    return keys.map(table).astype('Int64')
+
+
+def _contradicts(frame, found, index):
+    """
+    Rows whose matched identity carries a different gsis id, sleeper id or birthdate than the row.
+    """
+    matched = index.set_index('player_id').reindex(found.values)
+    matched.index = frame.index
+    conflict = pd.Series(False, index=frame.index)
+    for col in ('gsis_id', 'sleeper_id', 'birthdate'):
+        conflict |= frame[col].notna() & matched[col].notna() & (frame[col] != matched[col])
+    return conflict
+
+
+def match_players(frame, index):
+    """
+    (player_id, step) for each row of a cleaned frame against the identity index. Every step is a
+    hash lookup over the rows still unresolved; ids are null and steps None where nothing matched.
+    """
+    ids = pd.Series(pd.NA, index=frame.index, dtype='Int64')
+    steps = pd.Series(None, index=frame.index, dtype=object)
+    frame_keys = pd.concat([frame[['gsis_id', 'sleeper_id']], name_keys(frame)], axis=1)
+    index_keys = pd.concat([index[['gsis_id', 'sleeper_id']], name_keys(index)], axis=1)
+    # Only names that are abbreviated to an initial are matched by initial; "Mike Davis" is not "Malik Davis"
+    frame_keys['initial_key'] = frame_keys['initial_key'].where(frame['name_key'].str.match(r'[a-z] '))
+    for step in RESOLUTION_STEPS:
+        pending = ids.isna() & frame_keys[step].notna()
+        if not pending.any():
+            continue
+        found = _lookup(frame_keys.loc[pending, step], index_keys[step], index['player_id'])
+        found = found[found.notna()]
+        if step in NAME_STEPS and not found.empty:
+            found = found[~_contradicts(frame.loc[found.index], found, index)]
+        ids.loc[found.index] = found
+        steps.loc[found.index] = step
+    rejected = _contested(frame, ids, steps)
+    ids[rejected] = pd.NA
+    steps[rejected] = None
+    return ids, steps
+
+
+def _contested(frame, ids, steps):
+    """
+    Name-matched rows whose identity another row of the same batch claims with a different GSIS or
+    Sleeper id ("Mike Thomas" and "Michael Thomas"); the claim of the strictest step wins.
+    """
+    order = steps.map({step: i for i, step in enumerate(RESOLUTION_STEPS)})
+    claims = frame.assign(player_id=ids, order=order)[ids.notna()].sort_values('order', kind='stable')
+    rejected = pd.Series(False, index=claims.index)
+    for col in ('gsis_id', 'sleeper_id'):
+        winner = claims.dropna(subset=[col]).groupby('player_id')[col].first()
+        claimed = claims['player_id'].map(winner)
+        rejected |= claims[col].notna() & claimed.notna() & (claims[col] != claimed)
+    rejected &= steps[claims.index].isin(NAME_STEPS)
+    return rejected.reindex(frame.index, fill_value=False)
+
+
+def _mint(frame, index):
+    """
+    New identities for the unmatched rows of frame, one per GSIS id, Sleeper id or name and
+    birthdate. Returns (player_id per row, new index rows).
+    """
+    identity = ('gsis:' + frame['gsis_id']).fillna('sleeper:' + frame['sleeper_id'])
+    identity = identity.fillna('name:' + frame['name_key'] + '|' + frame['birthdate'].fillna('').astype(str))
+    new = frame.assign(identity=identity).drop_duplicates('identity')
+
+    taken = set(index['player_id'].dropna().astype(int))
+    new_ids = gsis_number(new['gsis_id'])
+    clash = new_ids.isin(taken) | new_ids.duplicated(keep='first')
+    new_ids = new_ids.where(~clash)
+    next_id = max([MINTED_ID_START - 1] + [i for i in taken if i >= MINTED_ID_START]) + 1
+    missing = new_ids.isna()
+    new_ids.loc[missing] = list(range(next_id, next_id + int(missing.sum())))
+    new = new.assign(player_id=new_ids.astype('Int64').values)
+
+    ids = identity.map(pd.Series(new['player_id'].values, index=new['identity'].values)).astype('Int64')
+    return ids, new[IDENTITY_COLUMNS].reset_index(drop=True)
+
+
+def _enrich(frame, ids, index):
+    """
+    Index rows that gain a gsis id, Sleeper id, birthdate or position from the matched rows.
+    """
+    matched = frame[ids.notna()].assign(player_id=ids[ids.notna()])
+    if matched.empty:
+        return index.iloc[:0]
+    incoming = matched.groupby('player_id')[['gsis_id', 'sleeper_id', 'birthdate', 'position']].first()
+    current = index.set_index('player_id').loc[incoming.index]
+    # Never hand an id to a second identity
+    for col in ('gsis_id', 'sleeper_id'):
+        incoming.loc[incoming[col].isin(index[col].dropna()), col] = None
+    updated = current.combine_first(incoming)[current.columns]
+    changed = (updated.notna() != current.notna()).any(axis=1)
+    return updated[changed].reset_index()[IDENTITY_COLUMNS]
+
+
+def resolve_player_ids(storage, players, create=False, source='players') -> pd.Series:
+    """
+    Canonical player_id for each row of players, in bulk, through the persistent player_identity
+    index. players may carry gsis_id, sleeper_id, name, birthdate and position; rows are matched
+    by GSIS id, then Sleeper id, then name keys that tolerate suffixes, nicknames and initials.
+    With create, unmatched rows become new identities; otherwise they stay null and are reported.
+    Ids learned from matched rows are added to their identity, so later lookups are exact.
+    """
+    frame = _clean(players.reset_index(drop=True))
+    with _identity_lock:
+        index = load_identity_index(storage)
+        ids, steps = match_players(frame, index)
+        changes = [_enrich(frame, ids, index)]
+        unmatched = ids.isna()
+        if create and unmatched.any():
+            new_ids, new_rows = _mint(frame[unmatched], index)
+            ids[unmatched] = new_ids
+            steps[unmatched] = 'created'
+            changes.append(new_rows)
+        changes = [change for change in changes if not change.empty]
+        if changes:
+            storage.upsert(pd.concat(changes, ignore_index=True), IDENTITY_TABLE, keys=['player_id'],
+                           dtype=IDENTITY_COLUMN_TYPES)
+
+    counts = steps.value_counts()
+    summary = ', '.join(f"{step} {counts[step]}" for step in RESOLUTION_STEPS + ['created'] if step in counts)
+    print(f"Resolved {int(ids.notna().sum())} of {len(ids)} {source} rows to player ids ({summary or 'none'}).")
+    if ids.isna().any():
+        missing = list(frame.loc[ids.isna(), 'name'].dropna().unique()[:10])
+        logging.warning(f"{int(ids.isna().sum())} {source} rows match no known player" + (f", e.g. {missing}" if missing else ''))
+    ids.index = players.index
+    return ids
@@ -0,0 +1,62 @@
+import os
+import time
+import json
+import threading
+import pandas as pd
+from src.data_ingestion.http_cache import SOURCE_TTLS, cached_get
+
+SLEEPER_PLAYERS_URL = 'https://api.sleeper.app/v1/players/nfl'
+SNAPSHOT_PATH = 'data/raw/sleeper/players_nfl.parquet'
+# A snapshot younger than this is reused instead of downloading and parsing the payload again
+SNAPSHOT_MAX_AGE = SOURCE_TTLS['sleeper']
+
+# The only fields the players, depth chart and injuries loaders read; low-cardinality ones are categorical
+SNAPSHOT_COLUMNS = ['full_name', 'gsis_id', 'position', 'team', 'birth_date', 'depth_chart_position', 'injury_status']
+CATEGORICAL_COLUMNS = ['position', 'team', 'injury_status']
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def parse_players(payload: bytes) -> pd.DataFrame:
+    """
+    Sleeper players payload as a frame of SNAPSHOT_COLUMNS indexed by Sleeper player id, in payload order.
+    """
+    players = json.loads(payload)
+    df = pd.DataFrame(
+        {col: [player.get(col) for player in players.values()] for col in SNAPSHOT_COLUMNS},
+        index=pd.Index(list(players.keys()), name='sleeper_id')
+    )
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def fetch_sleeper_snapshot(path=SNAPSHOT_PATH, max_age=SNAPSHOT_MAX_AGE, refresh=False):
+    """
+    The Sleeper players snapshot, downloaded at most once per run. The parsed columns are kept
+    as a zstd parquet file at path, which later runs reuse while it is younger than max_age.
+    """
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is not None and not refresh:
+            return _snapshot
+        if not refresh and os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age:
+            snapshot = pd.read_parquet(path)
+            # Snapshots saved before a column was added to SNAPSHOT_COLUMNS are downloaded again
+            if list(snapshot.columns) == SNAPSHOT_COLUMNS:
+                _snapshot = snapshot
+                print(f"Loaded Sleeper snapshot of {len(_snapshot)} players from {path}.")
+                return _snapshot
+
+        print("Fetching players from Sleeper API...")
+        response = cached_get(SLEEPER_PLAYERS_URL, source='sleeper')
+        response.raise_for_status()
+        _snapshot = parse_players(response.content)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        _snapshot.to_parquet(tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        print(f"Saved Sleeper snapshot of {len(_snapshot)} players to {path}.")
+        return _snapshot
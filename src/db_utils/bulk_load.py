@@ -0,0 +1,262 @@
+import io
+import logging
+import pandas as pd
+from sqlalchemy import text
+
+DEFAULT_CHUNKSIZE = 50_000
+# Written for missing values so empty strings survive the round trip
+NULL_MARKER = '\\N'
+INTEGER_TYPES = {'smallint', 'integer', 'bigint', 'int', 'int2', 'int4', 'int8', 'serial', 'bigserial'}
+
+
+def postgres_type(series: pd.Series) -> str:
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return postgres_type(pd.Series(dtype.categories))
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return {1: 'SMALLINT', 2: 'SMALLINT', 4: 'INTEGER'}.get(dtype.itemsize, 'BIGINT')
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL' if dtype.itemsize == 4 else 'DOUBLE PRECISION'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    # Flags merged in with missing rows (weather's dome) are object columns of bools and None
+    if dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'boolean':
+        return 'BOOLEAN'
+    return 'TEXT'
+
+
+def _quote(identifier):
+    # Same quoting as to_sql, so mixed-case columns such as fantasy_points_allowed_QB keep their names
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _qualified(table):
+    return '.'.join(_quote(part) for part in table.split('.'))
+
+
+def _existing_column_types(conn, table):
+    schema, _, name = table.rpartition('.')
+    rows = conn.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_name = :name AND table_schema = COALESCE(NULLIF(:schema, ''), current_schema())"
+    ), {'name': name, 'schema': schema}).fetchall()
+    return {column: data_type for column, data_type in rows}
+
+
+def _prepare_chunk(chunk, column_types):
+    # Integer columns that picked up NaNs in a merge arrive as floats; COPY needs "12", not "12.0"
+    for col, pg_type in column_types.items():
+        if col in chunk.columns and pg_type.lower() in INTEGER_TYPES and pd.api.types.is_float_dtype(chunk[col].dtype):
+            chunk[col] = chunk[col].round().astype('Int64')
+    return chunk
+
+
+def bulk_load(df: pd.DataFrame, table, engine, if_exists='append', dtype=None, chunksize=DEFAULT_CHUNKSIZE,
+              partition_by=None):
+    """
+    Writes df to table by streaming CSV through COPY FROM STDIN, chunksize rows at a time, in a
+    single transaction. if_exists is 'append' (create the table only if it is missing), 'replace'
+    (drop and recreate it) or 'truncate' (empty it but keep its keys, indexes and dependent views).
+    Columns df has but an existing table lacks are added. Column types come from dtype
+    ({column: postgres type}), then the existing table, then the pandas dtypes.
+    A table created here is list-partitioned on partition_by when given; rows written to a
+    partitioned table are routed to their partitions, which are created as needed.
+    """
+    if if_exists not in ('append', 'replace', 'truncate'):
+        raise ValueError(f"Unsupported if_exists '{if_exists}' for bulk_load")
+    dtype = dtype or {}
+    columns = list(df.columns)
+    target = _qualified(table)
+
+    with engine.begin() as conn:
+        if if_exists == 'replace':
+            conn.execute(text(f"DROP TABLE IF EXISTS {target}"))
+            existing = {}
+        else:
+            existing = _existing_column_types(conn, table)
+
+        column_types = {col: dtype.get(col) or existing.get(col) or postgres_type(df[col]) for col in columns}
+        if not existing:
+            definition = ', '.join(f"{_quote(col)} {column_types[col]}" for col in columns)
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {target} ({definition}){_partition_clause(partition_by)}"))
+        else:
+            _add_missing_columns(conn, target, existing, column_types)
+            if if_exists == 'truncate':
+                conn.execute(text(f"TRUNCATE {target}"))
+
+        _ensure_partitions(conn, table, df)
+        _copy_rows(conn, df, target, column_types, chunksize)
+
+    logging.info(f"Bulk loaded {len(df)} rows into {table} ({if_exists}).")
+
+
+def _partition_clause(partition_by):
+    return f" PARTITION BY LIST ({_quote(partition_by)})" if partition_by else ''
+
+
+def _partition_column(conn, table):
+    """
+    Partition key column of a partitioned table, or None for a plain (or missing) table.
+    """
+    return conn.execute(text(
+        "SELECT a.attname FROM pg_partitioned_table p "
+        "JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0] "
+        "WHERE p.partrelid = to_regclass(:table)"
+    ), {'table': table}).scalar()
+
+
+def _partition_name(table, value):
+    return f"{table}_{int(value)}"
+
+
+def _ensure_partitions(conn, table, df):
+    # Seasons are small integer keys, so each one gets its own list partition (weekly_stats_2024, ...)
+    column = _partition_column(conn, table)
+    if column is None:
+        return
+    if df[column].isna().any():
+        raise ValueError(f"Rows without a {column} cannot be written to partitioned table {table}")
+    for value in sorted(int(v) for v in df[column].unique()):
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_qualified(_partition_name(table, value))} "
+            f"PARTITION OF {_qualified(table)} FOR VALUES IN ({value})"
+        ))
+
+
+def _add_missing_columns(conn, target, existing, column_types):
+    for col, pg_type in column_types.items():
+        if col not in existing:
+            conn.execute(text(f"ALTER TABLE {target} ADD COLUMN {_quote(col)} {pg_type}"))
+
+
+def _copy_rows(conn, df, target, column_types, chunksize):
+    copy_sql = (f"COPY {target} ({', '.join(_quote(col) for col in df.columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')")
+    cursor = conn.connection.cursor()
+    for start in range(0, len(df), chunksize):
+        chunk = _prepare_chunk(df.iloc[start:start + chunksize].copy(deep=False), column_types)
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, index=False, header=False, na_rep=NULL_MARKER)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+    cursor.close()
+
+
+def _has_unique_key(conn, table, keys):
+    schema, _, name = table.rpartition('.')
+    rows = conn.execute(text(
+        "SELECT array_agg(kcu.column_name::text) FROM information_schema.table_constraints tc "
+        "JOIN information_schema.key_column_usage kcu "
+        "ON kcu.constraint_schema = tc.constraint_schema AND kcu.constraint_name = tc.constraint_name "
+        "WHERE tc.table_name = :name AND tc.table_schema = COALESCE(NULLIF(:schema, ''), current_schema()) "
+        "AND tc.constraint_type IN ('PRIMARY KEY', 'UNIQUE') GROUP BY tc.constraint_name"
+    ), {'name': name, 'schema': schema}).fetchall()
+    return any(set(columns) == set(keys) for (columns,) in rows)
+
+
+def _delete_duplicate_keys(conn, target, keys):
+    # Tables loaded before upserts (replaced with to_sql) can repeat a key; the last physical row is kept
+    same_key = ' AND '.join(f"a.{_quote(k)} = b.{_quote(k)}" for k in keys)
+    deleted = conn.execute(text(f"DELETE FROM {target} a USING {target} b WHERE {same_key} AND a.ctid < b.ctid")).rowcount
+    if deleted:
+        logging.warning(f"Deleted {deleted} rows of {target} that repeated a key in ({', '.join(keys)}).")
+
+
+def upsert(df: pd.DataFrame, table, engine, keys, dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+    """
+    Merges df into table on its key columns: rows are copied into a temporary staging table, then
+    INSERT ... ON CONFLICT inserts new keys and updates existing rows only where a value changed.
+    The table, its keys, foreign keys and indexes are kept; it is created with a primary key on
+    keys (list-partitioned on partition_by when given) when missing, and columns df has but the
+    table lacks are added. Returns the number of rows inserted or updated.
+    """
+    keys = list(keys)
+    dtype = dtype or {}
+    # The last row wins when the frame repeats a key (ON CONFLICT cannot touch a row twice)
+    df = df.drop_duplicates(subset=keys, keep='last')
+    columns = list(df.columns)
+    target = _qualified(table)
+    staging = _quote(f"_stage_{table.replace('.', '_')}")
+
+    with engine.begin() as conn:
+        existing = _existing_column_types(conn, table)
+        column_types = {col: dtype.get(col) or existing.get(col) or postgres_type(df[col]) for col in columns}
+        if not existing:
+            definition = ', '.join(f"{_quote(col)} {column_types[col]}" for col in columns)
+            conn.execute(text(f"CREATE TABLE {target} ({definition}, PRIMARY KEY ({', '.join(_quote(k) for k in keys)}))"
+                              f"{_partition_clause(partition_by)}"))
+        else:
+            _add_missing_columns(conn, target, existing, column_types)
+            if not _has_unique_key(conn, table, keys):
+                index = f"{table.replace('.', '_')}_{'_'.join(keys)}_key"
+                schema = table.rpartition('.')[0]
+                index_ref = _qualified(f"{schema}.{index}" if schema else index)
+                if conn.execute(text("SELECT to_regclass(:index)"), {'index': index_ref}).scalar() is None:
+                    _delete_duplicate_keys(conn, target, keys)
+                    conn.execute(text(f"CREATE UNIQUE INDEX {_quote(index)} ON {target} ({', '.join(_quote(k) for k in keys)})"))
+
+        _ensure_partitions(conn, table, df)
+        staging_definition = ', '.join(f"{_quote(col)} {column_types[col]}" for col in columns)
+        conn.execute(text(f"CREATE TEMP TABLE {staging} ({staging_definition}) ON COMMIT DROP"))
+        _copy_rows(conn, df, staging, column_types, chunksize)
+
+        column_list = ', '.join(_quote(col) for col in columns)
+        updates = [col for col in columns if col not in keys]
+        if updates:
+            changed = (f"({', '.join(f't.{_quote(col)}' for col in updates)}) IS DISTINCT FROM "
+                       f"({', '.join(f'EXCLUDED.{_quote(col)}' for col in updates)})")
+            on_conflict = (f"DO UPDATE SET {', '.join(f'{_quote(col)} = EXCLUDED.{_quote(col)}' for col in updates)} "
+                           f"WHERE {changed}")
+        else:
+            on_conflict = "DO NOTHING"
+        result = conn.execute(text(
+            f"INSERT INTO {target} AS t ({column_list}) SELECT {column_list} FROM {staging} "
+            f"ON CONFLICT ({', '.join(_quote(k) for k in keys)}) {on_conflict}"
+        ))
+        changed_rows = result.rowcount
+
+    logging.info(f"Upserted {table}: {changed_rows} of {len(df)} rows inserted or changed.")
+    return changed_rows
+
+
+def swap_partitions(df: pd.DataFrame, table, engine, partition_by='season', dtype=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Replaces, for every season in df, that season's partition of table with df's rows. Each
+    season is copied into a new table off to the side and swapped in with DETACH/ATTACH PARTITION,
+    so other seasons are never touched and readers see the old season until the commit. The
+    table is created list-partitioned on partition_by when missing.
+    """
+    dtype = dtype or {}
+    columns = list(df.columns)
+    target = _qualified(table)
+
+    with engine.begin() as conn:
+        existing = _existing_column_types(conn, table)
+        column_types = {col: dtype.get(col) or existing.get(col) or postgres_type(df[col]) for col in columns}
+        if not existing:
+            definition = ', '.join(f"{_quote(col)} {column_types[col]}" for col in columns)
+            conn.execute(text(f"CREATE TABLE {target} ({definition}){_partition_clause(partition_by)}"))
+        else:
+            _add_missing_columns(conn, target, existing, column_types)
+        column = _partition_column(conn, table)
+        if column is None:
+            raise ValueError(f"{table} is not partitioned; apply the migrations before swapping its partitions")
+        if df[column].isna().any():
+            raise ValueError(f"Rows without a {column} cannot be written to partitioned table {table}")
+
+        for value, part_df in df.groupby(column, sort=True):
+            partition = _partition_name(table, value)
+            incoming = f"{partition}_incoming"
+            conn.execute(text(f"CREATE TABLE {_qualified(incoming)} (LIKE {target} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            # Matches the partition bound, so ATTACH can skip scanning the new rows to check them
+            conn.execute(text(f"ALTER TABLE {_qualified(incoming)} ADD CHECK ({_quote(column)} IS NOT NULL AND {_quote(column)} = {int(value)})"))
+            _copy_rows(conn, part_df, _qualified(incoming), column_types, chunksize)
+
+            if conn.execute(text("SELECT to_regclass(:partition)"), {'partition': partition}).scalar() is not None:
+                conn.execute(text(f"ALTER TABLE {target} DETACH PARTITION {_qualified(partition)}"))
+                conn.execute(text(f"DROP TABLE {_qualified(partition)}"))
+            conn.execute(text(f"ALTER TABLE {_qualified(incoming)} RENAME TO {_quote(partition.rpartition('.')[2])}"))
+            conn.execute(text(f"ALTER TABLE {target} ATTACH PARTITION {_qualified(partition)} FOR VALUES IN ({int(value)})"))
+            logging.info(f"Swapped {len(part_df)} rows into {partition}.")
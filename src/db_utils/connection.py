@@ -0,0 +1,88 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+# Pool settings, overridable through the environment or configure_engine() before first use
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 1800
+# 0 disables the server-side statement timeout
+DEFAULT_STATEMENT_TIMEOUT_MS = 0
+
+_engine = None
+_engine_lock = threading.Lock()
+_overrides = {}
+
+
+def database_url():
+    load_dotenv()
+    return f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+
+
+def _setting(name, env_var, default):
+    if name in _overrides:
+        return _overrides[name]
+    return int(os.getenv(env_var, default))
+
+
+def configure_engine(pool_size=None, max_overflow=None, statement_timeout_ms=None, pool_recycle=None):
+    """
+    Overrides pool settings for the shared engine. An engine that was already created is disposed,
+    so the next get_engine() call builds one with the new settings.
+    """
+    settings = {'pool_size': pool_size, 'max_overflow': max_overflow,
+                'statement_timeout_ms': statement_timeout_ms, 'pool_recycle': pool_recycle}
+    _overrides.update({name: value for name, value in settings.items() if value is not None})
+    dispose_engine()
+
+
+def get_engine():
+    """
+    Process-wide pooled engine, created on first use. Connections are pre-pinged so stale ones are
+    replaced transparently, and DB_STATEMENT_TIMEOUT_MS (when set) bounds every statement.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                load_dotenv()
+                connect_args = {}
+                timeout = _setting('statement_timeout_ms', 'DB_STATEMENT_TIMEOUT_MS', DEFAULT_STATEMENT_TIMEOUT_MS)
+                if timeout:
+                    connect_args['options'] = f'-c statement_timeout={timeout}'
+                _engine = create_engine(
+                    database_url(),
+                    pool_size=_setting('pool_size', 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+                    max_overflow=_setting('max_overflow', 'DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+                    pool_recycle=_setting('pool_recycle', 'DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE),
+                    pool_pre_ping=True,
+                    connect_args=connect_args,
+                )
+    return _engine
+
+
+def dispose_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+@contextmanager
+def session_scope():
+    """
+    Session on the shared engine that commits on success and rolls back on error.
+    """
+    session = Session(get_engine())
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+from src.data_ingestion.sleeper_snapshot import SNAPSHOT_MAX_AGE, SNAPSHOT_PATH, fetch_sleeper_snapshot
+from src.data_ingestion.fetch_sleeper_players import fetch_sleeper_players
+from src.data_ingestion.fetch_sleeper_depth_chart import fetch_sleeper_depth_chart
+from src.data_ingestion.fetch_sleeper_injuries import fetch_sleeper_injuries
+from src.data_ingestion.nflfastr_files import NFLFASTR_DIR, download_seasons, file_sha256, load_manifest
+from src.data_ingestion.fetch_nflfastr import fetch_nflfastr
+from src.data_ingestion.fetch_schedule import fetch_schedule_for_seasons
+from src.data_ingestion.export_player_weekly_stats import fetch_and_store_weekly_stats
+from src.data_ingestion.fetch_weather import fetch_weather_historic
+
+INGESTION_STATE_PATH = 'data/cache/ingestion_state.json'
+DAILY = 24 * 3600
+
+# name -> {'fn', 'inputs', 'outputs', 'max_age', 'version', 'optional'}, in registration order
+INGESTION_STAGES = {}
+
+
+def ingestion_stage(name, inputs=(), outputs=(), max_age=None, version=None, optional=False):
+    """
+    Registers an ingestion stage. fn(ctx) loads the stage's outputs (tables or files) from its
+    inputs, which other stages produce. A stage is skipped while the versions of its inputs and
+    the run parameters match its last successful run and, when max_age is set, that run is
+    younger than max_age seconds. version(ctx), when given, fingerprints the outputs after a run
+    so downstream stages only rerun when the content actually changed; otherwise every run counts
+    as a change. optional stages only run when requested.
+    """
+    def register(fn):
+        INGESTION_STAGES[name] = {'fn': fn, 'inputs': list(inputs), 'outputs': list(outputs),
+                                  'max_age': max_age, 'version': version, 'optional': optional}
+        return fn
+    return register
+
+
+def resolve_stages(include_optional=()):
+    """
+    {name: set of upstream stage names} for every non-optional stage plus the requested optional
+    ones. Stages writing the same output run one after another, in registration order.
+    """
+    selected = [name for name, stage in INGESTION_STAGES.items() if not stage['optional'] or name in include_optional]
+    unknown = set(include_optional) - set(INGESTION_STAGES)
+    if unknown:
+        raise KeyError(f"Unknown ingestion stages {sorted(unknown)}")
+    producers = {}
+    deps = {}
+    for name in selected:
+        stage = INGESTION_STAGES[name]
+        deps[name] = {producer for resource in stage['inputs'] for producer in producers.get(resource, [])}
+        deps[name] |= {producer for resource in stage['outputs'] for producer in producers.get(resource, [])}
+        for resource in stage['outputs']:
+            producers.setdefault(resource, []).append(name)
+    missing = {resource for name in selected for resource in INGESTION_STAGES[name]['inputs']} - set(producers)
+    if missing:
+        raise ValueError(f"No stage produces {sorted(missing)}")
+    return deps
+
+
+def load_ingestion_state(path=INGESTION_STATE_PATH):
+    if not os.path.exists(path):
+        return {'stages': {}, 'versions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_ingestion_state(state, path=INGESTION_STATE_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _signature(name, ctx, versions):
+    stage = INGESTION_STAGES[name]
+    params = {key: ctx[key] for key in ('start_year', 'end_year')}
+    return {'params': params, 'inputs': {resource: versions.get(resource) for resource in stage['inputs']}}
+
+
+def _is_fresh(name, ctx, state):
+    previous = state['stages'].get(name)
+    if ctx.get('force') or previous is None:
+        return False
+    max_age = INGESTION_STAGES[name]['max_age']
+    if max_age is not None and time.time() - previous['finished_at'] > max_age:
+        return False
+    return previous['signature'] == _signature(name, ctx, state['versions'])
+
+
+def run_ingestion_dag(ctx, include_optional=(), max_workers=4, state_path=INGESTION_STATE_PATH):
+    """
+    Runs every ingestion stage whose inputs or sources changed, independent stages concurrently,
+    so a full run takes about as long as its critical path. ctx carries storage, start_year,
+    end_year and force (rerun every stage). Stages downstream of a failed stage are not run; the
+    failures are raised together at the end, after the timing summary.
+    """
+    deps = resolve_stages(include_optional)
+    state = load_ingestion_state(state_path)
+    results = {}
+    running = {}
+    started = {}
+    dag_start = time.time()
+
+    def finish(name, status, seconds=0.0):
+        results[name] = {'status': status, 'seconds': seconds}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(results) < len(deps):
+            # Skipped and blocked stages settle immediately, which can make further stages ready
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in deps:
+                    if name in results or name in running.values() or not deps[name] <= set(results):
+                        continue
+                    progressed = True
+                    if any(results[upstream]['status'] in ('failed', 'blocked') for upstream in deps[name]):
+                        finish(name, 'blocked')
+                    elif _is_fresh(name, ctx, state):
+                        finish(name, 'skipped')
+                    else:
+                        signature = _signature(name, ctx, state['versions'])
+                        running[pool.submit(INGESTION_STAGES[name]['fn'], ctx)] = name
+                        started[name] = (time.time(), signature)
+            if len(results) == len(deps):
+                break
+            if not running:
+                raise ValueError(f"Ingestion stages have a dependency cycle: {sorted(set(deps) - set(results))}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                start, signature = started[name]
+                stage = INGESTION_STAGES[name]
+                try:
+                    future.result()
+                    version = stage['version'](ctx) if stage['version'] else uuid.uuid4().hex
+                except Exception as e:
+                    logging.exception(f"Ingestion stage '{name}' failed: {e}")
+                    finish(name, 'failed', time.time() - start)
+                    continue
+                for resource in stage['outputs']:
+                    state['versions'][resource] = version
+                state['stages'][name] = {'signature': signature, 'finished_at': time.time(),
+                                         'finished': datetime.datetime.now().isoformat(timespec='seconds')}
+                save_ingestion_state(state, state_path)
+                finish(name, 'ran', time.time() - start)
+                print(f"Ingestion stage '{name}' ran in {time.time() - start:.1f}s")
+
+    print_stage_summary(results, deps, time.time() - dag_start)
+    failed = [name for name, result in results.items() if result['status'] == 'failed']
+    if failed:
+        raise RuntimeError(f"Ingestion stages failed: {failed}")
+    return results
+
+
+def _critical_path(results, deps):
+    longest = {}
+    for name in deps:
+        pending = [name]
+        while pending:
+            current = pending[-1]
+            waiting = [upstream for upstream in deps[current] if upstream not in longest]
+            if waiting:
+                pending.extend(waiting)
+                continue
+            pending.pop()
+            longest[current] = results[current]['seconds'] + max((longest[up] for up in deps[current]), default=0.0)
+    return max(longest.values(), default=0.0)
+
+
+def print_stage_summary(results, deps, wall_seconds):
+    print("\nIngestion stage summary:")
+    for name in deps:
+        result = results[name]
+        print(f"  {name:<18} {result['status']:<8} {result['seconds']:7.1f}s")
+    total = sum(result['seconds'] for result in results.values())
+    print(f"  wall {wall_seconds:.1f}s, sum of stages {total:.1f}s, critical path {_critical_path(results, deps):.1f}s")
+
+
+def _frame_digest(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def _nflfastr_version(ctx):
+    manifest = load_manifest(NFLFASTR_DIR)
+    seasons = range(ctx['start_year'], ctx['end_year'] + 1)
+    return hashlib.sha256(json.dumps({season: manifest.get(season, {}).get('sha256') for season in seasons}).encode()).hexdigest()
+
+
+# --- Ingestion stages ---
+
+@ingestion_stage('sleeper_snapshot', outputs=['sleeper_snapshot'], max_age=SNAPSHOT_MAX_AGE,
+                 version=lambda ctx: file_sha256(SNAPSHOT_PATH))
+def sleeper_snapshot_stage(ctx):
+    ctx['sleeper_snapshot'] = fetch_sleeper_snapshot()
+
+
+# Every stage that can add players to the identity index lists it as an output, so they run in turn
+@ingestion_stage('players', inputs=['sleeper_snapshot'], outputs=['teams', 'players', 'player_identity'])
+def players_stage(ctx):
+    fetch_sleeper_players(ctx['storage'], snapshot=ctx.get('sleeper_snapshot'))
+
+
+@ingestion_stage('depth_chart', inputs=['sleeper_snapshot', 'teams', 'players'], outputs=['depth_chart'])
+def depth_chart_stage(ctx):
+    fetch_sleeper_depth_chart(ctx['storage'], snapshot=ctx.get('sleeper_snapshot'))
+
+
+@ingestion_stage('injuries', inputs=['sleeper_snapshot', 'players'], outputs=['injuries'])
+def injuries_stage(ctx):
+    fetch_sleeper_injuries(ctx['storage'], snapshot=ctx.get('sleeper_snapshot'))
+
+
+# The download manager revalidates the current season, so a daily run picks up weekly refreshes
+@ingestion_stage('nflfastr_files', outputs=['nflfastr_files'], max_age=DAILY, version=_nflfastr_version)
+def nflfastr_files_stage(ctx):
+    download_seasons(range(ctx['start_year'], ctx['end_year'] + 1), NFLFASTR_DIR)
+
+
+@ingestion_stage('nflfastr', inputs=['nflfastr_files', 'players'], outputs=['weekly_stats_summary', 'player_identity'])
+def nflfastr_stage(ctx):
+    fetch_nflfastr(ctx['start_year'], ctx['end_year'], ctx['storage'], force=ctx.get('force', False), download=False)
+
+
+@ingestion_stage('weekly_stats', inputs=['nflfastr_files', 'teams'], outputs=['weekly_stats', 'player_identity'])
+def weekly_stats_stage(ctx):
+    fetch_and_store_weekly_stats(ctx['storage'], start_year=ctx['start_year'], end_year=ctx['end_year'],
+                                 parquet_folder=NFLFASTR_DIR, force=ctx.get('force', False))
+
+
+@ingestion_stage('schedule', inputs=['teams'], outputs=['games'], max_age=DAILY,
+                 version=lambda ctx: _frame_digest(ctx['storage'].read_sql(
+                     'SELECT season, week, stadium, game_date FROM games ORDER BY season, game_id')))
+def schedule_stage(ctx):
+    fetch_schedule_for_seasons(start_year=ctx['start_year'], end_year=ctx['end_year'], storage=ctx['storage'])
+
+
+@ingestion_stage('weather', inputs=['games'], outputs=['weather'], optional=True)
+def weather_stage(ctx):
+    fetch_weather_historic(ctx['storage'])
@@ -1,20 +1,8 @@
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-
-# Load environment variables from .env file
-load_dotenv()
-
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-DATABASE_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+from sqlalchemy import text
+from src.db_utils.connection import get_engine
 
 def initialize_postgres_schema(sql_file_path: str):
-    engine = create_engine(DATABASE_URL)
+    engine = get_engine()
     with engine.begin() as connection:
         with open(sql_file_path, 'r') as sql_file:
             sql_script = sql_file.read()
@@ -0,0 +1,77 @@
+import os
+import re
+import hashlib
+import logging
+from sqlalchemy import text
+from src.db_utils.connection import get_engine
+
+MIGRATIONS_DIR = 'sql/migrations'
+MIGRATIONS_TABLE = 'schema_migrations'
+# 0001_position_feature_views.sql -> version 1, name position_feature_views
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """
+    (version, name, path) for every migration file in the directory, in version order.
+    """
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _checksum(sql):
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+def applied_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, checksum TEXT NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        rows = conn.execute(text(f"SELECT version, checksum FROM {MIGRATIONS_TABLE}")).fetchall()
+    return {version: checksum for version, checksum in rows}
+
+
+def apply_migrations(engine, directory=MIGRATIONS_DIR):
+    """
+    Runs every migration in the directory that has not been applied yet, in version order, each in
+    its own transaction together with its schema_migrations record. A migration that was edited
+    after it was applied raises instead of being re-run; add a new version instead.
+    Returns the versions applied.
+    """
+    applied = applied_migrations(engine)
+    newly_applied = []
+    for version, name, path in list_migrations(directory):
+        with open(path, 'r') as f:
+            sql = f.read()
+        checksum = _checksum(sql)
+        if version in applied:
+            if applied[version] != checksum:
+                raise ValueError(f"Migration {os.path.basename(path)} changed after it was applied")
+            continue
+
+        logging.info(f"Applying migration {os.path.basename(path)}")
+        with engine.begin() as conn:
+            conn.execute(text(sql))
+            conn.execute(
+                text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, checksum) VALUES (:version, :name, :checksum)"),
+                {'version': version, 'name': name, 'checksum': checksum}
+            )
+        newly_applied.append(version)
+
+    logging.info(f"Applied {len(newly_applied)} migrations from {directory}.")
+    return newly_applied
+
+
+if __name__ == "__main__":
+    apply_migrations(get_engine())
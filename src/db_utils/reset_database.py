@@ -1,18 +1,19 @@
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
-import os
+from sqlalchemy import text
 
-def reset_database(engine):
-    # Schema SQL
-    schema_sql = """
+# Drops and re-creates the ingestion tables; DuckDBStorage.reset creates the same tables and keys
+SCHEMA_SQL = """
     -- Drop tables in dependency order for safe resets
     DROP TABLE IF EXISTS weekly_stats;
+    DROP TABLE IF EXISTS weekly_stats_summary;
     DROP TABLE IF EXISTS depth_chart;
     DROP TABLE IF EXISTS injuries;
     DROP TABLE IF EXISTS players;
-    DROP TABLE IF EXISTS teams;
+    DROP TABLE IF EXISTS player_identity;
     DROP TABLE IF EXISTS games;
+    DROP TABLE IF EXISTS teams;
     DROP TABLE IF EXISTS weather;
+    DROP TABLE IF EXISTS offensive_line_rankings;
+    DROP TABLE IF EXISTS defensive_unit_rankings;
 
     -- ---------------------------
     -- Teams Table
@@ -30,9 +31,26 @@ def reset_database(engine):
         player_id SERIAL PRIMARY KEY,
         name VARCHAR NOT NULL,
         position VARCHAR(10),
-        team_id INT REFERENCES teams(team_id)
+        team_id INT REFERENCES teams(team_id),
+        birthdate VARCHAR
     );
 
+    -- ---------------------------
+    -- Player Identity Table
+    -- ---------------------------
+    -- One row per canonical player_id with the ids and name keys it is known by
+    CREATE TABLE player_identity (
+        player_id INT PRIMARY KEY,
+        gsis_id VARCHAR,
+        sleeper_id VARCHAR,
+        name VARCHAR,
+        name_key VARCHAR,
+        birthdate VARCHAR,
+        position VARCHAR
+    );
+    CREATE INDEX player_identity_gsis_idx ON player_identity (gsis_id);
+    CREATE INDEX player_identity_sleeper_idx ON player_identity (sleeper_id);
+
     -- ---------------------------
     -- Depth Chart Table
     -- ---------------------------
@@ -48,51 +66,46 @@ def reset_database(engine):
     -- Injuries Table
     -- ---------------------------
     CREATE TABLE injuries (
-        player_id INT REFERENCES players(player_id),
-        week INT NOT NULL,
-        status VARCHAR(20),
-        PRIMARY KEY (player_id, week)
-    );
-
-    -- ---------------------------
-    -- Weekly Stats Table
-    -- ---------------------------
-    CREATE TABLE weekly_stats (
         player_id INT REFERENCES players(player_id),
         season INT NOT NULL,
         week INT NOT NULL,
-        passing_yards FLOAT,
-        rushing_yards FLOAT,
-        receiving_yards FLOAT,
-        touchdowns FLOAT,
-        fantasy_points FLOAT,
+        injury_status VARCHAR(20),
         PRIMARY KEY (player_id, season, week)
     );
 
     -- ---------------------------
     -- Games Table
     -- ---------------------------
+    -- game_id is the ESPN event id, so schedule re-ingestion upserts on it.
+    -- weekly_stats, games and weather are list-partitioned by season; the loaders
+    -- create one partition per season (games_2024, ...) as rows for it arrive
     CREATE TABLE games (
-        game_id SERIAL PRIMARY KEY,
-        season INT,
+        game_id INT NOT NULL,
+        season INT NOT NULL,
         week INT,
         home_team VARCHAR(50),
         away_team VARCHAR(50),
         stadium VARCHAR(100),
         game_date DATE,
         home_team_id INT REFERENCES teams(team_id),
-        away_team_id INT REFERENCES teams(team_id)
-    );
+        away_team_id INT REFERENCES teams(team_id),
+        PRIMARY KEY (season, game_id)
+    ) PARTITION BY LIST (season);
 
     -- ---------------------------
     -- Weekly Stats Table (for fantasy points, targets, carries, snaps)
+    -- player_id is the numeric part of the nflverse id; ingestion upserts on
+    -- (player_id, season, week) and adds any further nflfastr columns it writes
     -- ---------------------------
-    CREATE TABLE IF NOT EXISTS weekly_stats (
-        weekly_stats_id SERIAL PRIMARY KEY,
-        player_name VARCHAR NOT NULL,
+    CREATE TABLE weekly_stats (
+        player_id INT NOT NULL,
+        season INT NOT NULL,
+        week INT NOT NULL,
+        player_name VARCHAR,
         player_display_name VARCHAR,
         position VARCHAR(10),
-        team_abbreviation VARCHAR(10) NOT NULL,
+        team_abbreviation VARCHAR(10),
+        team_id INT REFERENCES teams(team_id),
         opponent_team VARCHAR(10),
         attempts INT,
         completions INT,
@@ -106,22 +119,39 @@ def reset_database(engine):
         receiving_yards FLOAT,
         receiving_tds INT,
         target_share FLOAT,
-        fantasy_points FLOAT
-    );
+        fantasy_points FLOAT,
+        PRIMARY KEY (player_id, season, week)
+    ) PARTITION BY LIST (season);
+
+    -- ---------------------------
+    -- Weekly Stats Summary Table
+    -- ---------------------------
+    -- nflfastr yardage, touchdowns and PPR points; weekly_stats keeps the standard points
+    CREATE TABLE weekly_stats_summary (
+        player_id INT NOT NULL,
+        season INT NOT NULL,
+        week INT NOT NULL,
+        passing_yards FLOAT,
+        rushing_yards FLOAT,
+        receiving_yards FLOAT,
+        touchdowns FLOAT,
+        fantasy_points_ppr FLOAT,
+        PRIMARY KEY (player_id, season, week)
+    ) PARTITION BY LIST (season);
 
     -- ---------------------------
     -- Weather Table
     -- ---------------------------
+    -- Refetching a season swaps in a new weather_<season> partition
     CREATE TABLE IF NOT EXISTS weather (
-        weather_id SERIAL PRIMARY KEY,
-        season INT,
+        season INT NOT NULL,
         week INT,
         stadium VARCHAR,
         temperature FLOAT,
         precipitation FLOAT,
         wind_speed FLOAT,
         dome BOOLEAN
-    );
+    ) PARTITION BY LIST (season);
 
     -- ---------------------------
     -- Offensive Line Rankings Table
@@ -150,7 +180,9 @@ def reset_database(engine):
         );
     """
 
-    # Execute the schema reset
-    with engine.connect() as conn:
-        conn.execute(text(schema_sql))
+
+def reset_database(engine):
+    # Execute the schema reset in one committed transaction
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_SQL))
         print("PostgreSQL schema has been reset and re-created.")
\ No newline at end of file
@@ -1,26 +1,63 @@
-import os
 import logging
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from src.db_utils.migrations import MIGRATIONS_DIR, apply_migrations
 
-def apply_sql_scripts(engine, directory):
-    logging.info(f"Applying SQL scripts from: {directory}")
-    sql_files = sorted([
-        os.path.join(directory, f)
-        for f in os.listdir(directory)
-        if f.endswith('.sql')
-    ])
+# Materialized views over the features table, created by sql/migrations
+POSITION_VIEWS = ['qb_features', 'rb_features', 'wr_features', 'te_features']
 
+
+def refresh_position_views(engine, concurrently=True):
+    """
+    Refreshes the per-position materialized views from the features table. A concurrent refresh
+    keeps the old rows readable until the new ones are in place; it needs the views' unique indexes
+    and a populated view, so a plain refresh is used otherwise.
+    """
+    with engine.begin() as conn:
+        for view in POSITION_VIEWS:
+            populated = conn.execute(
+                text("SELECT ispopulated FROM pg_matviews WHERE matviewname = :view"), {'view': view}
+            ).scalar()
+            if populated is None:
+                raise ValueError(f"Materialized view {view} does not exist; run apply_migrations first")
+            mode = 'CONCURRENTLY ' if concurrently and populated else ''
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{view}"))
+            logging.info(f"Refreshed {view}{' concurrently' if mode else ''}.")
+
+
+def _relation_columns(conn, relation):
+    return conn.execute(text(
+        "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = to_regclass(:relation) AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+    ), {'relation': relation}).fetchall()
+
+
+def recreate_stale_position_views(engine):
+    """
+    SELECT * is expanded when a view is created, so feature columns that bulk_load later adds to
+    features (or retypes) never reach the position views. Views whose columns differ from the
+    features table are dropped and created again, with their unique index. Returns their names.
+    """
+    recreated = []
     with engine.begin() as conn:
-        for file_path in sql_files:
-            logging.info(f"⏳ Running: {os.path.basename(file_path)}")
-            with open(file_path, 'r') as f:
-                sql = f.read()
-                try:
-                    conn.execute(text(sql))
-                    logging.info(f"Success: {os.path.basename(file_path)}")
-                except Exception as e:
-                    logging.error(f"Error in {os.path.basename(file_path)}: {e}")
-                    raise
-
-def reset_views_and_indexes(engine):
-    apply_sql_scripts(engine, "sql/views")
+        features = _relation_columns(conn, 'features')
+        for view in POSITION_VIEWS:
+            if _relation_columns(conn, view) == features:
+                continue
+            position = view.split('_')[0].upper()
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {view}"))
+            conn.execute(text(f"CREATE MATERIALIZED VIEW {view} AS SELECT * FROM features WHERE position = '{position}'"))
+            conn.execute(text(f"CREATE UNIQUE INDEX {view}_season_week_player_idx ON {view} (season, week, player_id)"))
+            recreated.append(view)
+    if recreated:
+        logging.warning(f"Recreated position views {recreated} to pick up new feature columns.")
+    return recreated
+
+
+def reset_views_and_indexes(engine, directory=MIGRATIONS_DIR):
+    """
+    Brings the views and indexes up to the latest migration, recreates position views that lag
+    behind the features table's columns and refreshes the rest.
+    """
+    apply_migrations(engine, directory)
+    recreate_stale_position_views(engine)
+    refresh_position_views(engine)
@@ -1,47 +1,37 @@
-import subprocess
 import os
 import argparse
-import pandas as pd
 import datetime
-import requests
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-from src.db_utils.reset_database import reset_database
-from src.data_ingestion.fetch_sleeper_players import fetch_sleeper_players
-from src.data_ingestion.fetch_sleeper_depth_chart import fetch_sleeper_depth_chart
-from src.data_ingestion.fetch_nflfastr import fetch_nflfastr
-from src.data_ingestion.fetch_sleeper_injuries import fetch_sleeper_injuries
-from src.data_ingestion.fetch_schedule import fetch_schedule_for_seasons
-from src.data_ingestion.export_player_weekly_stats import fetch_and_store_weekly_stats
-from src.data_ingestion.fetch_weather import fetch_weather_historic
+from src.db_utils.storage import get_storage
+from src.db_utils.ingestion_dag import INGESTION_STATE_PATH, run_ingestion_dag
+from src.data_ingestion.player_identity import check_player_ids
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 
-def main(start_year = datetime.datetime.now().year - 4, end_year = datetime.datetime.now().year, reset_db=False, fetch_weather_historic = False):
-    load_dotenv()
-    DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(DATABASE_URL)
+def main(start_year = datetime.datetime.now().year - 4, end_year = datetime.datetime.now().year, reset_db=False, fetch_weather_historic = False, force=False, max_workers=4):
+    storage = get_storage()
 
     if reset_db:
-        reset_database(engine)
-
-    fetch_sleeper_players(engine)
-    fetch_sleeper_depth_chart(engine)
-    fetch_nflfastr(start_year = start_year, end_year = end_year, engine = engine)
-    fetch_sleeper_injuries(engine)
-    fetch_schedule_for_seasons(start_year=start_year, end_year=end_year, engine=engine)
-    fetch_and_store_weekly_stats(engine, start_year=start_year, end_year=end_year, parquet_folder = 'data/raw/nflfastr/')
-
-    if fetch_weather_historic:
-        fetch_weather_historic(engine)
+        storage.reset()
+        # A reset database needs every stage again, whatever the last run loaded
+        if os.path.exists(INGESTION_STATE_PATH):
+            os.remove(INGESTION_STATE_PATH)
+    else:
+        check_player_ids(storage)
+
+    # Stages run as a dependency graph: independent fetchers run concurrently and stages whose
+    # inputs and sources are unchanged since their last run are skipped
+    ctx = {'storage': storage, 'start_year': start_year, 'end_year': end_year, 'force': force or reset_db}
+    run_ingestion_dag(ctx, include_optional=['weather'] if fetch_weather_historic else [], max_workers=max_workers)
 
     print("Data ingestion pipeline completed successfully!")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run data ingestion pipeline.")
     parser.add_argument("--reset-db", action="store_true", help="Reset PostgreSQL schema before ingestion")
-    parser.add_argument('--fetch-weather-historic', action="store_false", help="Fetch historic weather data")
+    parser.add_argument('--fetch-weather-historic', action="store_true", help="Fetch historic weather data")
+    parser.add_argument("--force", action="store_true", help="Rerun every stage, even those whose inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=4, help="Stages run concurrently")
     args = parser.parse_args()
 
-    main(reset_db=args.reset_db)
\ No newline at end of file
+    main(reset_db=args.reset_db, fetch_weather_historic=args.fetch_weather_historic, force=args.force, max_workers=args.workers)
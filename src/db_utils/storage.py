@@ -0,0 +1,304 @@
+import os
+import re
+import logging
+import threading
+from abc import ABC, abstractmethod
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+from sqlalchemy import text
+from src.db_utils.connection import get_engine
+from src.db_utils.bulk_load import DEFAULT_CHUNKSIZE, bulk_load, postgres_type, swap_partitions, upsert
+from src.db_utils.migrations import apply_migrations
+from src.db_utils.reset_database import SCHEMA_SQL, reset_database
+from src.db_utils.reset_views import POSITION_VIEWS, reset_views_and_indexes
+
+# 'postgres' (default) or 'duckdb'; the DuckDB backend keeps every table in one local file
+STORAGE_BACKEND = 'postgres'
+DUCKDB_PATH = 'data/warehouse.duckdb'
+
+_storage = None
+_storage_lock = threading.Lock()
+
+# :name parameters, but not :: casts
+NAMED_PARAM = re.compile(r'(?<![:\w]):(\w+)')
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _duckdb_schema(schema_sql=SCHEMA_SQL):
+    """
+    The CREATE statements of the Postgres schema with the same columns and keys in DuckDB's
+    dialect: no season partitions, plain integers for serial ids, and no foreign keys, since
+    DuckDB rejects upserts into rows another table references (players from depth_chart).
+    """
+    statements = []
+    # Statements end a line; comments can hold semicolons mid-line
+    for statement in re.split(r';[ \t]*(?:\n|$)', schema_sql):
+        body = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+        if not body.upper().startswith('CREATE'):
+            continue
+        body = re.sub(r'\bSERIAL\b', 'INTEGER', body)
+        body = re.sub(r'\s*REFERENCES \w+\s*\(\w+\)', '', body)
+        statements.append(re.sub(r'\s*PARTITION BY LIST \(\w+\)\s*$', '', body))
+    return statements
+
+
+class StorageBackend(ABC):
+    """
+    Table storage used by ingestion, features and predictions. Queries use :name parameters on
+    every backend, and tables written through bulk_load/upsert/swap_partitions get the same
+    columns and keys on every backend.
+    """
+    name = None
+
+    @abstractmethod
+    def read_sql(self, query, params=None) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def execute(self, sql, params=None):
+        ...
+
+    def read_table(self, table, columns=None, where=None, params=None) -> pd.DataFrame:
+        """
+        Reads only the given columns of table, filtered by the optional where clause.
+        """
+        projection = ', '.join(columns) if columns else '*'
+        query = f"SELECT {projection} FROM {table}" + (f" WHERE {where}" if where else '')
+        return self.read_sql(query, params)
+
+    def has_table(self, table) -> bool:
+        found = self.read_sql("SELECT count(*) AS n FROM information_schema.tables WHERE table_name = :table",
+                              {'table': table})
+        return bool(found['n'].iloc[0])
+
+    @abstractmethod
+    def bulk_load(self, df, table, if_exists='append', dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        ...
+
+    @abstractmethod
+    def upsert(self, df, table, keys, dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        ...
+
+    @abstractmethod
+    def swap_partitions(self, df, table, partition_by='season', dtype=None, chunksize=DEFAULT_CHUNKSIZE):
+        ...
+
+    @abstractmethod
+    def refresh_views(self):
+        ...
+
+    @abstractmethod
+    def reset(self):
+        ...
+
+
+class PostgresStorage(StorageBackend):
+    name = 'postgres'
+
+    def __init__(self, engine=None):
+        self.engine = engine or get_engine()
+        # Ingestion swaps season partitions and upserts on keys that the migrations set up on an
+        # existing database, so pending migrations run before anything is written
+        apply_migrations(self.engine)
+
+    def read_sql(self, query, params=None):
+        return pd.read_sql(text(query), self.engine, params=params)
+
+    def execute(self, sql, params=None):
+        with self.engine.begin() as conn:
+            conn.execute(text(sql), params or {})
+
+    def bulk_load(self, df, table, if_exists='append', dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        bulk_load(df, table, self.engine, if_exists=if_exists, dtype=dtype, chunksize=chunksize, partition_by=partition_by)
+
+    def upsert(self, df, table, keys, dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        return upsert(df, table, self.engine, keys, dtype=dtype, chunksize=chunksize, partition_by=partition_by)
+
+    def swap_partitions(self, df, table, partition_by='season', dtype=None, chunksize=DEFAULT_CHUNKSIZE):
+        swap_partitions(df, table, self.engine, partition_by=partition_by, dtype=dtype, chunksize=chunksize)
+
+    def refresh_views(self):
+        reset_views_and_indexes(self.engine)
+
+    def reset(self):
+        reset_database(self.engine)
+
+
+class DuckDBStorage(StorageBackend):
+    """
+    Embedded storage in a single DuckDB file, for laptop runs, CI and backtests without a
+    Postgres server. Seasons are not physically partitioned (DuckDB's row groups already skip
+    seasons outside a filter), so swap_partitions replaces a season's rows in one transaction.
+    """
+    name = 'duckdb'
+
+    def __init__(self, path=DUCKDB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.con = duckdb.connect(path)
+        # One connection is shared by the pipeline's threads, so statements are serialized
+        self._lock = threading.RLock()
+
+    def read_sql(self, query, params=None):
+        with self._lock:
+            return self.con.execute(NAMED_PARAM.sub(r'$\1', query), params or {}).df()
+
+    def execute(self, sql, params=None):
+        with self._lock:
+            self.con.execute(NAMED_PARAM.sub(r'$\1', sql), params or {})
+
+    def _column_types(self, table):
+        rows = self.con.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? AND table_schema = 'main'",
+            [table]
+        ).fetchall()
+        return {column: data_type for column, data_type in rows}
+
+    def _prepare(self, df, table, dtype, keys=None):
+        """
+        Creates table when missing (with a primary key on keys), adds columns it lacks, and
+        registers df as the _incoming relation cast to the table's column types.
+        """
+        dtype = dtype or {}
+        existing = self._column_types(table)
+        column_types = {col: dtype.get(col) or existing.get(col) or postgres_type(df[col]) for col in df.columns}
+        if not existing:
+            definition = ', '.join(f"{_quote(col)} {column_types[col]}" for col in df.columns)
+            if keys:
+                definition += f", PRIMARY KEY ({', '.join(_quote(k) for k in keys)})"
+            self.con.execute(f"CREATE TABLE {_quote(table)} ({definition})")
+        else:
+            for col in df.columns:
+                if col not in existing:
+                    self.con.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)} {column_types[col]}")
+
+        # Arrow turns NaN into NULL, as COPY's NULL marker does on Postgres
+        self.con.register('_incoming_src', pa.Table.from_pandas(df, preserve_index=False))
+        casts = ', '.join(f"CAST({_quote(col)} AS {column_types[col]}) AS {_quote(col)}" for col in df.columns)
+        self.con.execute(f"CREATE OR REPLACE TEMP TABLE _incoming AS SELECT {casts} FROM _incoming_src")
+        self.con.unregister('_incoming_src')
+        return ', '.join(_quote(col) for col in df.columns)
+
+    def _transaction(self, work):
+        with self._lock:
+            self.con.execute('BEGIN TRANSACTION')
+            try:
+                result = work()
+                self.con.execute('COMMIT')
+            except Exception:
+                self.con.execute('ROLLBACK')
+                raise
+            finally:
+                self.con.execute('DROP TABLE IF EXISTS _incoming')
+            return result
+
+    def bulk_load(self, df, table, if_exists='append', dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        if if_exists not in ('append', 'replace', 'truncate'):
+            raise ValueError(f"Unsupported if_exists '{if_exists}' for bulk_load")
+
+        def work():
+            if if_exists == 'replace':
+                self.con.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            column_list = self._prepare(df, table, dtype)
+            if if_exists == 'truncate':
+                self.con.execute(f"DELETE FROM {_quote(table)}")
+            self.con.execute(f"INSERT INTO {_quote(table)} ({column_list}) SELECT {column_list} FROM _incoming")
+
+        self._transaction(work)
+        logging.info(f"Bulk loaded {len(df)} rows into {table} ({if_exists}).")
+
+    def _has_key(self, table, keys):
+        rows = self.con.execute(
+            "SELECT constraint_column_names FROM duckdb_constraints() "
+            "WHERE table_name = ? AND constraint_type IN ('PRIMARY KEY', 'UNIQUE')", [table]
+        ).fetchall()
+        return any(set(columns) == set(keys) for (columns,) in rows)
+
+    def upsert(self, df, table, keys, dtype=None, chunksize=DEFAULT_CHUNKSIZE, partition_by=None):
+        keys = list(keys)
+        df = df.drop_duplicates(subset=keys, keep='last')
+
+        def work():
+            column_list = self._prepare(df, table, dtype, keys=keys)
+            changed_rows = self.con.execute(
+                f"SELECT count(*) FROM (SELECT {column_list} FROM _incoming EXCEPT SELECT {column_list} FROM {_quote(table)})"
+            ).fetchone()[0]
+            updates = [col for col in df.columns if col not in keys]
+            key_list = ', '.join(_quote(k) for k in keys)
+            if self._has_key(table, keys):
+                on_conflict = (f"DO UPDATE SET {', '.join(f'{_quote(col)} = EXCLUDED.{_quote(col)}' for col in updates)}"
+                               if updates else "DO NOTHING")
+                self.con.execute(f"INSERT INTO {_quote(table)} ({column_list}) SELECT {column_list} FROM _incoming "
+                                 f"ON CONFLICT ({key_list}) {on_conflict}")
+            else:
+                # Tables created by bulk_load have no key to conflict on, so matching rows are replaced
+                matches = ' AND '.join(f"t.{_quote(k)} = i.{_quote(k)}" for k in keys)
+                self.con.execute(f"DELETE FROM {_quote(table)} t USING _incoming i WHERE {matches}")
+                self.con.execute(f"INSERT INTO {_quote(table)} ({column_list}) SELECT {column_list} FROM _incoming")
+            return changed_rows
+
+        changed_rows = self._transaction(work)
+        logging.info(f"Upserted {table}: {changed_rows} of {len(df)} rows inserted or changed.")
+        return changed_rows
+
+    def swap_partitions(self, df, table, partition_by='season', dtype=None, chunksize=DEFAULT_CHUNKSIZE):
+        if df[partition_by].isna().any():
+            raise ValueError(f"Rows without a {partition_by} cannot be swapped into {table}")
+
+        def work():
+            column_list = self._prepare(df, table, dtype)
+            self.con.execute(f"DELETE FROM {_quote(table)} WHERE {_quote(partition_by)} IN "
+                             f"(SELECT DISTINCT {_quote(partition_by)} FROM _incoming)")
+            self.con.execute(f"INSERT INTO {_quote(table)} ({column_list}) SELECT {column_list} FROM _incoming")
+
+        self._transaction(work)
+        logging.info(f"Swapped {len(df)} rows into {table} for {df[partition_by].nunique()} {partition_by}s.")
+
+    def refresh_views(self):
+        # Plain views: DuckDB scans the features table fast enough that nothing is materialized
+        with self._lock:
+            if not self._column_types('features'):
+                return
+            for view in POSITION_VIEWS:
+                position = view.split('_')[0].upper()
+                self.con.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM features WHERE position = '{position}'")
+
+    def reset(self):
+        with self._lock:
+            for (view,) in self.con.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal AND schema_name = 'main'").fetchall():
+                self.con.execute(f"DROP VIEW IF EXISTS {_quote(view)}")
+            for (table,) in self.con.execute("SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'").fetchall():
+                self.con.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            # The keyed ingestion tables Postgres gets from reset_database, so upserts conflict on the same keys
+            for statement in _duckdb_schema():
+                self.con.execute(statement)
+        print("DuckDB storage has been reset and re-created.")
+
+
+def get_storage(backend=None):
+    """
+    Process-wide storage backend, created on first use: STORAGE_BACKEND=duckdb (or backend='duckdb')
+    selects the embedded DuckDB file at DUCKDB_PATH, 'postgres' (the default) the pooled Postgres
+    engine; any other name raises ValueError.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                load_dotenv()
+                backend = backend or os.getenv('STORAGE_BACKEND', STORAGE_BACKEND)
+                if backend == 'duckdb':
+                    _storage = DuckDBStorage(os.getenv('DUCKDB_PATH', DUCKDB_PATH))
+                elif backend == 'postgres':
+                    _storage = PostgresStorage()
+                else:
+                    raise ValueError(f"Unknown storage backend '{backend}'")
+    elif backend is not None and backend != _storage.name:
+        raise ValueError(f"Storage backend is already '{_storage.name}'")
+    return _storage
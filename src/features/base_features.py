@@ -1,57 +1,75 @@
-import pandas as pd
 import logging
-import os
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-from src.features.pass_rush_rate import generate_pass_rush_rate_features
-from src.features.weather_features import generate_weather_features
-from src.features.opportunity_share_with_rolling import generate_opportunity_share_features
-
-def generate_base_features(engine):
+from src.db_utils.storage import get_storage
+from src.features.weather_features import join_team_games
+from src.features.feature_dag import FEATURE_CACHE_DIR, base_families, run_feature_dag
+from src.features.dtypes import compact_dtypes, record_memory
+
+WEEKLY_STATS_COLUMNS = ['player_id',
+                'player_name',
+                'player_display_name',
+                'position',
+                'team_abbreviation',
+                'season',
+                'opponent_team',
+                'week',
+                'attempts',
+                'completions',
+                'passing_yards',
+                'passing_tds',
+                'targets',
+                'receptions',
+                'carries',
+                'rushing_yards',
+                'rushing_tds',
+                'receiving_yards',
+                'receiving_tds',
+                'target_share',
+                'fantasy_points']
+
+def load_weekly_stats(storage, since=None):
+    """
+    Loads the weekly_stats columns used for features, compacted to the feature dtypes.
+    With since=(season, week), only rows after that week are loaded.
+    """
+    if since is None:
+        weekly_stats_df = storage.read_table('weekly_stats', WEEKLY_STATS_COLUMNS)
+    else:
+        season, week = since
+        weekly_stats_df = storage.read_table(
+            'weekly_stats', WEEKLY_STATS_COLUMNS,
+            where='season > :season OR (season = :season AND week > :week)',
+            params={'season': int(season), 'week': int(week)}
+        )
+
+    weekly_stats_df = compact_dtypes(weekly_stats_df)
+    return weekly_stats_df.sort_values(by = ['player_name','season','week']).drop_duplicates().reset_index(drop = True)
+
+def load_feature_rows(storage):
+    """
+    weekly_stats rows joined to their team's game, one row per player-week in (player_id, season, week)
+    order. Every feature family adds columns to these rows.
+    """
+    weekly_stats_features = load_weekly_stats(storage)
+    record_memory('load weekly_stats', weekly_stats_features)
+
+    rows = join_team_games(weekly_stats_features, storage)
+    rows = rows.sort_values(by=['player_id', 'season', 'week']).drop_duplicates().reset_index(drop=True)
+    record_memory('team-game join', rows)
+    return rows
+
+def generate_base_features(storage, cache_dir=FEATURE_CACHE_DIR):
     print("Generating base feature table.")
 
-    weekly_stats_df = pd.read_sql('SELECT * FROM weekly_stats', engine)
-    weekly_stats_features = weekly_stats_df[['player_id',
-                    'player_name',
-                    'player_display_name',
-                    'position',
-                    'team_abbreviation',
-                    'season',
-                    'opponent_team',
-                    'week',
-                    'attempts',
-                    'completions',
-                    'passing_yards',
-                    'passing_tds',
-                    'targets',
-                    'receptions',
-                    'carries',
-                    'rushing_yards',
-                    'rushing_tds',
-                    'receiving_yards',
-                    'receiving_tds',
-                    'target_share',
-                    'fantasy_points']].sort_values(by = ['player_name','season','week']).drop_duplicates().reset_index(drop = True)
-
-    final_df = generate_weather_features(weekly_stats_features, engine)
-    final_df = generate_pass_rush_rate_features(final_df)
-    final_df = generate_opportunity_share_features(final_df)
-
-    final_df["career_avg_fantasy_points"] = (
-        final_df.groupby("player_id")["fantasy_points"]
-        .apply(lambda x: x.shift(1).expanding().mean())
-        .reset_index(drop=True)
-    )
-
-    final_df.to_sql('player_weekly_features', engine, if_exists='replace', index=False)
+    final_df = run_feature_dag(load_feature_rows(storage), base_families(), cache_dir=cache_dir)
+    record_memory('base features', final_df)
+
+    storage.bulk_load(final_df, 'player_weekly_features', if_exists='replace', partition_by='season')
     logging.info("Base feature table created and stored.")
 
     return final_df
 
 if __name__ == "__main__":
-    load_dotenv()
-    DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(DATABASE_URL)
+    storage = get_storage()
 
     print('Generating base features...')
-    generate_base_features(engine)
\ No newline at end of file
+    generate_base_features(storage)
\ No newline at end of file
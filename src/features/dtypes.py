@@ -0,0 +1,59 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# Low-cardinality labels repeated on every player row
+CATEGORICAL_COLUMNS = ['player_name', 'player_display_name', 'position', 'team_abbreviation', 'opponent_team', 'stadium']
+# Keys that always fit in a small integer and are never missing
+SMALL_INT_COLUMNS = {'season': 'int16', 'week': 'int8'}
+# player_id keeps the widest type; it is the join key with the source tables
+KEEP_COLUMNS = ['player_id']
+
+# (stage, rows, columns, MB) for every stage recorded in this run
+memory_report = []
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrinks the frame in place to the feature schema: categoricals for team, position, stadium and
+    name labels, small ints for season and week, float32 for stats, rates and averages, and int32
+    for whole-number counts (wide enough that sums of counts cannot overflow). Columns that are
+    already compact are left alone, so stages can call this after every merge (merges turn
+    categorical keys back into objects).
+    """
+    for col in df.columns:
+        if col in KEEP_COLUMNS:
+            continue
+        dtype = df[col].dtype
+        if col in CATEGORICAL_COLUMNS:
+            if not isinstance(dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+        elif col in SMALL_INT_COLUMNS:
+            if dtype != SMALL_INT_COLUMNS[col] and df[col].notna().all():
+                df[col] = df[col].astype(SMALL_INT_COLUMNS[col])
+        elif dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+        elif dtype.kind in 'iu' and dtype.itemsize > 4:
+            if df[col].empty or np.iinfo(np.int32).min <= df[col].min() and df[col].max() <= np.iinfo(np.int32).max:
+                df[col] = df[col].astype(np.int32)
+    return df
+
+
+def record_memory(stage, df: pd.DataFrame):
+    """
+    Records and prints the in-memory footprint of the frame after a pipeline stage.
+    """
+    mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    memory_report.append((stage, len(df), len(df.columns), mb))
+    print(f'[memory] {stage}: {mb:.1f} MB ({len(df)} rows x {len(df.columns)} cols)')
+
+
+def print_memory_report():
+    if not memory_report:
+        return
+    report = pd.DataFrame(memory_report, columns=['stage', 'rows', 'columns', 'mb'])
+    report['mb'] = report['mb'].round(1)
+    print('Memory footprint by stage:')
+    print(report.to_string(index=False))
+    logging.info(f"Peak stage memory {report['mb'].max()} MB at '{report.loc[report['mb'].idxmax(), 'stage']}'.")
+    memory_report.clear()
@@ -0,0 +1,247 @@
+import os
+import re
+import glob
+import logging
+import duckdb
+from src.data_ingestion.player_identity import resolve_player_ids
+from src.features.base_features import WEEKLY_STATS_COLUMNS
+from src.features.dtypes import compact_dtypes
+from src.features.feature_dag import family_outputs
+from src.features.rolling_features import ROLLING_STATS
+from src.features.weather_features import WEATHER_COLUMNS
+from src.features.team_week_features import POSITIONS
+
+NFLFASTR_DIR = 'data/raw/nflfastr'
+ROW_COLUMNS = WEEKLY_STATS_COLUMNS + ['stadium'] + WEATHER_COLUMNS + ['home_game']
+
+# nflfastr column for each weekly_stats column that is renamed on export
+SOURCE_COLUMNS = {'team_abbreviation': 'recent_team'}
+
+
+def _file_season(path):
+    match = re.search(r'player_stats_(\d{4})\.parquet$', path)
+    return int(match.group(1)) if match else None
+
+
+def _parquet_files(parquet_dir, seasons=None):
+    # Failed downloads leave tiny placeholder files behind, which fetch_nflfastr skips as well
+    files = sorted(glob.glob(os.path.join(parquet_dir, 'player_stats_*.parquet')))
+    if seasons is not None:
+        wanted = {int(season) for season in seasons}
+        files = [f for f in files if _file_season(f) in wanted]
+    return [f for f in files if os.path.getsize(f) >= 1000]
+
+
+def _avg(expr, window, min_count=None):
+    # AVG/COUNT skip NULLs, matching the NaN-skipping means of the pandas path
+    if min_count is None:
+        return f"AVG({expr}) OVER {window}"
+    return f"CASE WHEN COUNT({expr}) OVER {window} = {min_count} THEN AVG({expr}) OVER {window} END"
+
+
+def _windows(partition, order='week', lag=1):
+    """
+    Window specs for one partitioning: expanding ('std'), 3 and 5 row windows, ending before
+    (lag=1) or at (lag=0) the current row.
+    """
+    end = '1 PRECEDING' if lag else 'CURRENT ROW'
+    spec = f"PARTITION BY {partition} ORDER BY {order}"
+    return {
+        'std': f"({spec} ROWS BETWEEN UNBOUNDED PRECEDING AND {end})",
+        3: f"({spec} ROWS BETWEEN {3 + lag - 1} PRECEDING AND {end})",
+        5: f"({spec} ROWS BETWEEN {5 + lag - 1} PRECEDING AND {end})",
+    }
+
+
+def build_feature_sql(files):
+    """
+    The whole feature build as one DuckDB query over the nflfastr parquet files and the registered
+    games_src/weather_src/identity_src tables. Produces the same columns, in the same order, as the
+    pandas feature DAG, keyed by the canonical player_id identity_src maps each GSIS id to.
+    """
+    file_list = ', '.join(f"'{f}'" for f in files)
+    stats_select = ',\n            '.join(
+        "i.player_id AS player_id" if col == 'player_id'
+        else f"r.{SOURCE_COLUMNS[col]} AS {col}" if col in SOURCE_COLUMNS
+        else f"r.{col}"
+        for col in WEEKLY_STATS_COLUMNS
+    )
+
+    team = _windows('team, season')
+    player = _windows('player_id, season')
+    share = _windows('player_id, season', lag=0)
+    career = _windows('player_id', order='season, week')
+    side = _windows('player_id, season, home_game')
+
+    by_position = ',\n            '.join(
+        f"COALESCE(SUM(fantasy_points) FILTER (WHERE position = '{pos}'), 0) AS fantasy_points_allowed_{pos}"
+        for pos in POSITIONS
+    )
+    position_windows = ',\n            '.join(
+        [_avg(f'fantasy_points_allowed_{pos}', team['std']) + f' AS fantasy_points_allowed_{pos}_avg' for pos in POSITIONS]
+        + [_avg(f'fantasy_points_allowed_{pos}', team[3], 3) + f' AS fantasy_points_allowed_{pos}_3wk_avg' for pos in POSITIONS]
+    )
+
+    player_features = (
+        [_avg('opportunity_share_lag1', share[3], 3) + ' AS opportunity_share_3wk_avg',
+         _avg('opportunity_share_lag1', share[5], 5) + ' AS opportunity_share_5wk_avg',
+         _avg('opportunity_share_lag1', share['std']) + ' AS opportunity_share_std_avg',
+         _avg('fantasy_points', career['std']) + ' AS career_avg_fantasy_points']
+        + [_avg(stat, player['std']) + f' AS std_{stat}' for stat in ROLLING_STATS]
+        + [_avg(stat, player[window], window) + f' AS {stat}_{window}wk_avg' for window in (3, 5) for stat in ROLLING_STATS]
+    )
+    for name, flag in [('home', 'home_game'), ('away', 'NOT home_game')]:
+        player_features += [f"CASE WHEN {flag} THEN {_avg(stat, side[window], window)} END AS {stat}_{name}_avg_{window}wk"
+                            for window in (3, 5) for stat in ROLLING_STATS]
+        player_features += [f"CASE WHEN {flag} THEN {_avg(stat, side['std'])} END AS {stat}_{name}_std_avg"
+                            for stat in ROLLING_STATS]
+    player_features = ',\n            '.join(player_features)
+
+    output_columns = ', '.join(ROW_COLUMNS + family_outputs())
+
+    return f"""
+    WITH stats AS (
+        SELECT DISTINCT
+            {stats_select}
+        FROM read_parquet([{file_list}]) r
+        LEFT JOIN identity_src i ON i.gsis_id = r.player_id
+    ),
+    games AS (
+        SELECT DISTINCT season, week, home_team, away_team, stadium FROM games_src
+    ),
+    team_games AS (
+        SELECT * FROM (
+            SELECT season, week, home_team AS team_abbreviation, stadium, TRUE AS home_game FROM games
+            UNION ALL
+            SELECT season, week, away_team AS team_abbreviation, stadium, FALSE AS home_game FROM games
+        )
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY season, week, team_abbreviation ORDER BY home_game DESC) = 1
+    ),
+    weather AS (
+        SELECT season, week, stadium, temperature, precipitation, wind_speed, dome FROM weather_src
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY season, week, stadium) = 1
+    ),
+    base AS (
+        -- Inner join keeps only player rows whose team has a scheduled game that week
+        SELECT s.*, tg.stadium, w.temperature, w.precipitation, w.wind_speed, w.dome, tg.home_game
+        FROM stats s
+        JOIN team_games tg USING (season, week, team_abbreviation)
+        LEFT JOIN weather w ON w.season = tg.season AND w.week = tg.week AND w.stadium = tg.stadium
+        WHERE s.player_id IS NOT NULL
+    ),
+    team_offense AS (
+        SELECT team_abbreviation AS team, season, week,
+            CASE WHEN attempts + carries > 0 THEN attempts::DOUBLE / (attempts + carries) END AS pass_rate,
+            carries + targets AS team_total_opps
+        FROM (
+            SELECT team_abbreviation, season, week,
+                COALESCE(SUM(attempts), 0) AS attempts,
+                COALESCE(SUM(carries), 0) AS carries,
+                COALESCE(SUM(targets), 0) AS targets
+            FROM base GROUP BY ALL
+        )
+    ),
+    team_offense_lagged AS (
+        SELECT team, season, week,
+            LAG(pass_rate) OVER (PARTITION BY team, season ORDER BY week) AS pass_rate_lag1,
+            1 - LAG(pass_rate) OVER (PARTITION BY team, season ORDER BY week) AS rush_rate_lag1,
+            LAG(team_total_opps) OVER (PARTITION BY team, season ORDER BY week) AS team_total_opps_lag1
+        FROM team_offense
+    ),
+    -- The opponent is the defense, so points allowed are summed by opponent_team
+    allowed AS (
+        SELECT team, season, week, {_avg('fantasy_points_allowed', team['std'])} AS fantasy_points_allowed_avg
+        FROM (
+            SELECT opponent_team AS team, season, week, COALESCE(SUM(fantasy_points), 0) AS fantasy_points_allowed
+            FROM base WHERE opponent_team IS NOT NULL GROUP BY ALL
+        )
+    ),
+    allowed_by_position AS (
+        SELECT team, season, week,
+            {position_windows}
+        FROM (
+            SELECT opponent_team AS team, season, week,
+            {by_position}
+            FROM base WHERE opponent_team IS NOT NULL AND position IN ({', '.join(f"'{pos}'" for pos in POSITIONS)})
+            GROUP BY ALL
+        )
+    ),
+    team_features AS (
+        SELECT b.*,
+            COALESCE(b.temperature < 32, FALSE) AS cold_game,
+            COALESCE(b.wind_speed > 20, FALSE) AS windy_game,
+            COALESCE(b.precipitation > 0.3, FALSE) AS rain_game,
+            COALESCE(b.temperature < 32, FALSE) OR COALESCE(b.wind_speed > 20, FALSE)
+                OR COALESCE(b.precipitation > 0.3, FALSE) AS extreme_weather,
+            o.pass_rate_lag1, o.rush_rate_lag1, o.team_total_opps_lag1,
+            a.fantasy_points_allowed_avg,
+            {', '.join(f'p.fantasy_points_allowed_{pos}_avg' for pos in POSITIONS)},
+            {', '.join(f'p.fantasy_points_allowed_{pos}_3wk_avg' for pos in POSITIONS)},
+            -- 0/0 is NaN in DuckDB; NULL keeps it out of the window means
+            NULLIF((b.carries + b.targets) / o.team_total_opps_lag1, 'NaN'::DOUBLE) AS opportunity_share_lag1
+        FROM base b
+        LEFT JOIN team_offense_lagged o ON o.team = b.team_abbreviation AND o.season = b.season AND o.week = b.week
+        LEFT JOIN allowed a ON a.team = b.opponent_team AND a.season = b.season AND a.week = b.week
+        LEFT JOIN allowed_by_position p ON p.team = b.opponent_team AND p.season = b.season AND p.week = b.week
+    ),
+    features AS (
+        SELECT *,
+            {player_features}
+        FROM team_features
+    )
+    SELECT {output_columns}
+    FROM features
+    ORDER BY player_id, season, week
+    """
+
+
+def resolve_parquet_players(con, files, storage):
+    """
+    (gsis_id, player_id) for every player in the parquet files, through the player identity index
+    that weekly_stats and players are keyed by.
+    """
+    file_list = ', '.join(f"'{f}'" for f in files)
+    players = con.execute(f"""
+        SELECT player_id AS gsis_id, any_value(player_display_name) AS name, any_value(position) AS position
+        FROM read_parquet([{file_list}]) WHERE player_id IS NOT NULL GROUP BY player_id
+    """).df()
+    players['player_id'] = resolve_player_ids(storage, players, create=True, source='feature players')
+    return players[['gsis_id', 'player_id']]
+
+
+def generate_features_duckdb(storage=None, games_df=None, weather_df=None, parquet_dir=NFLFASTR_DIR, threads=None,
+                             identity_df=None, seasons=None):
+    """
+    Builds the full feature frame (feature rows plus every feature family) with DuckDB window
+    functions, reading player stats straight from the nflfastr parquet files. The schedule,
+    weather and (gsis_id, player_id) identities come from games_df/weather_df/identity_df, or from
+    the games and weather tables and the player identity index when not given. Only the files of
+    the given seasons are read; by default the seasons ingested into weekly_stats, so the rows
+    match the pandas engine's.
+    """
+    print('Generating features with DuckDB...')
+    if seasons is None and storage is not None:
+        seasons = storage.read_sql('SELECT DISTINCT season FROM weekly_stats')['season'].tolist()
+    files = _parquet_files(parquet_dir, seasons)
+    if not files:
+        raise FileNotFoundError(f"No nflfastr parquet files found in {parquet_dir} for seasons {seasons}")
+    if games_df is None:
+        games_df = storage.read_sql('SELECT season, week, home_team, away_team, stadium FROM games')
+    if weather_df is None:
+        weather_df = storage.read_sql('SELECT season, week, stadium, temperature, precipitation, wind_speed, dome FROM weather')
+
+    con = duckdb.connect()
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if identity_df is None:
+        if storage is None:
+            raise ValueError("generate_features_duckdb needs storage or identity_df to key players")
+        identity_df = resolve_parquet_players(con, files, storage)
+    con.register('games_src', games_df)
+    con.register('weather_src', weather_df)
+    con.register('identity_src', identity_df)
+    df = con.execute(build_feature_sql(files)).df()
+    con.close()
+
+    logging.info(f"DuckDB feature build produced {len(df)} rows from {len(files)} parquet files.")
+    return compact_dtypes(df)
@@ -0,0 +1,229 @@
+import os
+import time
+import glob
+import hashlib
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+from src.features.dtypes import compact_dtypes
+from src.features.rolling_features import ROLLING_STATS, compute_lagged_windows, rolling_window_columns
+from src.features.weather_features import add_weather_flags
+from src.features.team_week_features import (
+    MATCHUP_KEYS, OFFENSE_FEATURES, DEFENSE_FEATURES, build_team_week_cube, attach_team_week_features
+)
+from src.features.opportunity_share_with_rolling import add_opportunity_share_features
+from src.features.home_away_features import add_home_away_rolling_and_std_averages
+
+FEATURE_CACHE_DIR = 'data/processed/feature_cache'
+ROW_KEYS = ['player_id', 'season', 'week']
+
+# name -> {'fn', 'inputs', 'outputs', 'base'}, in feature column order
+FEATURE_FAMILIES = {}
+
+
+def feature_family(name, inputs, outputs, base=False):
+    """
+    Registers a feature family. The function receives a frame holding only `inputs` and returns a
+    frame of `outputs` aligned to its index. Families whose inputs are produced by other families run
+    after them; base=True marks the families stored in the player_weekly_features table.
+    """
+    def register(fn):
+        FEATURE_FAMILIES[name] = {'fn': fn, 'inputs': list(inputs), 'outputs': list(outputs), 'base': base}
+        return fn
+    return register
+
+
+def family_outputs(families=None):
+    names = FEATURE_FAMILIES if families is None else families
+    return [col for name in names for col in FEATURE_FAMILIES[name]['outputs']]
+
+
+def base_families():
+    return [name for name, family in FEATURE_FAMILIES.items() if family['base']]
+
+
+def _producers():
+    return {col: name for name, family in FEATURE_FAMILIES.items() for col in family['outputs']}
+
+
+def resolve_families(families=None):
+    """
+    Returns the requested families plus everything upstream of them, as {name: set of upstream names}.
+    """
+    producers = _producers()
+    pending = list(FEATURE_FAMILIES if families is None else families)
+    deps = {}
+    while pending:
+        name = pending.pop()
+        if name in deps:
+            continue
+        if name not in FEATURE_FAMILIES:
+            raise KeyError(f"Unknown feature family '{name}'")
+        deps[name] = {producers[col] for col in FEATURE_FAMILIES[name]['inputs'] if col in producers}
+        pending.extend(deps[name])
+    return deps
+
+
+def _referenced_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+
+def _code_version(fn):
+    """
+    Hash of the family function's source and of every src function and module constant it reaches,
+    so editing a shared helper (e.g. the rolling engine) invalidates the families that call it and
+    no others.
+    """
+    digest = hashlib.sha256()
+    seen = set()
+    stack = [fn]
+    while stack:
+        func = stack.pop()
+        if func in seen:
+            continue
+        seen.add(func)
+        digest.update(inspect.getsource(func).encode())
+        for name in sorted(_referenced_names(func.__code__)):
+            value = func.__globals__.get(name)
+            if inspect.isfunction(value) and value.__module__.startswith('src.'):
+                stack.append(value)
+            elif isinstance(value, (str, int, float, list, tuple, dict)):
+                digest.update(f'{name}={value!r}'.encode())
+    return digest.hexdigest()
+
+
+def _cache_key(name, inputs):
+    digest = hashlib.sha256(name.encode())
+    digest.update(_code_version(FEATURE_FAMILIES[name]['fn']).encode())
+    digest.update(str([(col, str(dtype)) for col, dtype in inputs.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(inputs, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _run_family(name, inputs, cache_dir):
+    """
+    Returns the family's output frame, from the cache when its inputs and code are unchanged.
+    """
+    family = FEATURE_FAMILIES[name]
+    key = _cache_key(name, inputs) if cache_dir else None
+    path = os.path.join(cache_dir, f'{name}-{key}.parquet') if cache_dir else None
+    if path and os.path.exists(path):
+        out = pd.read_parquet(path)
+        out.index = inputs.index
+        return out, True
+
+    out = family['fn'](inputs)
+    out = compact_dtypes(out[family['outputs']].copy(deep=False))
+    out.index = inputs.index
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, f'.{name}-{key}.parquet.tmp')
+        out.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        # Only the latest output of each family is kept
+        for stale in glob.glob(os.path.join(cache_dir, f'{name}-*.parquet')):
+            if stale != path:
+                os.remove(stale)
+    return out, False
+
+
+def run_feature_dag(df, families=None, cache_dir=FEATURE_CACHE_DIR, max_workers=4):
+    """
+    Adds the outputs of the requested feature families (default: all) and their upstream families
+    to df. Independent families run concurrently; each family's output is cached on disk keyed on a
+    hash of its input columns and code, so only families whose inputs or code changed are recomputed.
+    Pass cache_dir=None to disable the cache. df's rows are kept as they are.
+    """
+    deps = resolve_families(families)
+    produced = {}
+    missing = [col for name in deps for col in FEATURE_FAMILIES[name]['inputs']
+               if col not in df.columns and _producers().get(col) not in deps]
+    if missing:
+        raise ValueError(f"Feature inputs not found in the base frame: {sorted(set(missing))}")
+
+    def inputs_for(name):
+        cols = FEATURE_FAMILIES[name]['inputs']
+        frame = pd.concat([df[[col for col in cols if col not in produced]],
+                           pd.DataFrame({col: produced[col] for col in cols if col in produced}, index=df.index)], axis=1)
+        # Families add columns to their own input frame, so it must not be flagged as a slice of df
+        return frame[cols].copy(deep=False)
+
+    done = set()
+    running = {}
+    started = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(done) < len(deps):
+            for name in deps:
+                if name not in done and name not in running.values() and deps[name] <= done:
+                    running[pool.submit(_run_family, name, inputs_for(name), cache_dir)] = name
+                    started[name] = time.time()
+            if not running:
+                raise ValueError(f"Feature families have a dependency cycle: {sorted(set(deps) - done)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                out, cached = future.result()
+                for col in out.columns:
+                    produced[col] = out[col]
+                done.add(name)
+                print(f"Feature family '{name}': {'cached' if cached else f'computed in {time.time() - started[name]:.1f}s'}")
+
+    order = [col for col in family_outputs() if col in produced]
+    logging.info(f"Feature DAG ran {len(deps)} families.")
+    return pd.concat([df.drop(columns=order, errors='ignore'), pd.DataFrame({col: produced[col] for col in order}, index=df.index)], axis=1)
+
+
+# --- Feature families ---
+
+@feature_family('weather', inputs=['temperature', 'wind_speed', 'precipitation'],
+                outputs=['cold_game', 'windy_game', 'rain_game', 'extreme_weather'], base=True)
+def weather_family(df):
+    return add_weather_flags(df)
+
+
+@feature_family('pass_rush', inputs=MATCHUP_KEYS + ['attempts', 'carries', 'targets'],
+                outputs=OFFENSE_FEATURES, base=True)
+def pass_rush_family(df):
+    cube = build_team_week_cube(df, defense=False)
+    return attach_team_week_features(df, cube, OFFENSE_FEATURES)
+
+
+@feature_family('opponent', inputs=MATCHUP_KEYS + ['position', 'fantasy_points'],
+                outputs=DEFENSE_FEATURES, base=True)
+def opponent_family(df):
+    cube = build_team_week_cube(df, offense=False)
+    return attach_team_week_features(df, cube, DEFENSE_FEATURES)
+
+
+@feature_family('opportunity_share', inputs=ROW_KEYS + ['carries', 'targets', 'team_total_opps_lag1'],
+                outputs=['opportunity_share_lag1', 'opportunity_share_3wk_avg', 'opportunity_share_5wk_avg',
+                         'opportunity_share_std_avg'], base=True)
+def opportunity_share_family(df):
+    return add_opportunity_share_features(df)
+
+
+@feature_family('career', inputs=ROW_KEYS + ['fantasy_points'], outputs=['career_avg_fantasy_points'], base=True)
+def career_family(df):
+    career = compute_lagged_windows(df, [], windows=(), season_to_date=False, career_stats=["fantasy_points"])
+    return pd.DataFrame({"career_avg_fantasy_points": career[("fantasy_points", "career")]}, index=df.index)
+
+
+@feature_family('rolling', inputs=ROW_KEYS + ROLLING_STATS,
+                outputs=[f"std_{stat}" for stat in ROLLING_STATS]
+                + [f"{stat}_{window}wk_avg" for window in (3, 5) for stat in ROLLING_STATS])
+def rolling_family(df):
+    print('Adding season-to-date and rolling averages...')
+    return pd.DataFrame(rolling_window_columns(df), index=df.index)
+
+
+@feature_family('home_away', inputs=ROW_KEYS + ['home_game'] + ROLLING_STATS,
+                outputs=[col for side in ('home', 'away') for col in
+                         [f'{stat}_{side}_avg_{window}wk' for window in (3, 5) for stat in ROLLING_STATS]
+                         + [f'{stat}_{side}_std_avg' for stat in ROLLING_STATS]])
+def home_away_family(df):
+    return add_home_away_rolling_and_std_averages(df)
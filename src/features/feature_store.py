@@ -0,0 +1,220 @@
+import os
+import json
+import base64
+import shutil
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from src.features.dtypes import compact_dtypes
+
+FEATURE_STORE_DIR = 'data/processed/feature_store'
+MANIFEST_FILE = '_manifest.json'
+PARTITION_COLUMNS = ['position', 'season']
+PARTITIONING = ds.partitioning(pa.schema([('position', pa.string()), ('season', pa.int64())]), flavor='hive')
+COMPRESSION = 'zstd'
+# Rows converted to pandas at a time when reading
+DEFAULT_BATCH_SIZE = 16_384
+
+
+def _partition_path(store_dir, position, season):
+    return os.path.join(store_dir, f'position={position}', f'season={int(season)}')
+
+
+def _file_schema(schema):
+    # Partition columns live in the directory names, not inside the files
+    return pa.schema([field for field in schema if field.name not in PARTITION_COLUMNS])
+
+
+def _write_partition(table, store_dir, position, season):
+    path = _partition_path(store_dir, position, season)
+    os.makedirs(path, exist_ok=True)
+    # Dot-prefixed files are skipped by dataset discovery, so readers never see a half-written file
+    tmp_file = os.path.join(path, '.part-0.parquet.tmp')
+    pq.write_table(table, tmp_file, compression=COMPRESSION)
+    os.replace(tmp_file, os.path.join(path, 'part-0.parquet'))
+
+
+def read_manifest(store_dir=FEATURE_STORE_DIR):
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No feature store manifest at {path}; run the feature pipeline first.")
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(store_dir, schema, columns, partitions):
+    manifest = {
+        'columns': columns,
+        'schema': {field.name: str(field.type) for field in schema},
+        'arrow_schema': base64.b64encode(schema.serialize().to_pybytes()).decode('ascii'),
+        'partition_by': PARTITION_COLUMNS,
+        'partitions': partitions,
+        'compression': COMPRESSION,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    tmp_path = os.path.join(store_dir, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST_FILE))
+
+
+def _manifest_schema(manifest):
+    return pa.ipc.read_schema(pa.py_buffer(base64.b64decode(manifest['arrow_schema'])))
+
+
+def write_features(df, store_dir=FEATURE_STORE_DIR, mode='replace'):
+    """
+    Writes the feature frame as zstd-compressed Parquet partitioned by position and season.
+    mode='replace' rebuilds the whole store; mode='append' adds rows to the existing store by
+    rewriting only the (position, season) partitions they fall into.
+    """
+    print(f'Writing features to feature store ({mode})...')
+    df = df[df['position'].notna()]
+
+    if mode == 'append':
+        manifest = read_manifest(store_dir)
+        schema = _manifest_schema(manifest)
+        columns = manifest['columns']
+        partitions = manifest['partitions']
+        target_dir = store_dir
+    else:
+        schema = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+        columns = list(df.columns)
+        partitions = {}
+        target_dir = store_dir + '.tmp'
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+    file_schema = _file_schema(schema)
+    for (position, season), part_df in df.groupby(PARTITION_COLUMNS, sort=True, observed=True):
+        # Cast rather than convert with the schema: appended categoricals may use a different index width
+        table = pa.Table.from_pandas(part_df[file_schema.names], preserve_index=False).cast(file_schema)
+        key = f'{position}/{int(season)}'
+        if mode == 'append' and key in partitions:
+            existing = pq.read_table(os.path.join(_partition_path(target_dir, position, season), 'part-0.parquet'), schema=file_schema)
+            table = pa.concat_tables([existing, table])
+        _write_partition(table, target_dir, position, season)
+        partitions[key] = {'rows': table.num_rows}
+
+    os.makedirs(target_dir, exist_ok=True)
+    _write_manifest(target_dir, schema, columns, partitions)
+
+    if mode != 'append':
+        # Swap the freshly written store into place
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(target_dir, store_dir)
+
+    logging.info(f"Feature store updated with {len(df)} rows.")
+
+
+def _column_values(array):
+    # Numeric and boolean columns convert straight to numpy; labels convert to pandas categoricals
+    if pa.types.is_floating(array.type) or (
+            (pa.types.is_integer(array.type) or pa.types.is_boolean(array.type)) and array.null_count == 0):
+        return array.to_numpy(zero_copy_only=False)
+    return array.to_pandas()
+
+
+def _chunks(scanner, batch_size):
+    # Small partitions yield small batches, so they are converted batch_size rows at a time
+    pending, pending_rows = [], 0
+    for batch in scanner.to_batches():
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= batch_size:
+            yield pa.Table.from_batches(pending)
+            pending, pending_rows = [], 0
+    if pending_rows:
+        yield pa.Table.from_batches(pending)
+
+
+def _assemble(scanner, rows, batch_size):
+    """
+    Streams the scanner's record batches into one frame of compact dtypes. Numeric columns are
+    written straight into arrays preallocated for all rows and the other columns are joined per
+    chunk, so only one chunk of batch_size rows is ever held in both Arrow and pandas form.
+    """
+    names = scanner.projected_schema.names
+    arrays, pieces, offset = {}, {}, 0
+    for chunk in _chunks(scanner, batch_size):
+        end = offset + chunk.num_rows
+        for col, array in zip(chunk.schema.names, chunk.columns):
+            values = _column_values(array)
+            if col not in arrays and col not in pieces:
+                if isinstance(values, np.ndarray):
+                    arrays[col] = np.empty(rows, dtype=values.dtype)
+                else:
+                    pieces[col] = []
+            if col in pieces:
+                pieces[col].append(values if isinstance(values, pd.Series) else pd.Series(values))
+                continue
+            if not isinstance(values, np.ndarray):
+                # e.g. an integer column with missing values in a later batch
+                values = values.to_numpy(dtype=np.float64, na_value=np.nan) if values.dtype.kind in 'iuf' else values.to_numpy()
+            target = arrays[col]
+            promoted = np.result_type(target.dtype, values.dtype)
+            if promoted != target.dtype:
+                arrays[col] = target = target.astype(promoted)
+            target[offset:end] = values
+        offset = end
+
+    data = {}
+    for col in names:
+        if col in arrays:
+            data[col] = arrays[col]
+        elif all(isinstance(p.dtype, pd.CategoricalDtype) for p in pieces[col]):
+            data[col] = union_categoricals([p.array for p in pieces[col]], sort_categories=True)
+        else:
+            data[col] = pd.concat(pieces[col], ignore_index=True).to_numpy()
+    # copy=False keeps each array as its own block instead of consolidating them into a copy
+    return compact_dtypes(pd.DataFrame(data, copy=False))
+
+
+def read_features(position=None, columns=None, seasons=None, weeks=None, through=None,
+                  batch_size=DEFAULT_BATCH_SIZE, store_dir=FEATURE_STORE_DIR):
+    """
+    Reads features from the store. Only the requested columns are read, and the position,
+    season and week predicates are pushed down to skip partitions and row groups.
+    seasons and weeks may be a single value, a list of values or a (min, max) range tuple;
+    through=(season, week) keeps only rows up to and including that week. Rows are streamed
+    batch_size at a time into the compact frame.
+    """
+    manifest = read_manifest(store_dir)
+    dataset = ds.dataset(store_dir, format='parquet', partitioning=PARTITIONING)
+
+    filters = []
+    if position is not None:
+        filters.append(ds.field('position') == position.upper())
+    for name, value in [('season', seasons), ('week', weeks)]:
+        if value is None:
+            continue
+        if isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                filters.append(ds.field(name) >= low)
+            if high is not None:
+                filters.append(ds.field(name) <= high)
+        elif isinstance(value, (list, set)):
+            filters.append(ds.field(name).isin(list(value)))
+        else:
+            filters.append(ds.field(name) == value)
+    if through is not None:
+        season, week = through
+        filters.append(ds.field('season') <= season)
+        filters.append((ds.field('season') < season) | (ds.field('week') <= week))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    columns = manifest['columns'] if columns is None else [col for col in manifest['columns'] if col in set(columns)]
+    scanner = dataset.scanner(columns=columns, filter=expression, batch_size=batch_size, batch_readahead=1, fragment_readahead=1)
+    rows = scanner.count_rows()
+    if rows == 0:
+        # Partition columns come back as string/int64, so restore the compact feature dtypes
+        return compact_dtypes(scanner.to_table().to_pandas())
+    return _assemble(scanner, rows, batch_size)
@@ -0,0 +1,285 @@
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from src.features.rolling_features import ROLLING_STATS
+
+STATE_PATH = 'data/processed/feature_state.pkl'
+POSITIONS = ["QB", "RB", "WR", "TE"]
+
+# Each accumulator keeps, per key, the season it belongs to, running sums/counts for expanding
+# means and the most recent `tail` raw values (t1 = latest) for rolling windows.
+ACCUMULATORS = {
+    # name: (stats, tail, reset each season)
+    'team_offense': (['pass_rate', 'team_total_opps'], 1, True),
+    'opportunity_share': (['opportunity_share_lag1'], 5, True),
+    'career': (['fantasy_points'], 0, False),
+    'player': (ROLLING_STATS, 5, True),
+    'player_home': (ROLLING_STATS, 5, True),
+    'player_away': (ROLLING_STATS, 5, True),
+    'defense_total': (['fantasy_points_allowed'], 0, True),
+    'defense_by_position': ([f'fantasy_points_allowed_{pos}' for pos in POSITIONS], 3, True),
+}
+
+
+def _state_columns(stats, tail):
+    cols = ['season']
+    for stat in stats:
+        cols += [f'{stat}__sum', f'{stat}__cnt'] + [f'{stat}__t{j}' for j in range(1, tail + 1)]
+    return cols
+
+
+def new_feature_state():
+    """
+    Empty running state; `watermark` is the last (season, week) folded in.
+    """
+    accumulators = {
+        name: pd.DataFrame(columns=_state_columns(stats, tail), dtype=float)
+        for name, (stats, tail, _) in ACCUMULATORS.items()
+    }
+    return {'watermark': None, 'columns': None, 'base_columns': None, 'accumulators': accumulators}
+
+
+def _advance_once(acc, keys, seasons, values, stats, tail, reset_season, windows, lag):
+    prior = acc.reindex(keys)
+    m, k = values.shape
+    sums = prior[[f'{s}__sum' for s in stats]].to_numpy(dtype=float)
+    cnts = prior[[f'{s}__cnt' for s in stats]].to_numpy(dtype=float)
+    tails = np.full((m, k, tail), np.nan)
+    for j in range(tail):
+        tails[:, :, j] = prior[[f'{s}__t{j + 1}' for s in stats]].to_numpy(dtype=float)
+
+    prior_season = prior['season'].to_numpy(dtype=float)
+    stale = np.isnan(prior_season)
+    if reset_season:
+        stale |= prior_season != seasons
+    sums[stale] = 0.0
+    cnts[stale] = 0.0
+    tails[stale] = np.nan
+
+    def fold(sums, cnts, tails):
+        present = ~np.isnan(values)
+        sums = sums + np.where(present, values, 0.0)
+        cnts = cnts + present
+        if tail:
+            tails = np.concatenate([values[:, :, None], tails[:, :, :-1]], axis=2)
+        return sums, cnts, tails
+
+    # lag=0 windows include the current row, lag=1 windows stop at the previous one
+    if lag == 0:
+        sums, cnts, tails = fold(sums, cnts, tails)
+
+    out = {}
+    for window in windows:
+        recent = tails[:, :, :window]
+        full = (~np.isnan(recent)).sum(axis=2) == window
+        out[window] = np.where(full, recent.sum(axis=2) / window, np.nan)
+    expanding = np.full((m, k), np.nan)
+    np.divide(sums, cnts, out=expanding, where=cnts > 0)
+    out['std'] = expanding
+
+    if lag == 1:
+        sums, cnts, tails = fold(sums, cnts, tails)
+
+    updated = {'season': seasons.astype(float)}
+    for i, stat in enumerate(stats):
+        updated[f'{stat}__sum'] = sums[:, i]
+        updated[f'{stat}__cnt'] = cnts[:, i]
+        for j in range(tail):
+            updated[f'{stat}__t{j + 1}'] = tails[:, i, j]
+    updated = pd.DataFrame(updated, index=pd.Index(keys, name=acc.index.name))[acc.columns]
+    if acc.empty:
+        return out, updated
+    return out, pd.concat([acc[~acc.index.isin(keys)], updated])
+
+
+def advance_accumulator(state, name, rows, key, windows=(), lag=1):
+    """
+    Reads windowed means for `rows` from the named accumulator, then folds the rows in.
+    Rows are processed in order; repeated keys are folded one after another.
+    Returns {(stat, window): np.ndarray} aligned with rows, where window is an int or "std".
+    """
+    stats, tail, reset_season = ACCUMULATORS[name]
+    results = {(stat, window): np.full(len(rows), np.nan) for stat in stats for window in list(windows) + ['std']}
+    if rows.empty:
+        return results
+
+    keys = rows[key].to_numpy()
+    seasons = rows['season'].to_numpy(dtype=float)
+    values = rows[stats].to_numpy(dtype=float)
+    rank = rows.groupby(key, sort=False, observed=True).cumcount().to_numpy()
+
+    acc = state['accumulators'][name]
+    for r in range(rank.max() + 1):
+        idx = np.flatnonzero(rank == r)
+        out, acc = _advance_once(acc, keys[idx], seasons[idx], values[idx], stats, tail, reset_season, windows, lag)
+        for window, arr in out.items():
+            for i, stat in enumerate(stats):
+                results[(stat, window)][idx] = arr[:, i]
+    state['accumulators'][name] = acc
+    return results
+
+
+def _advance_week(state, week_df):
+    """
+    Computes the derived features for the rows of a single (season, week) and folds them into state.
+    """
+    df = week_df.reset_index(drop=True)
+    season = df["season"].iloc[0]
+    new = {}
+
+    # --- Team pass/rush rate and opportunity totals (lagged one team game) ---
+    team_weekly = (
+        df.groupby("team_abbreviation", observed=True)[["attempts", "carries", "targets"]]
+        .sum()
+        .reset_index()
+    )
+    team_weekly["season"] = season
+    team_weekly["pass_rate"] = team_weekly["attempts"] / (team_weekly["attempts"] + team_weekly["carries"])
+    team_weekly["team_total_opps"] = team_weekly["carries"] + team_weekly["targets"]
+    team = advance_accumulator(state, 'team_offense', team_weekly, "team_abbreviation", windows=(1,))
+    team_index = team_weekly["team_abbreviation"]
+    new["pass_rate_lag1"] = df["team_abbreviation"].map(pd.Series(team[("pass_rate", 1)], index=team_index)).to_numpy()
+    new["rush_rate_lag1"] = 1 - new["pass_rate_lag1"]
+    new["team_total_opps_lag1"] = df["team_abbreviation"].map(pd.Series(team[("team_total_opps", 1)], index=team_index)).to_numpy()
+
+    # --- Opportunity share (windows include the current, already lagged, share) ---
+    share_rows = df[["player_id", "season"]].assign(
+        opportunity_share_lag1=(df["carries"] + df["targets"]).to_numpy() / new["team_total_opps_lag1"]
+    )
+    share = advance_accumulator(state, 'opportunity_share', share_rows, "player_id", windows=(3, 5), lag=0)
+    new["opportunity_share_lag1"] = share_rows["opportunity_share_lag1"].to_numpy()
+    new["opportunity_share_3wk_avg"] = share[("opportunity_share_lag1", 3)]
+    new["opportunity_share_5wk_avg"] = share[("opportunity_share_lag1", 5)]
+    new["opportunity_share_std_avg"] = share[("opportunity_share_lag1", "std")]
+
+    career = advance_accumulator(state, 'career', df, "player_id")
+    new["career_avg_fantasy_points"] = career[("fantasy_points", "std")]
+
+    # --- Season-to-date and rolling player averages ---
+    player = advance_accumulator(state, 'player', df, "player_id", windows=(3, 5))
+    for stat in ROLLING_STATS:
+        new[f"std_{stat}"] = player[(stat, "std")]
+    for window in (3, 5):
+        for stat in ROLLING_STATS:
+            new[f"{stat}_{window}wk_avg"] = player[(stat, window)]
+
+    # --- Home/away splits, only filled on rows of the matching side ---
+    for side, flag in [('home', True), ('away', False)]:
+        side_idx = np.flatnonzero((df['home_game'] == flag).to_numpy())
+        split = advance_accumulator(state, f'player_{side}', df.iloc[side_idx], "player_id", windows=(3, 5))
+        for window in [3, 5, "std"]:
+            for stat in ROLLING_STATS:
+                col = np.full(len(df), np.nan)
+                col[side_idx] = split[(stat, window)]
+                name = f'{stat}_{side}_std_avg' if window == "std" else f'{stat}_{side}_avg_{window}wk'
+                new[name] = col
+
+    # --- Fantasy points allowed by the opponent, overall and by position ---
+    allowed = (
+        df.groupby("opponent_team", observed=True)["fantasy_points"]
+        .sum()
+        .reset_index()
+        .rename(columns={"opponent_team": "team_abbreviation", "fantasy_points": "fantasy_points_allowed"})
+    )
+    allowed["season"] = season
+    total = advance_accumulator(state, 'defense_total', allowed, "team_abbreviation")
+    allowed_avg = pd.Series(total[("fantasy_points_allowed", "std")], index=allowed["team_abbreviation"])
+    new["fantasy_points_allowed_avg"] = df["opponent_team"].map(allowed_avg).to_numpy()
+
+    pos_df = df[df["position"].isin(POSITIONS)]
+    by_pos = (
+        pos_df.groupby(["opponent_team", "position"], observed=True)["fantasy_points"]
+        .sum()
+        .unstack(fill_value=0)
+        .reindex(columns=POSITIONS, fill_value=0)
+    )
+    by_pos.columns = [f"fantasy_points_allowed_{pos}" for pos in POSITIONS]
+    by_pos = by_pos.rename_axis("team_abbreviation").reset_index()
+    by_pos["season"] = season
+    pos_windows = advance_accumulator(state, 'defense_by_position', by_pos, "team_abbreviation", windows=(3,))
+    for suffix, window in [("_avg", "std"), ("_3wk_avg", 3)]:
+        for pos in POSITIONS:
+            col = f"fantasy_points_allowed_{pos}"
+            lookup = pd.Series(pos_windows[(col, window)], index=by_pos["team_abbreviation"])
+            new[f"{col}{suffix}"] = df["opponent_team"].map(lookup).to_numpy()
+
+    state['watermark'] = (int(season), int(df["week"].iloc[0]))
+    df = df.drop(columns=list(new), errors='ignore')
+    return pd.concat([df, pd.DataFrame(new, index=df.index)], axis=1)
+
+
+def advance_feature_state(state, base_df):
+    """
+    Computes features for new base rows (weekly stats joined with weather) week by week,
+    folding each week into the running state. Returns the new feature rows.
+    """
+    weeks = base_df[["season", "week"]].drop_duplicates().sort_values(["season", "week"])
+
+    frames = []
+    for season, week in weeks.itertuples(index=False):
+        week_rows = base_df[(base_df["season"] == season) & (base_df["week"] == week)]
+        frames.append(_advance_week(state, week_rows))
+
+    if not frames:
+        return base_df.iloc[0:0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def week_fingerprints(stats_df):
+    """
+    {(season, week): hash of that week's weekly_stats rows}. Independent of row order and of the
+    compact dtypes the rows were loaded with, so a changed hash means the week's values changed.
+    """
+    frame = stats_df.drop_duplicates()
+    canonical = pd.DataFrame({
+        col: frame[col].astype('float64') if pd.api.types.is_numeric_dtype(frame[col]) else frame[col].astype(str)
+        for col in frame.columns
+    })
+    hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    fingerprints = {}
+    for (season, week), rows in frame.groupby(['season', 'week'], observed=True).indices.items():
+        fingerprints[(int(season), int(week))] = hashlib.sha256(np.sort(hashes[rows]).tobytes()).hexdigest()
+    return fingerprints
+
+
+def revised_weeks(state, stats_df):
+    """
+    Weeks through the state's watermark whose weekly_stats rows differ from the ones folded into
+    the state (stat corrections, late rows, deleted rows), in (season, week) order. A state saved
+    without fingerprints reports its whole history.
+    """
+    season, week = state['watermark']
+    through = (stats_df['season'] < season) | ((stats_df['season'] == season) & (stats_df['week'] <= week))
+    current = week_fingerprints(stats_df[through])
+    saved = state.get('week_fingerprints')
+    if saved is None:
+        return sorted(current) or [tuple(state['watermark'])]
+    return sorted(key for key in set(current) | set(saved) if current.get(key) != saved.get(key))
+
+
+def build_feature_state(base_df, columns, base_columns, fingerprints=None):
+    """
+    Replays the full base history to produce the running state used by incremental refreshes.
+    fingerprints are the week_fingerprints of the weekly_stats rows the history was built from.
+    """
+    print('Building incremental feature state...')
+    state = new_feature_state()
+    advance_feature_state(state, base_df.drop_duplicates())
+    state['columns'] = list(columns)
+    state['base_columns'] = list(base_columns)
+    state['week_fingerprints'] = dict(fingerprints or {})
+    return state
+
+
+def save_feature_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.to_pickle(state, path)
+    logging.info(f"Feature state saved at watermark {state['watermark']}.")
+
+
+def load_feature_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No feature state at {path}; run a full feature build first.")
+    return pd.read_pickle(path)
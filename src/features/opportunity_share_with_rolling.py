@@ -1,48 +1,28 @@
 import pandas as pd
+from src.features.rolling_features import compute_lagged_windows
+from src.features.team_week_features import build_team_week_cube, attach_team_week_features
 
-def generate_opportunity_share_features(features_df):
-    # Calculate team carries and targets per week
-    team_opps = (
-        features_df.groupby(["team_abbreviation", "season", "week"])[["carries", "targets"]]
-        .sum()
-        .rename(columns={"carries": "team_carries", "targets": "team_targets"})
-        .reset_index()
-    )
-    team_opps["team_total_opps"] = team_opps["team_carries"] + team_opps["team_targets"]
-
-    # Shift team_total_opps by 1 week so that current week value is never used
-    team_opps["team_total_opps_lag1"] = (
-        team_opps.sort_values(["team_abbreviation", "season", "week"])
-        .groupby(["team_abbreviation", "season"])["team_total_opps"]
-        .shift(1)
-    )
-
-    # Merge lagged team totals into player-level dataframe
-    features_df = features_df.merge(
-        team_opps[["team_abbreviation", "season", "week", "team_total_opps_lag1"]],
-        on=["team_abbreviation", "season", "week"],
-        how="left"
-    )
-
+def add_opportunity_share_features(features_df):
+    """
+    Adds opportunity share and its rolling averages. Requires team_total_opps_lag1 from the team-week cube.
+    """
     # Calculate opportunity share from lagged team totals (avoiding current week data)
     features_df["opportunity_share_lag1"] = (
         (features_df["carries"] + features_df["targets"]) / features_df["team_total_opps_lag1"]
     )
 
-    # Rolling averages (all based on lagged values)
-    features_df["opportunity_share_3wk_avg"] = (
-        features_df.groupby(["player_id", "season"])["opportunity_share_lag1"]
-        .transform(lambda x: x.rolling(window=3, min_periods=3).mean())
-    )
+    # Rolling averages (all based on lagged values, so windows include the current row)
+    windows = compute_lagged_windows(features_df, ["opportunity_share_lag1"], windows=(3, 5), lag=0)
+    features_df["opportunity_share_3wk_avg"] = windows[("opportunity_share_lag1", 3)]
+    features_df["opportunity_share_5wk_avg"] = windows[("opportunity_share_lag1", 5)]
+    features_df["opportunity_share_std_avg"] = windows[("opportunity_share_lag1", "std")]
 
-    features_df["opportunity_share_5wk_avg"] = (
-        features_df.groupby(["player_id", "season"])["opportunity_share_lag1"]
-        .transform(lambda x: x.rolling(window=5, min_periods=5).mean())
-    )
+    return features_df
 
-    features_df["opportunity_share_std_avg"] = (
-        features_df.groupby(["player_id", "season"])["opportunity_share_lag1"]
-        .transform(lambda x: x.expanding().mean())
-    )
+def generate_opportunity_share_features(features_df, cube=None):
+    # Lagged team carries + targets per week come from the shared team-week cube
+    if cube is None:
+        cube = build_team_week_cube(features_df)
 
-    return features_df
\ No newline at end of file
+    features_df = attach_team_week_features(features_df, cube, ["team_total_opps_lag1"])
+    return add_opportunity_share_features(features_df)
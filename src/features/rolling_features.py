@@ -1,31 +1,138 @@
+import numpy as np
 import pandas as pd
+from src.features.dtypes import compact_dtypes
+
+ROLLING_STATS = [
+    "fantasy_points", "targets", "carries",
+    "passing_yards", "rushing_yards", "receiving_yards",
+    "passing_tds", "rushing_tds", "receiving_tds"
+]
+
+
+def _group_starts(sorted_keys):
+    """
+    For key arrays that are already sorted, returns the position of the first row of each row's group.
+    """
+    n = len(sorted_keys[0])
+    new_group = np.zeros(n, dtype=bool)
+    new_group[:1] = True
+    for key in sorted_keys:
+        new_group[1:] |= key[1:] != key[:-1]
+    return np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+
+
+def _window_mean(csum, ccnt, lo, hi, ok, min_count=None):
+    """
+    Mean over sorted rows [lo, hi) from prefix sums, skipping NaNs like pandas does.
+    With min_count set, the window needs exactly that many non-null values (rolling with
+    min_periods == window); otherwise any non-null value is enough (expanding mean).
+    """
+    lo = np.where(ok, lo, 0)
+    total = csum[hi] - csum[lo]
+    count = ccnt[hi] - ccnt[lo]
+    if min_count is not None:
+        valid = ok[:, None] & (count == min_count)
+    else:
+        valid = ok[:, None] & (count > 0)
+    out = np.full(total.shape, np.nan)
+    np.divide(total, count, out=out, where=valid)
+    return out
+
+
+def compute_lagged_windows(df: pd.DataFrame, stats, windows=(3, 5), season_to_date=True, career_stats=(),
+                           key="player_id", lag=1, split=None) -> dict:
+    """
+    Computes lagged (excluding current week) rolling, season-to-date and career means in a single pass.
+    Rows are ordered by key, season, week once and every window is taken as a difference of
+    cumulative sums over the sorted arrays, so no per-group Python work is done.
+    With lag=0 the windows end at (and include) the current row instead.
+    split optionally labels each row (e.g. home_game); windows then only span earlier rows with the
+    same label, as if each label's rows were filtered out and computed on their own, and rows with a
+    missing label get NaN.
+    Returns {(stat, window): np.ndarray} of float32 aligned with the rows of df, where window is
+    an int, "std" (season-to-date) or "career". Sums are accumulated in float64.
+    """
+    n = len(df)
+    key_codes, _ = pd.factorize(df[key])
+    split_codes = np.zeros(n, dtype=np.int64) if split is None else pd.factorize(split)[0]
+    seasons = df["season"].to_numpy()
+    weeks = df["week"].to_numpy()
+    # Each split label's rows are contiguous within a key, so one sort serves every label
+    order = np.lexsort((weeks, seasons, split_codes, key_codes))
+
+    key_sorted = key_codes[order]
+    split_sorted = split_codes[order]
+    season_start = _group_starts([key_sorted, split_sorted, seasons[order]])
+    key_start = _group_starts([key_sorted, split_sorted])
+    # groupby drops rows with a missing key, so they never get a value
+    keyed = (key_sorted >= 0) & (split_sorted >= 0)
+
+    all_stats = list(dict.fromkeys(list(stats) + list(career_stats)))
+    values = df[all_stats].to_numpy(dtype=np.float64)[order]
+    present = ~np.isnan(values)
+    csum = np.zeros((n + 1, len(all_stats)))
+    ccnt = np.zeros((n + 1, len(all_stats)), dtype=np.int64)
+    np.cumsum(np.where(present, values, 0.0), axis=0, out=csum[1:])
+    np.cumsum(present, axis=0, out=ccnt[1:])
+
+    # windows cover sorted rows [lo, end), ending just before (lag=1) or at (lag=0) the current row
+    end = np.arange(n) + (1 - lag)
+    sorted_results = {}
+    for window in windows:
+        lo = end - window
+        sorted_results[window] = _window_mean(csum, ccnt, lo, end, keyed & (lo >= season_start), min_count=window)
+    if season_to_date:
+        sorted_results["std"] = _window_mean(csum, ccnt, season_start, end, keyed)
+    if career_stats:
+        sorted_results["career"] = _window_mean(csum, ccnt, key_start, end, keyed)
+
+    results = {}
+    for window, sorted_values in sorted_results.items():
+        window_stats = career_stats if window == "career" else stats
+        for stat in window_stats:
+            out = np.empty(n, dtype=np.float32)
+            out[order] = sorted_values[:, all_stats.index(stat)]
+            results[(stat, window)] = out
+    return results
+
+
+def add_rolling_window_features(df: pd.DataFrame, stats=ROLLING_STATS) -> pd.DataFrame:
+    """
+    Adds season-to-date, 3-week and 5-week rolling averages (excluding current week) in one pass.
+    Requires: player_id, season, week columns.
+    """
+    print('Adding season-to-date and rolling averages...')
+    df = compact_dtypes(df).sort_values(by=["player_id", "season", "week"]).drop_duplicates().reset_index(drop=True)
+
+    for col, values in rolling_window_columns(df, stats).items():
+        df[col] = values
+
+    return df
+
+
+def rolling_window_columns(df: pd.DataFrame, stats=ROLLING_STATS) -> dict:
+    """
+    Season-to-date, 3-week and 5-week lagged averages as {column name: values}, in feature column order.
+    """
+    windows = compute_lagged_windows(df, stats, windows=(3, 5), season_to_date=True)
+    columns = {f"std_{stat}": windows[(stat, "std")] for stat in stats}
+    for window in (3, 5):
+        for stat in stats:
+            columns[f"{stat}_{window}wk_avg"] = windows[(stat, window)]
+    return columns
+
 
 def add_season_to_date_aggregates(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adds season-to-date aggregates (excluding current week) for fantasy points, targets, and carries.
     """
     print('Adding season-to-date aggregates...')
+    df["week"] = df["week"].astype(int)
     df = df.sort_values(by=["player_id", "season", "week"])
-    
-    def compute_season_to_date(df: pd.DataFrame, col_name: str) -> pd.Series:
-        df["week"] = df["week"].astype(int)
-        df = df.sort_values(by=["player_id", "season", "week"])
-        result = (
-            df
-            .groupby(["player_id", "season"])[col_name]
-            .transform(lambda x: x.shift(1).expanding().mean())
-        )
-        return result
-
-    df["std_fantasy_points"] = compute_season_to_date(df, "fantasy_points")
-    df["std_targets"] = compute_season_to_date(df, "targets")
-    df["std_carries"] = compute_season_to_date(df, "carries")
-    df["std_passing_yards"] = compute_season_to_date(df, "passing_yards")
-    df["std_rushing_yards"] = compute_season_to_date(df, "rushing_yards")
-    df["std_receiving_yards"] = compute_season_to_date(df, "receiving_yards")
-    df["std_passing_tds"] = compute_season_to_date(df, "passing_tds")
-    df["std_rushing_tds"] = compute_season_to_date(df, "rushing_tds")
-    df["std_receiving_tds"] = compute_season_to_date(df, "receiving_tds")
+
+    windows = compute_lagged_windows(df, ROLLING_STATS, windows=(), season_to_date=True)
+    for stat in ROLLING_STATS:
+        df[f"std_{stat}"] = windows[(stat, "std")]
 
     df.drop_duplicates(inplace = True)
 
@@ -41,18 +148,9 @@ def add_3wk_rolling_averages(df: pd.DataFrame) -> pd.DataFrame:
     df["week"] = df["week"].astype(int)
     df = df.sort_values(by=["player_id", "season", "week"]).reset_index(drop=True)
 
-    cols = [
-        "fantasy_points", "targets", "carries",
-        "passing_yards", "rushing_yards", "receiving_yards",
-        "passing_tds", "rushing_tds", "receiving_tds"
-    ]
-
-    for col in cols:
-        rolling_col_name = f"{col}_3wk_avg"
-        df[rolling_col_name] = (
-            df.groupby(["player_id", "season"])[col]
-            .transform(lambda x: x.shift(1).rolling(window=3, min_periods=3).mean())
-        )
+    windows = compute_lagged_windows(df, ROLLING_STATS, windows=(3,), season_to_date=False)
+    for col in ROLLING_STATS:
+        df[f"{col}_3wk_avg"] = windows[(col, 3)]
 
     return df
 
@@ -64,21 +162,11 @@ def add_5wk_rolling_averages(df: pd.DataFrame) -> pd.DataFrame:
     """
     print('Adding 5-week rolling averages...')
 
-    df = df.copy()
     df["week"] = df["week"].astype(int)
     df = df.sort_values(by=["player_id", "season", "week"]).reset_index(drop=True)
 
-    cols = [
-        "fantasy_points", "targets", "carries",
-        "passing_yards", "rushing_yards", "receiving_yards",
-        "passing_tds", "rushing_tds", "receiving_tds"
-    ]
+    windows = compute_lagged_windows(df, ROLLING_STATS, windows=(5,), season_to_date=False)
+    for col in ROLLING_STATS:
+        df[f"{col}_5wk_avg"] = windows[(col, 5)]
 
-    for col in cols:
-        rolling_col_name = f"{col}_5wk_avg"
-        df[rolling_col_name] = (
-            df.groupby(["player_id", "season"])[col]
-            .transform(lambda x: x.shift(1).rolling(window=5, min_periods=5).mean())
-        )
-
-    return df
\ No newline at end of file
+    return df
@@ -1,41 +1,106 @@
-import os
 import logging
 import argparse
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-from src.features.rolling_features import add_season_to_date_aggregates, add_3wk_rolling_averages, add_5wk_rolling_averages
-from src.features.home_away_features import add_home_away_rolling_and_std_averages
-from src.features.base_features import generate_base_features
-from src.features.opponent_avg_fantasy_points import generate_opponent_avg_fantasy_points, generate_opponent_avg_fantasy_points_with_rolling
+from src.db_utils.storage import get_storage
+from src.features.base_features import load_feature_rows, load_weekly_stats
+from src.features.feature_dag import FEATURE_CACHE_DIR, base_families, family_outputs, run_feature_dag
+from src.features.duckdb_features import generate_features_duckdb
+from src.features.weather_features import generate_weather_features
 from src.features.split_features_by_position import split_features_by_position
+from src.features.dtypes import compact_dtypes, record_memory, print_memory_report
+from src.features.incremental_features import (
+    advance_feature_state, build_feature_state, load_feature_state, revised_weeks, save_feature_state, week_fingerprints
+)
 
-def main():
+# Drop features to resolve data leakage
+LEAKY_COLUMNS = ['attempts', 'completions', 'target_share', 'passing_yards', 'passing_tds', 'targets', 'receptions', 'carries',
+                'rushing_yards', 'rushing_tds', 'receiving_yards', 'receiving_tds']
+
+def refresh_features_incremental(storage):
+    """
+    Computes features only for weekly_stats rows newer than the saved state and appends them.
+    Returns False without writing anything when weeks the state already holds were revised since
+    (the in-season refresh upserts stat corrections for earlier weeks); those need a full rebuild.
+    """
+    state = load_feature_state()
+    print(f"Refreshing features after season {state['watermark'][0]}, week {state['watermark'][1]}...")
+
+    stats = load_weekly_stats(storage)
+    revised = revised_weeks(state, stats)
+    if revised:
+        print(f"weekly_stats changed in {len(revised)} processed weeks, from season {revised[0][0]}, week {revised[0][1]}.")
+        return False
+
+    season, week = state['watermark']
+    new_stats = stats[(stats['season'] > season) | ((stats['season'] == season) & (stats['week'] > week))]
+    if new_stats.empty:
+        print("No new weeks of weekly_stats to process.")
+        return True
+
+    base_df = generate_weather_features(new_stats.reset_index(drop=True), storage)
+    df = compact_dtypes(advance_feature_state(state, base_df))
+    state['week_fingerprints'].update(week_fingerprints(new_stats))
+
+    storage.bulk_load(df[state['base_columns']], 'player_weekly_features')
+
+    df = df[state['columns']]
+    storage.bulk_load(df, 'features')
+    storage.refresh_views()
+
+    split_features_by_position(df, mode='append')
+    save_feature_state(state)
+
+    print(f"Appended features for {len(df)} rows through season {state['watermark'][0]}, week {state['watermark'][1]}.")
+    return True
+
+def main(incremental=False, use_cache=True, feature_engine='pandas'):
     logging.info('Running feature engineering pipeline...')
-    load_dotenv()
-    DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(DATABASE_URL)
+    storage = get_storage()
+
+    if incremental:
+        if refresh_features_incremental(storage):
+            logging.info('Incremental feature refresh completed successfully.')
+            return
+        print("Rebuilding all features instead.")
+
+    # Fingerprints of the stats the features are built from, so an incremental refresh can tell
+    # whether weeks already processed were revised since
+    fingerprints = week_fingerprints(load_weekly_stats(storage))
+
+    if feature_engine == 'duckdb':
+        # Same columns computed as SQL window functions straight over the nflfastr parquet files
+        df = generate_features_duckdb(storage)
+    else:
+        # Every feature family runs from the feature DAG; unchanged families are read from the cache
+        df = run_feature_dag(load_feature_rows(storage), cache_dir=FEATURE_CACHE_DIR if use_cache else None)
+    record_memory('feature families', df)
 
-    # Generate features with helper functions
-    df = generate_base_features(engine)
-    df = add_season_to_date_aggregates(df)
-    df = add_3wk_rolling_averages(df)
-    df = add_5wk_rolling_averages(df)
-    df = add_home_away_rolling_and_std_averages(df)
-    df = generate_opponent_avg_fantasy_points(df)
-    df = generate_opponent_avg_fantasy_points_with_rolling(df)
+    row_columns = [col for col in df.columns if col not in set(family_outputs())]
+    base_df = df[row_columns + family_outputs(base_families())]
+    storage.bulk_load(base_df, 'player_weekly_features', if_exists='replace', partition_by='season')
+    logging.info("Base feature table created and stored.")
 
-    # Drop features to resolve data leakage
-    leaky_columns = ['attempts', 'completions', 'target_share', 'passing_yards', 'passing_tds', 'targets', 'receptions', 'carries',
-                    'rushing_yards', 'rushing_tds', 'receiving_yards', 'receiving_tds']
-    df = df.drop(columns = leaky_columns)
+    df = df.drop(columns = LEAKY_COLUMNS)
+    record_memory('final features', df)
 
-    df.to_csv('data/processed/features.csv', index=False)
-    df.to_sql('features', engine, if_exists='replace', index=False)
+    # Truncate rather than drop, so the position views and indexes built on features survive
+    storage.bulk_load(df, 'features', if_exists='truncate', partition_by='season')
+    storage.refresh_views()
 
-    qb_df, rb_df, wr_df, te_df = split_features_by_position(df, engine)
+    qb_df, rb_df, wr_df, te_df = split_features_by_position(df)
+
+    # Persist running state so later weeks can be appended with --incremental
+    save_feature_state(build_feature_state(base_df, df.columns, base_df.columns, fingerprints))
+
+    print_memory_report()
 
     print("Feature engineering completed successfully!")
     logging.info('Feature engineering pipeline completed successfully.')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run feature engineering pipeline.")
+    parser.add_argument("--incremental", action="store_true", help="Only compute and append features for new weeks of weekly_stats")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every feature family instead of reading cached outputs")
+    parser.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas", help="Feature engine used for a full rebuild")
+    args = parser.parse_args()
+
+    main(incremental=args.incremental, use_cache=not args.no_cache, feature_engine=args.engine)
@@ -0,0 +1,87 @@
+from src.features.rolling_features import compute_lagged_windows
+from src.features.dtypes import compact_dtypes
+
+POSITIONS = ["QB", "RB", "WR", "TE"]
+MATCHUP_KEYS = ["team_abbreviation", "opponent_team", "season", "week"]
+
+OFFENSE_FEATURES = ["pass_rate_lag1", "rush_rate_lag1", "team_total_opps_lag1"]
+DEFENSE_FEATURES = (
+    ["fantasy_points_allowed_avg"]
+    + [f"fantasy_points_allowed_{pos}_avg" for pos in POSITIONS]
+    + [f"fantasy_points_allowed_{pos}_3wk_avg" for pos in POSITIONS]
+)
+
+
+def _team_offense_weekly(df):
+    team_weekly = (
+        df.groupby(["team_abbreviation", "season", "week"], observed=True)[["attempts", "carries", "targets"]]
+        .sum()
+        .reset_index()
+    )
+    team_weekly["pass_rate"] = team_weekly["attempts"] / (team_weekly["attempts"] + team_weekly["carries"])
+    team_weekly["rush_rate"] = 1 - team_weekly["pass_rate"]
+    team_weekly["team_total_opps"] = team_weekly["carries"] + team_weekly["targets"]
+
+    # Shift by 1 team game per team/season so the current week is never used
+    lags = compute_lagged_windows(team_weekly, ["pass_rate", "team_total_opps"], windows=(1,),
+                                  season_to_date=False, key="team_abbreviation")
+    team_weekly["pass_rate_lag1"] = lags[("pass_rate", 1)]
+    team_weekly["rush_rate_lag1"] = 1 - team_weekly["pass_rate_lag1"]
+    team_weekly["team_total_opps_lag1"] = lags[("team_total_opps", 1)]
+    return team_weekly
+
+
+def _defense_allowed_weekly(df):
+    # The opponent is the defense, so points are summed by opponent_team
+    allowed = (
+        df.groupby(["opponent_team", "season", "week"], observed=True)["fantasy_points"]
+        .sum()
+        .reset_index()
+        .rename(columns={"opponent_team": "team_abbreviation", "fantasy_points": "fantasy_points_allowed"})
+    )
+    avg = compute_lagged_windows(allowed, ["fantasy_points_allowed"], windows=(), key="team_abbreviation")
+    allowed["fantasy_points_allowed_avg"] = avg[("fantasy_points_allowed", "std")]
+
+    pos_df = df[df["position"].isin(POSITIONS)]
+    by_pos = pos_df.pivot_table(
+        index=["opponent_team", "season", "week"],
+        columns="position",
+        values="fantasy_points",
+        aggfunc="sum",
+        fill_value=0,
+        observed=True
+    ).reindex(columns=POSITIONS, fill_value=0)
+    by_pos.columns = [f"fantasy_points_allowed_{pos}" for pos in POSITIONS]
+    by_pos = by_pos.rename_axis(index={"opponent_team": "team_abbreviation"}).reset_index()
+
+    pos_cols = [f"fantasy_points_allowed_{pos}" for pos in POSITIONS]
+    windows = compute_lagged_windows(by_pos, pos_cols, windows=(3,), key="team_abbreviation")
+    for col in pos_cols:
+        by_pos[f"{col}_avg"] = windows[(col, "std")]
+        by_pos[f"{col}_3wk_avg"] = windows[(col, 3)]
+
+    return allowed.merge(by_pos, how="left", on=["team_abbreviation", "season", "week"])
+
+
+def build_team_week_cube(df, offense=True, defense=True):
+    """
+    One row per (team, opponent, season, week) matchup holding the team's attempts, carries and targets,
+    the fantasy points its opponent's defense has allowed overall and by position, and the lagged and
+    rolling versions used as features. Player rows pick all of them up with a single merge.
+    offense/defense select which half of the cube to build.
+    """
+    print('Building team-week aggregate cube...')
+    cube = df[MATCHUP_KEYS].drop_duplicates()
+    if offense:
+        cube = cube.merge(_team_offense_weekly(df), how="left", on=["team_abbreviation", "season", "week"])
+    if defense:
+        allowed = _defense_allowed_weekly(df).rename(columns={"team_abbreviation": "opponent_team"})
+        cube = cube.merge(allowed, how="left", on=["opponent_team", "season", "week"])
+    return cube.reset_index(drop=True)
+
+
+def attach_team_week_features(df, cube, columns=OFFENSE_FEATURES + DEFENSE_FEATURES):
+    """
+    Merges the selected cube feature columns onto the player frame.
+    """
+    return compact_dtypes(df.merge(cube[MATCHUP_KEYS + list(columns)], how="left", on=MATCHUP_KEYS))
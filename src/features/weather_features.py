@@ -1,40 +1,50 @@
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
+from src.features.dtypes import compact_dtypes
 
-def generate_weather_features(weekly_stats_features, engine):
-    games_df = pd.read_sql('SELECT * FROM games', engine)
-    weather_df = pd.read_sql('SELECT * FROM weather', engine)
+TEAM_GAME_KEYS = ['season', 'week', 'team_abbreviation']
+WEATHER_COLUMNS = ['temperature', 'precipitation', 'wind_speed', 'dome']
 
-    player_games = weekly_stats_features.merge(
-        games_df,
-        how = 'left',
-        on = ['season', 'week']
-    )
+def build_team_game_index(games_df, weather_df):
+    """
+    One row per (season, week, team) carrying the opponent, stadium, home flag and game weather,
+    so player rows can be joined to their game with a single keyed lookup.
+    """
+    games = games_df[['season', 'week', 'home_team', 'away_team', 'stadium']].drop_duplicates()
 
-    # Filter rows where team_abbreviation matches either home or away team
-    player_games = player_games[
-        (player_games['team_abbreviation'] == player_games['home_team']) |
-        (player_games['team_abbreviation'] == player_games['away_team'])
-    ]
+    home = games.rename(columns={'home_team': 'team_abbreviation', 'away_team': 'opponent'}).assign(home_game=True)
+    away = games.rename(columns={'away_team': 'team_abbreviation', 'home_team': 'opponent'}).assign(home_game=False)
+    team_games = pd.concat([home, away], ignore_index=True).drop_duplicates(subset=TEAM_GAME_KEYS)
 
-    player_games_with_weather = player_games.merge(
-        weather_df,
-        how = 'left',
-        on = ['season', 'week', 'stadium']
-    )
+    weather = weather_df[['season', 'week', 'stadium'] + WEATHER_COLUMNS].drop_duplicates(subset=['season', 'week', 'stadium'])
+    team_games = team_games.merge(weather, how='left', on=['season', 'week', 'stadium'])
+
+    return team_games.reset_index(drop=True)
 
-    player_games_with_weather['home_game'] = (
-        player_games_with_weather['team_abbreviation'] == player_games_with_weather['home_team']
+def load_team_game_index(storage):
+    games_df = storage.read_sql('SELECT season, week, home_team, away_team, stadium FROM games')
+    weather_df = storage.read_sql('SELECT season, week, stadium, temperature, precipitation, wind_speed, dome FROM weather')
+    return build_team_game_index(games_df, weather_df)
+
+def join_team_games(weekly_stats_features, storage):
+    team_games = load_team_game_index(storage)
+
+    # Inner join keeps only player rows whose team has a scheduled game that week
+    final_df = weekly_stats_features.merge(
+        team_games[TEAM_GAME_KEYS + ['stadium'] + WEATHER_COLUMNS + ['home_game']],
+        how = 'inner',
+        on = TEAM_GAME_KEYS
     )
 
-    final_df = player_games_with_weather[
-        weekly_stats_features.columns.tolist() + ['stadium', 'temperature', 'precipitation', 'wind_speed', 'dome', 'home_game']
-    ].drop_duplicates().reset_index(drop = True)
+    # The join key comes back as object, so restore the compact dtypes
+    return compact_dtypes(final_df)
+
+def generate_weather_features(weekly_stats_features, storage):
+    return add_weather_flags(join_team_games(weekly_stats_features, storage))
 
-    final_df["cold_game"] = final_df["temperature"] < 32
-    final_df["windy_game"] = final_df["wind_speed"] > 20
-    final_df["rain_game"] = final_df["precipitation"] > 0.3
-    final_df["extreme_weather"] = final_df[["cold_game", "windy_game", "rain_game"]].any(axis=1)
+def add_weather_flags(df):
+    df["cold_game"] = df["temperature"] < 32
+    df["windy_game"] = df["wind_speed"] > 20
+    df["rain_game"] = df["precipitation"] > 0.3
+    df["extreme_weather"] = df[["cold_game", "windy_game", "rain_game"]].any(axis=1)
 
-    return final_df
\ No newline at end of file
+    return df
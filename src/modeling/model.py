@@ -1,15 +1,14 @@
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from xgboost import XGBRegressor
 import joblib
 import argparse
-from dotenv import load_dotenv
 import os
 from datetime import datetime
 from skopt import BayesSearchCV
 from skopt.space import Real, Integer
+from src.features.feature_store import read_features, read_manifest
 pd.set_option('mode.chained_assignment', None)
 
 
@@ -19,6 +18,8 @@ def set_config(position):
     TABLE_NAME = f"{POSITION}_features"
     TARGET = "fantasy_points"
     EXCLUDE_COLS = ["player_id", "player_name", "season", "week", "player_display_name", "position", "team_abbreviation", TARGET]
+    # Opportunity share and its windows include the week's own carries and targets, unknown before kickoff
+    EXCLUDE_COLS += ["opportunity_share_lag1", "opportunity_share_3wk_avg", "opportunity_share_5wk_avg", "opportunity_share_std_avg"]
 
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     MODEL_DIR = os.path.join(BASE_DIR, "models")
@@ -26,13 +27,19 @@ def set_config(position):
     return POSITION, MODEL_DIR, TABLE_NAME, TARGET, EXCLUDE_COLS, LOG_DIR
 
 
-def load_data(TABLE_NAME):
-    print('Loading data from database...')
-    load_dotenv()
-    DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(DATABASE_URL)
-
-    df = pd.read_sql(f"SELECT * FROM {TABLE_NAME}", engine)
+def load_data(POSITION, season=None, week=None, EXCLUDE_COLS=None, TARGET=None):
+    """
+    Loads the position's features through (season, week) with only the columns the model uses:
+    the features, the target and the season/week split keys. Later weeks are filtered out during
+    the scan, so an early-season run never materializes the future history.
+    """
+    print('Loading data from feature store...')
+    columns = None
+    if EXCLUDE_COLS is not None:
+        keep = {'season', 'week', TARGET}
+        columns = [col for col in read_manifest()['columns'] if col not in EXCLUDE_COLS or col in keep]
+    through = (season, week) if season is not None else None
+    df = read_features(position=POSITION, columns=columns, through=through)
     return df
 
 
@@ -56,7 +63,8 @@ def get_features(df, train_df, test_df, EXCLUDE_COLS, TARGET):
     cat_cols = train_df.select_dtypes(include=["object", "category"]).columns
     for col in cat_cols:
         train_df[col] = train_df[col].astype("category")
-        test_df[col] = test_df[col].astype("category")
+        # Test labels take the training categories so their codes match the ones the model learned
+        test_df[col] = test_df[col].astype(train_df[col].dtype)
 
     # Detect boolean-like columns (0/1 or True/False)
     bool_cols = [col for col in train_df.columns 
@@ -224,7 +232,7 @@ def save_model(model, MODEL_DIR, POSITION, filename=None):
 
 def model(season, week, position):
     POSITION, MODEL_DIR, TABLE_NAME, TARGET, EXCLUDE_COLS, LOG_DIR = set_config(position)
-    df = load_data(TABLE_NAME)
+    df = load_data(POSITION, season, week, EXCLUDE_COLS, TARGET)
     train_df, test_df = train_test_split_for_week(df, season=season, week=week)
     features, X_train, y_train, X_test, y_test = get_features(df, train_df, test_df, EXCLUDE_COLS, TARGET)
     model, best_params = train_model(train_df, features, TARGET)
@@ -233,6 +241,8 @@ def model(season, week, position):
 
     if save_model_flag:
         print("Saving model...")
+        # Serving casts the slate to these, so categorical codes match training
+        model.feature_dtypes_ = X_train.dtypes.to_dict()
         save_model(model, MODEL_DIR, POSITION, f"{POSITION}_model_season{season}_week{week}.pkl")
     else:
         print("Model not saved since it did not improve over the best existing model.")
@@ -0,0 +1,130 @@
+import copy
+import logging
+import numpy as np
+import pandas as pd
+from src.features.feature_store import FEATURE_STORE_DIR, read_features, read_manifest
+from src.features.incremental_features import STATE_PATH, advance_feature_state, load_feature_state
+from src.features.weather_features import TEAM_GAME_KEYS, WEATHER_COLUMNS, add_weather_flags, load_team_game_index
+from src.features.base_features import WEEKLY_STATS_COLUMNS
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE']
+IDENTITY_COLUMNS = ['player_name', 'player_display_name', 'position', 'team_abbreviation']
+
+# (season, week) -> feature frame indexed by player_id, kept warm for repeated lookups
+week_cache = {}
+# seasons whose stored weeks have been loaded into week_cache
+loaded_seasons = set()
+# weeks in week_cache that were projected from the incremental state rather than read from the store
+projected_weeks = set()
+# last known identity row per player, used to project features for unplayed weeks
+identity_cache = {}
+# state_path -> incremental feature state loaded from disk
+state_cache = {}
+
+
+def clear_cache():
+    week_cache.clear()
+    loaded_seasons.clear()
+    projected_weeks.clear()
+    identity_cache.clear()
+    state_cache.clear()
+
+
+def _state(state_path):
+    if state_path not in state_cache:
+        state_cache[state_path] = load_feature_state(state_path)
+    return state_cache[state_path]
+
+
+def _index_by_player(frame):
+    frame = frame.set_index('player_id')
+    return frame[~frame.index.duplicated(keep='last')]
+
+
+def warm_cache(season, store_dir=FEATURE_STORE_DIR):
+    """
+    Loads every stored week of a season into the in-memory index with one store read.
+    """
+    if season in loaded_seasons:
+        return
+    season_df = read_features(seasons=int(season), store_dir=store_dir)
+    season_df = season_df[season_df['position'].isin(POSITIONS)]
+    for week, week_df in season_df.groupby('week'):
+        week_cache[(int(season), int(week))] = _index_by_player(week_df)
+    loaded_seasons.add(season)
+    logging.info(f"Feature cache warmed for season {season} ({len(season_df)} rows).")
+
+
+def _latest_identities(player_ids, season, store_dir):
+    # Team and position as of each player's most recent stored week
+    missing = [pid for pid in player_ids if pid not in identity_cache]
+    if missing:
+        history = read_features(columns=['player_id', 'season', 'week'] + IDENTITY_COLUMNS,
+                                seasons=(None, int(season)), store_dir=store_dir)
+        history = history[history['player_id'].isin(missing)].sort_values(['season', 'week'])
+        latest = history.drop_duplicates('player_id', keep='last').set_index('player_id')
+        for pid, row in latest[IDENTITY_COLUMNS].iterrows():
+            identity_cache[pid] = row
+    found = [pid for pid in player_ids if pid in identity_cache]
+    return pd.DataFrame([identity_cache[pid] for pid in found], index=pd.Index(found, name='player_id'))
+
+
+def project_week(player_ids, season, week, storage=None, store_dir=FEATURE_STORE_DIR, state_path=STATE_PATH):
+    """
+    Features for a week that has not been played yet. The players' stat lines are unknown, so the
+    incremental state (everything through its watermark) is advanced on a copy with empty stats.
+    Lagged features read prior weeks, so they are what a model sees before kickoff. The opportunity
+    share family is the exception: its windows include the week's own carries and targets, so it is
+    NaN here, and the models exclude it from training and serving.
+    """
+    state = copy.deepcopy(_state(state_path))
+    identities = _latest_identities(list(player_ids), season, store_dir).reset_index()
+
+    stub = identities.assign(season=int(season), week=int(week))
+    for col in WEEKLY_STATS_COLUMNS:
+        if col not in stub.columns:
+            stub[col] = np.nan
+
+    if storage is not None:
+        team_games = load_team_game_index(storage).rename(columns={'opponent': 'opponent_team'})
+        stub = stub.drop(columns=['opponent_team']).merge(
+            team_games[TEAM_GAME_KEYS + ['opponent_team', 'stadium'] + WEATHER_COLUMNS + ['home_game']],
+            how='left',
+            on=TEAM_GAME_KEYS
+        )
+    else:
+        for col in ['stadium'] + WEATHER_COLUMNS + ['home_game']:
+            stub[col] = np.nan
+    stub = add_weather_flags(stub)
+
+    projected = advance_feature_state(state, stub)
+    return _index_by_player(projected[[c for c in state['columns'] if c in projected.columns]])
+
+
+def get_features(player_ids, season, week, storage=None, store_dir=FEATURE_STORE_DIR, state_path=STATE_PATH):
+    """
+    Point-in-time feature vectors for the given players in (season, week), one row per requested
+    player in request order (all-NaN when a player has no features for that week).
+    Played weeks come from the feature store; weeks past the state watermark are projected from
+    the incremental state. Backtests and weekly serving share this lookup.
+    """
+    season, week = int(season), int(week)
+    key = (season, week)
+    if key not in week_cache:
+        warm_cache(season, store_dir)
+
+    if key in projected_weeks or key not in week_cache:
+        cached = week_cache.get(key)
+        missing = list(pd.Index(player_ids).difference(cached.index)) if cached is not None else list(player_ids)
+        watermark = _state(state_path)['watermark']
+        if missing and watermark is not None and key > tuple(watermark):
+            # Re-project together with players already cached; players without any history stay
+            # as all-NaN rows so they are not projected again
+            slate = missing if cached is None else list(cached.index) + missing
+            week_cache[key] = project_week(slate, season, week, storage, store_dir, state_path).reindex(slate)
+            projected_weeks.add(key)
+        elif cached is None:
+            # A played week without stored rows (e.g. a bye for everyone requested)
+            week_cache[key] = pd.DataFrame(columns=read_manifest(store_dir)['columns']).set_index('player_id')
+
+    return week_cache[key].reindex(player_ids)
@@ -0,0 +1,80 @@
+import os
+import re
+import glob
+import argparse
+import datetime
+import joblib
+import pandas as pd
+from src.db_utils.storage import get_storage
+from src.modeling.model import set_config
+from src.features.feature_store import read_features
+from src.weekly_predictions.feature_service import get_features
+from src.weekly_predictions.utils import detect_upcoming_week
+
+PREDICTIONS_DIR = 'data/processed/predictions'
+
+def latest_model_path(MODEL_DIR, POSITION):
+    # Models are saved as {position}_model_season{season}_week{week}.pkl
+    best = None
+    for path in glob.glob(os.path.join(MODEL_DIR, f"{POSITION}_model_season*_week*.pkl")):
+        match = re.search(r"season(\d+)_week(\d+)\.pkl$", path)
+        if match and (best is None or (int(match[1]), int(match[2])) > best[0]):
+            best = ((int(match[1]), int(match[2])), path)
+    return best[1] if best else None
+
+def load_slate(season, position):
+    # Players who have appeared at the position this season, falling back to last season in week 1
+    for slate_season in (season, season - 1):
+        players = read_features(position=position, columns=['player_id'], seasons=slate_season)
+        if not players.empty:
+            return players['player_id'].drop_duplicates().tolist()
+    return []
+
+def predict_position(season, week, position, storage):
+    POSITION, MODEL_DIR, TABLE_NAME, TARGET, EXCLUDE_COLS, LOG_DIR = set_config(position)
+    model_path = latest_model_path(MODEL_DIR, POSITION)
+    if model_path is None:
+        print(f"No trained {POSITION} model found in {MODEL_DIR}; skipping.")
+        return None
+
+    slate = get_features(load_slate(season, POSITION), season, week, storage=storage).reset_index()
+    slate = slate[slate['position'].notna()]
+
+    model = joblib.load(model_path)
+    feature_dtypes = getattr(model, 'feature_dtypes_', None)
+    if feature_dtypes is None:
+        print(f"{model_path} was saved without its training dtypes; retrain the {POSITION} model.")
+        return None
+
+    # Cast to the training dtypes so categorical codes and boolean flags match what the model was fit on
+    features = model.get_booster().feature_names
+    X_slate = slate[features].astype({col: feature_dtypes[col] for col in features})
+    slate['projected_points'] = model.predict(X_slate)
+    return slate[['player_id', 'player_display_name', 'position', 'team_abbreviation', 'opponent_team', 'projected_points']]
+
+def run_weekly_predictions(season, week=None):
+    storage = get_storage()
+
+    if week is None:
+        week = detect_upcoming_week(storage)
+    print(f"Generating predictions for season {season}, week {week}...")
+
+    predictions = [predict_position(season, week, position, storage) for position in ['qb', 'rb', 'wr', 'te']]
+    predictions = [p for p in predictions if p is not None]
+    if not predictions:
+        print("No predictions generated.")
+        return None
+
+    predictions_df = pd.concat(predictions, ignore_index=True).sort_values('projected_points', ascending=False)
+    os.makedirs(PREDICTIONS_DIR, exist_ok=True)
+    predictions_df.to_csv(os.path.join(PREDICTIONS_DIR, f"season{season}_week{week}.csv"), index=False)
+    print(predictions_df.groupby('position').head(10).to_string(index=False))
+    return predictions_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate fantasy point predictions for a given season/week.")
+    parser.add_argument("--season", type=int, default=datetime.datetime.now().year, help="Season year, e.g., 2025")
+    parser.add_argument("--week", type=int, required=False, help="Week number; defaults to the upcoming week")
+
+    args = parser.parse_args()
+    run_weekly_predictions(args.season, args.week)
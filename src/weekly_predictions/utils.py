@@ -1,16 +1,12 @@
 import pandas as pd
-import os
-from dotenv import load_dotenv
 from datetime import datetime, timezone
-from sqlalchemy import create_engine
+from src.db_utils.storage import get_storage
 
-def detect_upcoming_week():
-    load_dotenv()
-    DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    engine = create_engine(DATABASE_URL)    
+def detect_upcoming_week(storage=None):
+    storage = storage or get_storage()
 
     today = datetime.now(timezone.utc)
-    games = pd.read_sql('SELECT * FROM games', engine)
+    games = storage.read_sql('SELECT * FROM games')
     games["game_date"] = pd.to_datetime(games["game_date"], utc=True)
 
     upcoming_games = games[games["game_date"] >= today]
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.db_utils import storage as storage_module
+from src.db_utils.storage import DuckDBStorage
+from src.features import run_feature_engineering
+from src.features.base_features import WEEKLY_STATS_COLUMNS
+from src.features.incremental_features import load_feature_state
+
+TEAMS = ['AAA', 'BBB', 'CCC', 'DDD']
+POSITIONS = ['QB', 'RB', 'WR', 'TE']
+WEEKS = 8
+
+
+def synthetic_weekly_stats(season=2024, weeks=WEEKS):
+    rng = np.random.default_rng(7)
+    rows = []
+    for week in range(1, weeks + 1):
+        # Teams rotate opponents every week
+        pairs = [(TEAMS[0], TEAMS[1 + (week % 3)])] + [tuple(t for t in TEAMS[1:] if t != TEAMS[1 + (week % 3)])]
+        for home, away in pairs:
+            for team, opponent in [(home, away), (away, home)]:
+                for slot, position in enumerate(POSITIONS * 2):
+                    player_id = TEAMS.index(team) * 100 + slot
+                    rows.append({
+                        'player_id': player_id, 'player_name': f'P.{team}{slot}', 'player_display_name': f'Player {team}{slot}',
+                        'position': position, 'team_abbreviation': team, 'season': season, 'opponent_team': opponent,
+                        'week': week, 'attempts': int(rng.integers(0, 40)) if position == 'QB' else 0,
+                        'completions': int(rng.integers(0, 25)) if position == 'QB' else 0,
+                        'passing_yards': float(rng.integers(0, 350)) if position == 'QB' else 0.0,
+                        'passing_tds': int(rng.integers(0, 4)) if position == 'QB' else 0,
+                        'targets': int(rng.integers(0, 12)), 'receptions': int(rng.integers(0, 8)),
+                        'carries': int(rng.integers(0, 20)), 'rushing_yards': float(rng.integers(0, 120)),
+                        'rushing_tds': int(rng.integers(0, 2)), 'receiving_yards': float(rng.integers(0, 130)),
+                        'receiving_tds': int(rng.integers(0, 2)), 'target_share': float(rng.random() / 3),
+                        'fantasy_points': float(np.round(rng.random() * 30, 2)),
+                    })
+    return pd.DataFrame(rows)[WEEKLY_STATS_COLUMNS]
+
+
+def schedule(stats):
+    games = stats[['season', 'week', 'team_abbreviation', 'opponent_team']].drop_duplicates()
+    games = games[games['team_abbreviation'] < games['opponent_team']]
+    games = games.rename(columns={'team_abbreviation': 'home_team', 'opponent_team': 'away_team'})
+    games['stadium'] = games['home_team'] + ' Stadium'
+    games['game_id'] = range(len(games))
+    weather = games[['season', 'week', 'stadium']].assign(temperature=40.0, precipitation=0.0, wind_speed=10.0, dome=False)
+    return games, weather
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    # Feature store, cache and state paths are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    backend = DuckDBStorage(str(tmp_path / 'warehouse.duckdb'))
+    monkeypatch.setattr(storage_module, '_storage', backend)
+    stats = synthetic_weekly_stats()
+    games, weather = schedule(stats)
+    backend.bulk_load(games, 'games', if_exists='replace')
+    backend.bulk_load(weather, 'weather', if_exists='replace')
+    return backend, stats
+
+
+def read_features(backend):
+    features = backend.read_table('features')
+    return features.sort_values(['player_id', 'season', 'week']).reset_index(drop=True)
+
+
+def assert_same_features(actual, expected):
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    for col in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[col]):
+            # Features are stored as float32, so allow for its rounding
+            np.testing.assert_allclose(actual[col].to_numpy(float), expected[col].to_numpy(float),
+                                       rtol=1e-5, equal_nan=True, err_msg=col)
+        else:
+            assert (actual[col].astype(str) == expected[col].astype(str)).all(), col
+
+
+def full_rebuild(backend):
+    run_feature_engineering.main(use_cache=False)
+    return read_features(backend)
+
+
+def test_incremental_refresh_matches_full_rebuild(storage):
+    backend, stats = storage
+    backend.bulk_load(stats[stats['week'] <= 5], 'weekly_stats', if_exists='replace')
+    run_feature_engineering.main(use_cache=False)
+
+    backend.bulk_load(stats[stats['week'] > 5], 'weekly_stats')
+    assert run_feature_engineering.refresh_features_incremental(backend)
+    assert tuple(load_feature_state()['watermark']) == (2024, WEEKS)
+    incremental = read_features(backend)
+
+    assert_same_features(incremental, full_rebuild(backend))
+
+
+def test_revised_processed_week_falls_back_to_full_rebuild(storage):
+    backend, stats = storage
+    backend.bulk_load(stats[stats['week'] <= 5], 'weekly_stats', if_exists='replace')
+    run_feature_engineering.main(use_cache=False)
+
+    # A stat correction for week 2 arrives together with week 6
+    revised = stats[stats['week'] <= 6].copy()
+    revised.loc[(revised['week'] == 2) & (revised['player_id'] == 0), 'fantasy_points'] += 10
+    backend.upsert(revised, 'weekly_stats', keys=['player_id', 'season', 'week'])
+
+    assert not run_feature_engineering.refresh_features_incremental(backend)
+    run_feature_engineering.main(incremental=True, use_cache=False)
+    refreshed = read_features(backend)
+    assert tuple(load_feature_state()['watermark']) == (2024, 6)
+    assert refreshed.loc[(refreshed['player_id'] == 0) & (refreshed['week'] == 3), 'career_avg_fantasy_points'].notna().all()
+
+    assert_same_features(refreshed, full_rebuild(backend))
+    # Once rebuilt, the corrected history is the baseline again
+    assert run_feature_engineering.refresh_features_incremental(backend)